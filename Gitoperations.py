@@ -1,85 +1,168 @@
 import subprocess
 import json
 import os
+import time
+import shlex
+import asyncio
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Lock
 
+from git_sync import (STATUS_COMMAND, AsyncGitSync, parse_ls_remote, parse_status, read_gitmodules,
+                      resolve_submodule_url)
+from mirror_cache import MirrorCache, git_dir_of
+from sync_metrics import command_phase
+
 class GitRepositoryManager:
-    def __init__(self):
-        # Lock for repository and submodule operations
+    def __init__(self, metrics=None, mirror_cache=None, mirror_max_bytes=None, dissociate=False):
+        # Optional SyncMetrics that every git command and repository is recorded in
+        self.metrics = metrics
+        # Optional directory of bare mirrors that clones and submodules borrow objects from, as in AsyncGitSync
+        self.mirrors = MirrorCache(mirror_cache, mirror_max_bytes) if mirror_cache else None
+        self.dissociate = dissociate
+        # Lock for repository and submodule operations, and one guarding their creation
         self.repo_locks = {}
+        self.repo_locks_lock = Lock()
+        # Branch heads per remote, listed once per run
+        self.remote_heads = {}
 
     # Function to run shell commands with error handling
     def run_command(self, cmd, cwd=None):
+        start = time.monotonic()
         try:
             process = subprocess.run(cmd, shell=True, check=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self._record_command(cmd, cwd, start, process)
             return process.stdout.decode().strip()
         except subprocess.CalledProcessError as e:
+            self._record_command(cmd, cwd, start, e)
             print(f"Error executing command: {cmd}\nError: {e.stderr.decode().strip()}")
             return None
 
+    # Function to run a git command given as an argument list, for MirrorCache
+    def run_git(self, args, cwd=None):
+        return self.run_command(shlex.join(args), cwd=cwd)
+
+    # Function to get the clone options that borrow objects from a mirror
+    def reference_args(self, mirror):
+        return ['--reference', mirror] + (['--dissociate'] if self.dissociate else [])
+
+    # Function to record a command's span; the repository is the first component of its working directory
+    def _record_command(self, cmd, cwd, start, process):
+        if self.metrics is None:
+            return
+        path = os.path.normpath(cwd) if cwd else None
+        repository = path.split(os.sep)[0] if path else cmd.split()[-1].split('/')[-1].replace('.git', '')
+        self.metrics.record_command(
+            repository=repository, path=path, command=cmd,
+            phase=command_phase(cmd.split(), path is not None and path != repository), host=None,
+            status="ok" if process.returncode == 0 else "failed", exit_code=process.returncode, attempt=1,
+            backoff=0, duration=time.monotonic() - start, wait=0,
+            output_bytes=len(process.stdout or b"") + len(process.stderr or b""))
+
     # Function to check if a branch is already checked out
     def get_current_branch(self, repo_path):
         cmd = "git symbolic-ref --short HEAD"
         return self.run_command(cmd, cwd=repo_path)
 
-    # Function to check if there are any changes to pull
-    def is_up_to_date(self, repo_path, branch):
-        cmd = f"git fetch origin {branch} && git status"
-        output = self.run_command(cmd, cwd=repo_path)
-        return output and "Your branch is up to date" in output
+    # Function to get branch, HEAD, upstream and dirty state from a single git process
+    def probe_repository(self, repo_path):
+        output = self.run_command(" ".join(STATUS_COMMAND), cwd=repo_path)
+        return parse_status(output) if output is not None else None
+
+    # Function to list a remote's branch heads, once per remote however many repositories use it
+    def get_remote_heads(self, remote, cwd=None):
+        key = (remote, cwd) if remote == "origin" else remote
+        with self._get_repo_lock(f"ls-remote {key}"):
+            if key not in self.remote_heads:
+                output = self.run_command(f"git ls-remote --heads {remote}", cwd=cwd)
+                self.remote_heads[key] = parse_ls_remote(output) if output is not None else None
+            return self.remote_heads[key]
+
+    # Function to check if there are any changes to pull: the checked out commit is the remote's branch head
+    def is_up_to_date(self, repo_path, branch, remote="origin", state=None):
+        state = state or self.probe_repository(repo_path)
+        heads = self.get_remote_heads(remote, cwd=repo_path)
+        return bool(state and heads) and state.branch == branch and state.head == heads.get(branch)
 
     # Function to clone a repository if not already cloned
     def clone_repository(self, repo_url, repo_name):
         if not os.path.exists(repo_name):
             print(f"Cloning the repository: {repo_url}")
-            self.run_command(f"git clone {repo_url}")
+            mirror = self.mirrors.ensure_blocking(repo_url, self.run_git) if self.mirrors else None
+            if mirror is None:
+                self.run_command(f"git clone {repo_url}")
+                return
+            # Shared lock: the mirror cannot be evicted while the clone copies from it
+            with self.mirrors.lock(mirror):
+                if self.run_git(['git', 'clone', *self.reference_args(mirror), repo_url, repo_name]) is not None \
+                        and not self.dissociate:
+                    self.mirrors.add_user(mirror, git_dir_of(repo_name))
         else:
             print(f"Repository {repo_name} already exists. Skipping clone.")
 
     # Function to checkout and pull a branch only if necessary
-    def checkout_and_pull(self, repo_path, branch):
+    def checkout_and_pull(self, repo_path, branch, remote="origin"):
         with self._get_repo_lock(repo_path):
-            current_branch = self.get_current_branch(repo_path)
+            state = self.probe_repository(repo_path)
+            current_branch = state.branch if state else None
             if current_branch != branch:
                 print(f"Checking out branch {branch} in {repo_path} (currently on {current_branch})")
                 self.run_command(f"git checkout {branch}", cwd=repo_path)
+                state = None
 
-            if not self.is_up_to_date(repo_path, branch):
+            if not self.is_up_to_date(repo_path, branch, remote, state):
                 print(f"Pulling latest changes for branch {branch} in {repo_path}")
                 self.run_command(f"git pull origin {branch}", cwd=repo_path)
             else:
                 print(f"Branch {branch} in {repo_path} is up to date. Skipping pull.")
 
-    # Function to initialize submodules if necessary and update them
-    def update_submodule(self, submodule_path, branch):
+    # Function to initialize submodules if necessary and update them; with its remote URL, the
+    # remote's heads are listed once for every checkout of it
+    def update_submodule(self, submodule_path, branch, url=None):
         with self._get_repo_lock(submodule_path):
             print(f"Processing submodule {submodule_path} on branch {branch}")
-            current_branch = self.get_current_branch(submodule_path)
+            state = self.probe_repository(submodule_path)
+            current_branch = state.branch if state else None
 
             if current_branch != branch:
                 print(f"Checking out submodule branch {branch} (currently on {current_branch})")
                 self.run_command(f"git checkout {branch}", cwd=submodule_path)
+                state = None
 
-            if not self.is_up_to_date(submodule_path, branch):
+            if not self.is_up_to_date(submodule_path, branch, url or "origin", state):
                 print(f"Pulling latest changes for submodule {submodule_path}")
                 self.run_command(f"git pull origin {branch}", cwd=submodule_path)
             else:
                 print(f"Submodule {submodule_path} is up to date. Skipping pull.")
 
     # Function to initialize submodules only if they haven't been initialized
-    def initialize_submodules(self, repo_path):
+    def initialize_submodules(self, repo_path, repo_url=None):
         submodule_config = os.path.join(repo_path, '.gitmodules')
         if not os.path.exists(submodule_config):
             print(f"No submodules found in {repo_path}.")
             return False
 
         print(f"Initializing submodules for {repo_path}")
-        self.run_command("git submodule update --init --recursive --jobs 4", cwd=repo_path)
+        if self.mirrors is None or repo_url is None:
+            self.run_command("git submodule update --init --recursive --jobs 4", cwd=repo_path)
+            return True
+        # One 'submodule update' per missing submodule, each borrowing from the mirror of its own URL
+        for path, url in read_gitmodules(repo_path).items():
+            if os.path.exists(os.path.join(repo_path, path, '.git')):
+                continue
+            mirror = self.mirrors.ensure_blocking(resolve_submodule_url(repo_url, url), self.run_git) if url else None
+            command = ['git', 'submodule', 'update', '--init', '--recursive']
+            if mirror is None:
+                self.run_git(command + ['--', path], cwd=repo_path)
+                continue
+            with self.mirrors.lock(mirror):
+                if self.run_git(command + self.reference_args(mirror) + ['--', path], cwd=repo_path) is not None \
+                        and not self.dissociate:
+                    self.mirrors.add_user(mirror, git_dir_of(os.path.join(repo_path, path)))
         return True
 
     # Function to handle the repository cloning, branch checkout, and submodule updating
     def process_repository(self, repo):
+        start = time.monotonic()
         repo_url = repo['repo_url']
         branch = repo['branch']
         submodules = repo.get('submodules', [])
@@ -91,33 +174,51 @@ class GitRepositoryManager:
 
         # Checkout and pull the main repository
         print(f"Checking out and pulling the main repository {repo_name}")
-        self.checkout_and_pull(repo_name, branch)
+        self.checkout_and_pull(repo_name, branch, repo_url)
         
         # Initialize and process submodules if any
-        if submodules and self.initialize_submodules(repo_name):
+        if submodules and self.initialize_submodules(repo_name, repo_url):
             print(f"Processing submodules for {repo_name}...")
+            urls = read_gitmodules(repo_name)
             for submodule in submodules:
-                self.update_submodule(os.path.join(repo_name, submodule['path']), submodule['branch'])
+                url = urls.get(os.path.normpath(submodule['path']))
+                self.update_submodule(os.path.join(repo_name, submodule['path']), submodule['branch'],
+                                      resolve_submodule_url(repo_url, url) if url else None)
         else:
             print(f"No submodules to process for {repo_name} or they are already initialized.")
 
+        if self.metrics is not None:
+            self.metrics.record_repository(repo_name, time.monotonic() - start, "done")
+
     # Main function to read JSON and process all repositories concurrently
-    def process_all_repositories(self, json_file):
+    # mode="async" runs every git command as an asyncio subprocess (see AsyncGitSync for the options)
+    def process_all_repositories(self, json_file, mode="threads", **async_options):
         # Load JSON data from file
         with open(json_file) as f:
             data = json.load(f)
 
         repositories = data['repositories']
 
+        if mode == "async":
+            return asyncio.run(AsyncGitSync(**async_options).process_all(repositories))
+
         # Process each repository concurrently with a controlled number of threads
         with ThreadPoolExecutor(max_workers=4) as executor:
             futures = [executor.submit(self.process_repository, repo) for repo in repositories]
             for future in as_completed(futures):
                 future.result()  # Wait for each to complete
 
+        if self.mirrors is not None:
+            async def run_git(args, cwd=None, host=None):
+                return self.run_git(args, cwd)
+            asyncio.run(self.mirrors.collect_garbage(run_git))
+
+        if self.metrics is not None:
+            print(self.metrics.report())
+
     # Internal helper function to manage repository-specific locks
     def _get_repo_lock(self, repo_path):
-        with Lock():
+        with self.repo_locks_lock:
             if repo_path not in self.repo_locks:
                 self.repo_locks[repo_path] = Lock()
         return self.repo_locks[repo_path]
@@ -0,0 +1,315 @@
+import os
+from array import array
+from collections import deque
+from typing import Optional, Iterator
+
+from size_utils import convert_size_to_bytes, format_size
+
+
+FLAG_DIRECTORY = 1
+FLAG_HAS_NODE = 2  # directory has its own node in the JSON (not just a listing entry)
+
+# Array columns of a CompactTree, besides the name table, with their array typecodes
+COLUMNS = (('name_ids', 'i'), ('parents', 'i'), ('sizes', 'q'), ('flags', 'b'), ('first_child', 'i'),
+           ('child_count', 'i'))
+
+
+class NameTable:
+    """Interned names stored as one UTF-8 blob plus an offsets column, instead of one str object each."""
+
+    def __init__(self, blob=None, offsets=None):
+        self.blob = blob if blob is not None else bytearray()
+        self.offsets = offsets if offsets is not None else array('q', [0])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, name_id: int) -> str:
+        return str(self.blob[self.offsets[name_id]:self.offsets[name_id + 1]], 'utf-8', 'surrogateescape')
+
+    def append(self, name: str):
+        self.blob += name.encode('utf-8', 'surrogateescape')
+        self.offsets.append(len(self.blob))
+
+
+class SizeStringColumn:
+    """
+    Read-only {entry: size string} view for the size strings that format_size() cannot
+    reproduce (e.g. '4.0K'): one int32 id per entry (-1 for none) into a NameTable of the
+    distinct strings, instead of a dict entry and a str per entry. Pickles as copies of the
+    two columns, so views over an mmap can be sent to worker processes.
+    """
+
+    def __init__(self, ids, strings: NameTable):
+        self.ids = ids  # per entry: index into strings, or -1
+        self.strings = strings
+
+    def get(self, entry: int, default=None):
+        string_id = self.ids[entry]
+        return default if string_id < 0 else self.strings[string_id]
+
+    def items(self):
+        for entry, string_id in enumerate(self.ids):
+            if string_id >= 0:
+                yield entry, self.strings[string_id]
+
+    def __len__(self) -> int:
+        return sum(1 for string_id in self.ids if string_id >= 0)
+
+    def __reduce__(self):
+        strings = NameTable(bytearray(self.strings.blob), array('q', bytes(self.strings.offsets)))
+        return SizeStringColumn, (array('i', bytes(self.ids)), strings)
+
+
+class CompactTree:
+    """
+    Array-backed replacement for the nested path_tree.json dicts.
+
+    Entry 0 is the root node. Every other entry is one item of a parent's 'directories'
+    or 'files' listing. The children of a directory occupy a contiguous range of entries,
+    sub-directories first and then files, both in listing order. Names are interned in a
+    shared NameTable and sizes are stored once as int64 bytes.
+    """
+
+    def __init__(self, root_path: str, names, name_ids, parents, sizes, flags, first_child, child_count,
+                 path_overrides: Optional[dict] = None, raw_sizes: Optional[dict] = None):
+        self.root_path = root_path
+        self.names = names  # name table, indexed by name_ids
+        self.name_ids = name_ids
+        self.parents = parents
+        self.sizes = sizes
+        self.flags = flags
+        self.first_child = first_child
+        self.child_count = child_count
+        # Directory nodes whose absolute_path is not parent path + separator + name
+        self.path_overrides = path_overrides if path_overrides is not None else {}
+        # Size strings that format_size() would not reproduce exactly (e.g. '4.0K'); a SizeStringColumn
+        self.raw_sizes = raw_sizes if raw_sizes is not None else {}
+        self.separator = '\\' if '\\' in root_path and '/' not in root_path else os.sep
+        self._preorder = None
+
+    @classmethod
+    def from_json(cls, devices_node: dict) -> "CompactTree":
+        root_path = devices_node.get('absolute_path', '')
+        name_table = {}
+        names = NameTable()
+        name_ids = array('i')
+        parents = array('i')
+        sizes = array('q')
+        flags = array('b')
+        first_child = array('i')
+        child_count = array('i')
+        path_overrides = {}
+        raw_size_ids = array('i')
+        raw_strings = NameTable()
+        raw_string_table = {}
+        separator = '\\' if '\\' in root_path and '/' not in root_path else os.sep
+
+        def intern_name(name: str) -> int:
+            name_id = name_table.get(name)
+            if name_id is None:
+                name_id = name_table[name] = len(names)
+                names.append(name)
+            return name_id
+
+        def add_entry(name: str, parent: int, size, entry_flags: int) -> int:
+            entry = len(parents)
+            name_ids.append(intern_name(name))
+            parents.append(parent)
+            try:
+                size_bytes = convert_size_to_bytes(size)
+            except (ValueError, AttributeError):
+                size_bytes = -1
+            if size_bytes < 0 or format_size(size_bytes) != size:
+                raw = str(size)
+                string_id = raw_string_table.get(raw)
+                if string_id is None:
+                    string_id = raw_string_table[raw] = len(raw_strings)
+                    raw_strings.append(raw)
+                raw_size_ids.append(string_id)
+            else:
+                raw_size_ids.append(-1)
+            sizes.append(size_bytes)
+            flags.append(entry_flags)
+            first_child.append(0)
+            child_count.append(0)
+            return entry
+
+        add_entry(os.path.basename(root_path.replace('\\', '/')), -1, -1, FLAG_DIRECTORY | FLAG_HAS_NODE)
+        raw_size_ids[0] = -1
+
+        # Breadth-first, so each directory's children are appended as one contiguous block
+        queue = deque([(0, devices_node, root_path)])
+        while queue:
+            entry, node, node_path = queue.popleft()
+            directories = node.get('directories', [])
+            files = node.get('files', [])
+            first_child[entry] = len(parents)
+            child_count[entry] = len(directories) + len(files)
+            for dir_name, dir_size in directories:
+                dir_node = node.get(dir_name)
+                has_node = isinstance(dir_node, dict)
+                child = add_entry(dir_name, entry, dir_size, FLAG_DIRECTORY | (FLAG_HAS_NODE if has_node else 0))
+                if has_node:
+                    child_path = node_path + separator + dir_name
+                    actual_path = dir_node.get('absolute_path', child_path)
+                    if actual_path != child_path:
+                        path_overrides[child] = actual_path
+                    queue.append((child, dir_node, actual_path))
+            for file_name, file_size in files:
+                add_entry(file_name, entry, file_size, 0)
+
+        return cls(root_path, names, name_ids, parents, sizes, flags, first_child, child_count,
+                   path_overrides, SizeStringColumn(raw_size_ids, raw_strings))
+
+    def column_buffers(self) -> list:
+        """(key, typecode, buffer) for the name table and every array column, for copying elsewhere."""
+        buffers = [('name_blob', 'B', self.names.blob), ('name_offsets', 'q', self.names.offsets)]
+        buffers.extend((key, typecode, getattr(self, key)) for key, typecode in COLUMNS)
+        return buffers
+
+    @classmethod
+    def from_buffers(cls, root_path: str, buffers: dict, path_overrides: Optional[dict] = None,
+                     raw_sizes: Optional[dict] = None) -> "CompactTree":
+        """Wrap existing column buffers (e.g. memoryviews over shared memory) without copying them."""
+        names = NameTable(buffers['name_blob'], buffers['name_offsets'])
+        return cls(root_path, names, *(buffers[key] for key, _ in COLUMNS),
+                   path_overrides=path_overrides, raw_sizes=raw_sizes)
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def name(self, entry: int) -> str:
+        return self.names[self.name_ids[entry]]
+
+    def size_string(self, entry: int) -> str:
+        raw = self.raw_sizes.get(entry)
+        return raw if raw is not None else format_size(self.sizes[entry])
+
+    def is_directory(self, entry: int) -> bool:
+        return bool(self.flags[entry] & FLAG_DIRECTORY)
+
+    def has_node(self, entry: int) -> bool:
+        return bool(self.flags[entry] & FLAG_HAS_NODE)
+
+    def children(self, entry: int) -> range:
+        start = self.first_child[entry]
+        return range(start, start + self.child_count[entry])
+
+    def child_path(self, parent_path: str, child: int) -> str:
+        """absolute_path of a directory node, given its parent's absolute_path."""
+        override = self.path_overrides.get(child)
+        if override is not None:
+            return override
+        return parent_path + self.separator + self.name(child)
+
+    def node_path(self, entry: int) -> str:
+        chain = []
+        while entry > 0 and entry not in self.path_overrides:
+            chain.append(self.name(entry))
+            entry = self.parents[entry]
+        base = self.root_path if entry <= 0 else self.path_overrides[entry]
+        return self.separator.join([base] + chain[::-1])
+
+    def preorder(self) -> tuple:
+        """
+        (rank, subtree_end, depth) columns, computed once. rank is the position of an entry
+        in search order (a directory, then everything below it, then the next directory,
+        and a node's files last). The entries below directory d have ranks in
+        (rank[d], subtree_end[d]]. depth counts directory levels from the root node.
+        """
+        if self._preorder is not None:
+            return self._preorder
+        count = len(self)
+        rank = array('i', bytes(4 * count))
+        subtree_end = array('i', bytes(4 * count))
+        depth = array('i', bytes(4 * count))
+        next_rank = 1
+        stack = [(0, iter(self.children(0)))]
+        while stack:
+            entry, children = stack[-1]
+            for child in children:
+                rank[child] = subtree_end[child] = next_rank
+                depth[child] = depth[entry] + 1
+                next_rank += 1
+                if self.flags[child] & FLAG_HAS_NODE:
+                    stack.append((child, iter(self.children(child))))
+                    break
+            else:
+                stack.pop()
+                subtree_end[entry] = next_rank - 1
+        self._preorder = (rank, subtree_end, depth)
+        return self._preorder
+
+    def iter_entries(self, root: int, root_path: str, max_depth: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Yield (entry, node_path, depth) for every entry listed under root, in search order,
+        where node_path is the absolute_path of the node listing the entry. Uses an explicit
+        stack, so deep trees do not hit the recursion limit.
+        """
+        stack = [(root_path, 0, iter(self.children(root)))]
+        while stack:
+            node_path, depth, children = stack[-1]
+            for child in children:
+                yield child, node_path, depth
+                if self.flags[child] & FLAG_HAS_NODE and (max_depth is None or depth < max_depth):
+                    stack.append((self.child_path(node_path, child), depth + 1, iter(self.children(child))))
+                    break
+            else:
+                stack.pop()
+
+    def iter_nodes(self, entry: int = 0, path: Optional[str] = None) -> Iterator[tuple]:
+        """Yield (entry, absolute_path) for every directory node at or below entry."""
+        stack = [(entry, self.node_path(entry) if path is None else path)]
+        while stack:
+            entry, path = stack.pop()
+            yield entry, path
+            for child in reversed(self.children(entry)):
+                if self.flags[child] & FLAG_HAS_NODE:
+                    stack.append((child, self.child_path(path, child)))
+
+    def to_json(self) -> dict:
+        """The 'devices' node in the path_tree.json schema, the inverse of from_json()."""
+        root_node = {'absolute_path': self.root_path}
+        stack = [(0, root_node)]
+        while stack:
+            entry, node = stack.pop()
+            directories = []
+            files = []
+            child_nodes = []
+            for child in self.children(entry):
+                item = [self.name(child), self.size_string(child)]
+                if not self.flags[child] & FLAG_DIRECTORY:
+                    files.append(item)
+                    continue
+                directories.append(item)
+                if self.flags[child] & FLAG_HAS_NODE:
+                    child_node = {'absolute_path': self.child_path(node['absolute_path'], child)}
+                    child_nodes.append((item[0], child_node))
+                    stack.append((child, child_node))
+            node['directories'] = directories
+            node['files'] = files
+            for name, child_node in child_nodes:
+                node[name] = child_node
+        return root_node
+
+    def find(self, search_path: str) -> Optional[int]:
+        """Entry of the directory node whose absolute_path is search_path, or None."""
+        starts = [(0, self.root_path)] + [(entry, path) for entry, path in self.path_overrides.items()]
+        for entry, path in starts:
+            if search_path == path:
+                return entry
+            prefix = path if path.endswith(self.separator) else path + self.separator
+            if not search_path.startswith(prefix):
+                continue
+            for part in search_path[len(prefix):].split(self.separator):
+                entry = next((child for child in self.children(entry)
+                              if self.flags[child] & FLAG_HAS_NODE and self.name(child) == part), None)
+                if entry is None:
+                    break
+            if entry is not None and self.node_path(entry) == search_path:
+                return entry
+        for entry, path in self.iter_nodes():
+            if path == search_path:
+                return entry
+        return None
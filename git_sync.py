@@ -0,0 +1,705 @@
+import os
+import re
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import contextvars
+from typing import Optional
+from urllib.parse import urlsplit
+
+from mirror_cache import MirrorCache, git_dir_of
+from size_utils import convert_size_to_bytes
+from sync_metrics import SyncMetrics, command_phase
+from sync_state import SyncStateStore, is_in_sync
+
+
+# Failures of the repository being processed; each repository runs as its own task, so its own list
+_command_errors = contextvars.ContextVar('command_errors', default=None)
+# (repository, checkout path) that commands belong to, for the metrics spans
+_command_scope = contextvars.ContextVar('command_scope', default=(None, None))
+
+# One process for branch, HEAD, upstream and dirty state; untracked files are not scanned
+STATUS_COMMAND = ['git', 'status', '--porcelain=v2', '--branch', '--untracked-files=no']
+
+# Network failures worth retrying; git reports these with 'fatal:' just like permanent errors
+_TRANSIENT_ERROR = re.compile(
+    r'could not resolve host|unable to access|hung up|early eof|connection (?:reset|refused|timed out)'
+    r'|timed out|rpc failed|temporary failure|network is unreachable|broken pipe'
+    r'|ssh_exchange_identification|kex_exchange_identification|http 5\d\d', re.IGNORECASE)
+# ...unless git also names a cause that will not go away ("unable to access '...': ... returned error: 404")
+_PERMANENT_ERROR = re.compile(
+    r'authentication failed|repository not found|does not appear to be a git repository|unknown revision'
+    r"|couldn't find remote ref|returned error: 4\d\d|certificate|permission denied", re.IGNORECASE)
+_GITMODULES_SECTION = re.compile(r'^\s*\[submodule\s+"(.*)"\s*\]\s*$')
+_GITMODULES_VALUE = re.compile(r'^\s*(path|url)\s*=\s*(.*?)\s*$')
+
+
+def remote_host(url: str) -> str:
+    # 'https://host/x.git', 'ssh://user@host:22/x.git' and scp-like 'user@host:x.git' -> host; paths -> 'local'
+    if '://' in url:
+        parts = urlsplit(url)
+        if parts.scheme == 'file' or not parts.hostname:
+            return 'local'
+        return parts.hostname
+    head = url.split('/', 1)[0]
+    if ':' in head:
+        host = head.split(':', 1)[0].rsplit('@', 1)[-1]
+        if len(host) > 1:  # 'C:' is a drive letter, not a host
+            return host
+    return 'local'
+
+
+class RepositoryState:
+    # What 'git status --porcelain=v2 --branch' reports; branch is None on a detached HEAD
+    __slots__ = ('branch', 'head', 'upstream', 'ahead', 'behind', 'dirty')
+
+    def __init__(self, branch: Optional[str] = None, head: Optional[str] = None, upstream: Optional[str] = None,
+                 ahead: int = 0, behind: int = 0, dirty: bool = False):
+        self.branch = branch
+        self.head = head
+        self.upstream = upstream
+        self.ahead = ahead
+        self.behind = behind
+        self.dirty = dirty
+
+
+def is_transient_error(stderr: str) -> bool:
+    # Retry network errors only; anything else (bad ref, auth, missing repository, conflicts) fails the same again
+    return _TRANSIENT_ERROR.search(stderr) is not None and _PERMANENT_ERROR.search(stderr) is None
+
+
+def parse_status(output: str) -> RepositoryState:
+    state = RepositoryState()
+    for line in output.splitlines():
+        if line.startswith('# '):
+            key, _, value = line[2:].partition(' ')
+            if key == 'branch.oid':
+                state.head = None if value == '(initial)' else value
+            elif key == 'branch.head':
+                state.branch = None if value == '(detached)' else value
+            elif key == 'branch.upstream':
+                state.upstream = value
+            elif key == 'branch.ab':
+                ahead, behind = value.split()
+                state.ahead, state.behind = int(ahead), -int(behind)
+        elif line and line[0] in '12u':  # changed, renamed/copied or unmerged entries
+            state.dirty = True
+    return state
+
+
+def parse_ls_remote(output: str) -> dict:
+    # 'git ls-remote --heads' lines: '<sha>\trefs/heads/<branch>' -> {branch: sha}
+    heads = {}
+    for line in output.splitlines():
+        sha, _, ref = line.partition('\t')
+        if ref.startswith('refs/heads/'):
+            heads[ref[len('refs/heads/'):]] = sha
+    return heads
+
+
+def resolve_submodule_url(superproject_url: str, url: str) -> str:
+    # Relative submodule URLs ('../lib.git') are relative to the superproject's remote, as in git
+    if not url.startswith(('./', '../')):
+        return url
+    base = superproject_url.rstrip('/')
+    separator = '/'
+    for part in url.split('/'):
+        if part == '..':
+            cut = max(base.rfind('/'), base.rfind(':'))
+            if cut > 0:
+                separator = base[cut]  # keep 'host:' of scp-like URLs
+                base = base[:cut]
+        elif part and part != '.':
+            base = f"{base}{separator}{part}"
+            separator = '/'
+    return base
+
+
+def read_gitmodules(repo_path: str) -> dict:
+    # Submodule path -> URL from .gitmodules, read directly instead of through 'git config'
+    paths, urls = {}, {}
+    name = None
+    try:
+        with open(os.path.join(repo_path, '.gitmodules')) as f:
+            for line in f:
+                section = _GITMODULES_SECTION.match(line)
+                if section:
+                    name = section.group(1)
+                    continue
+                value = _GITMODULES_VALUE.match(line)
+                if value and name is not None:
+                    (paths if value.group(1) == 'path' else urls)[name] = value.group(2).strip('"')
+    except OSError:
+        return {}
+    return {os.path.normpath(path): urls.get(name) for name, path in paths.items()}
+
+
+def read_local_head(repo_path: str) -> Optional[tuple]:
+    """(branch, commit) of a checkout read from its .git files without running git; branch is None when detached."""
+    git_dir = git_dir_of(repo_path)
+    if git_dir is None:
+        return None
+    try:
+        with open(os.path.join(git_dir, 'HEAD')) as f:
+            head = f.read().strip()
+        if not head.startswith('ref: '):
+            return None, head
+        ref = head[len('ref: '):]
+        branch = ref[len('refs/heads/'):] if ref.startswith('refs/heads/') else None
+        ref_file = os.path.join(git_dir, ref)
+        if os.path.isfile(ref_file):
+            with open(ref_file) as f:
+                return branch, f.read().strip()
+        with open(os.path.join(git_dir, 'packed-refs')) as f:
+            for line in f:
+                sha, _, name = line.strip().partition(' ')
+                if name == ref:
+                    return branch, sha
+    except OSError:
+        pass
+    return None
+
+
+class JobQueue:
+    """
+    One bounded pool of worker tasks shared by every repository: jobs run in submission
+    order, at most `workers` at a time, instead of each repository starting its own. A job
+    whose submitter was cancelled before it started is dropped; one that is already running
+    is cancelled, which kills its git command. Every job's future ends with its result, its
+    exception or cancelled.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.queue = None
+        self.tasks = []
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    def submit(self, job) -> asyncio.Future:
+        """Queue job (a coroutine function) and return a future of its result."""
+        future = asyncio.get_running_loop().create_future()
+        # The job runs in a copy of the submitter's context, so its commands and failures still
+        # belong to the repository that submitted it
+        self.queue.put_nowait((job, future, contextvars.copy_context()))
+        return future
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, task: asyncio.Task):
+        if future.done():
+            return
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    async def _work(self):
+        while True:
+            job, future, context = await self.queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                task = context.run(asyncio.ensure_future, job())
+                # The submitter gave up (its repository was cancelled): stop the job and its git command
+                future.add_done_callback(lambda done, task=task: task.cancel() if done.cancelled() else None)
+                try:
+                    await asyncio.wait([task])
+                except BaseException:  # This worker is being cancelled: take the job down with it
+                    task.cancel()
+                    await asyncio.wait([task])
+                    self._resolve(future, task)
+                    raise
+                self._resolve(future, task)
+            finally:
+                self.queue.task_done()
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        while not self.queue.empty():  # never started
+            _, future, _ = self.queue.get_nowait()
+            future.cancel()
+
+class AsyncGitSync:
+    """
+    asyncio execution mode for GitRepositoryManager: the same clone, checkout, pull and
+    submodule steps, but every git command is an asyncio subprocess instead of a blocked
+    thread, so hundreds of fetches can be in flight at once.
+
+    Commands are limited globally (max_concurrency) and per remote host (per_host_limit);
+    local commands such as 'git status' only count against the global limit. Each command
+    has a timeout (per git subcommand through timeouts, else timeout) and is retried with
+    exponential backoff when it times out or fails with a network error (is_transient_error);
+    other failures are not retried. A command that times out or whose
+    task is cancelled is killed together with its helpers (ssh, git-remote-https).
+
+    A repository's state comes from one 'git status --porcelain=v2' and the remote's branch
+    heads from one 'git ls-remote' per remote URL for the whole run, shared by every
+    repository and submodule using that remote. Nothing is fetched or pulled when the
+    checked out branch already is at the remote head.
+
+    With a state_file, each repository's and submodule's outcome is recorded as soon as it
+    finishes (see SyncStateStore). A repository whose last sync succeeded, whose checkout is
+    still on that commit and whose remote heads have not moved since is skipped after the
+    ls-remote alone.
+
+    With a mirror_cache directory, clones and submodule checkouts borrow objects from a
+    local bare mirror of their remote (see MirrorCache), optionally with --dissociate so
+    they do not depend on the mirror afterwards; mirrors beyond mirror_max_bytes are
+    evicted at the end of the run.
+
+    Submodule checkouts and pulls from every repository go through one JobQueue of
+    submodule_jobs workers. When several checkouts need the same commit of the same remote
+    (a submodule shared by many superprojects), only the first pulls it from the remote;
+    the others pull it from that checkout locally.
+
+    With spans_file or report, every command attempt and every repository is recorded by
+    SyncMetrics, and report prints its summary at the end of the run.
+    """
+
+    def __init__(self, max_concurrency: int = 256, per_host_limit: int = 32, timeout: float = 120,
+                 retries: int = 3, timeouts: Optional[dict] = None, workdir: str = '.',
+                 state_file: Optional[str] = None, mirror_cache: Optional[str] = None,
+                 mirror_max_bytes: Optional[int] = None, dissociate: bool = False, submodule_jobs: int = 64,
+                 spans_file: Optional[str] = None, report: bool = False):
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.timeouts = timeouts or {}
+        self.workdir = workdir
+        self.state_file = state_file
+        self.state = None
+        self.mirror_cache = mirror_cache
+        self.mirror_max_bytes = mirror_max_bytes
+        self.dissociate = dissociate
+        self.mirrors = None
+        self.submodule_jobs = submodule_jobs
+        self.submodule_queue = None
+        self.spans_file = spans_file
+        self.report = report
+        self.metrics = None
+        self.fetched = {}  # (remote URL, commit) -> future of a checkout that has it, or None if fetching failed
+        # Never wait for credentials on a terminal nobody is watching
+        self.env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+        self.command_slots = None
+        self.host_slots = {}
+        self.repo_locks = {}
+        self.remote_heads_cache = {}
+        self.tasks = []
+
+    def _host_slots(self, host: str) -> asyncio.Semaphore:
+        if host not in self.host_slots:
+            self.host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        return self.host_slots[host]
+
+    def _repo_lock(self, repo_path: str) -> asyncio.Lock:
+        repo_path = os.path.normpath(repo_path)
+        if repo_path not in self.repo_locks:
+            self.repo_locks[repo_path] = asyncio.Lock()
+        return self.repo_locks[repo_path]
+
+    def _path(self, repo_path: str) -> str:
+        return os.path.join(self.workdir, repo_path)
+
+    @staticmethod
+    def _kill(process):
+        try:
+            if os.name == 'posix':
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+
+    async def _execute(self, args: list, cwd: Optional[str], timeout: float, span: Optional[dict] = None) -> tuple:
+        process = await asyncio.create_subprocess_exec(
+            *args, cwd=cwd, env=self.env, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            start_new_session=os.name == 'posix')
+        if span is not None:
+            span['started'] = time.monotonic()
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except BaseException:  # Timed out or cancelled: do not leave git running
+            if process.returncode is None:
+                self._kill(process)
+                await process.wait()
+            raise
+        if span is not None:
+            span['exit_code'] = process.returncode
+            span['output_bytes'] = len(stdout) + len(stderr)
+        return process.returncode, stdout.decode(errors='replace').strip(), stderr.decode(errors='replace').strip()
+
+    def _record_span(self, args: list, host: Optional[str], span: dict):
+        repository, path = _command_scope.get()
+        now = time.monotonic()
+        started = span['started'] or now
+        self.metrics.record_command(
+            repository=repository, path=path, command=' '.join(args),
+            phase=command_phase(args, path is not None and path != repository), host=host,
+            status=span['status'], exit_code=span['exit_code'], attempt=span['attempt'], backoff=span['backoff'],
+            duration=now - started, wait=started - span['queued'], output_bytes=span['output_bytes'])
+
+    async def run_command(self, args: list, cwd: Optional[str] = None, host: Optional[str] = None,
+                          timeout: Optional[float] = None, required: bool = True) -> Optional[str]:
+        """
+        Run a git command and return its stripped stdout, or None once it has failed for good
+        (as GitRepositoryManager.run_command does). host is set for commands that talk to a remote;
+        failures of commands that are not required do not mark the repository as failed.
+        """
+        cmd = ' '.join(args)
+        timeout = timeout or self.timeouts.get(args[1] if len(args) > 1 else '', self.timeout)
+        backoff = 1
+        slept = 0
+        for attempt in range(1, self.retries + 1):
+            span = {'attempt': attempt, 'backoff': slept, 'queued': time.monotonic(), 'started': None,
+                    'status': 'cancelled', 'exit_code': None, 'output_bytes': 0}
+            try:
+                if host is None:
+                    async with self.command_slots:
+                        returncode, stdout, stderr = await self._execute(args, cwd, timeout, span)
+                else:
+                    async with self._host_slots(host), self.command_slots:
+                        returncode, stdout, stderr = await self._execute(args, cwd, timeout, span)
+                if returncode == 0:
+                    span['status'] = 'ok'
+                    return stdout
+                span['status'] = 'failed'
+                error = stderr
+                fatal = not is_transient_error(stderr)
+            except asyncio.TimeoutError:
+                span['status'] = 'timeout'
+                error = f"timed out after {timeout}s"
+                fatal = False
+            except OSError as e:
+                span['status'] = 'error'
+                error = str(e)
+                fatal = True
+            finally:
+                if self.metrics is not None:
+                    self._record_span(args, host, span)
+            if fatal or attempt == self.retries:
+                print(f"Error executing command: {cmd}\nError: {error}")
+                errors = _command_errors.get()
+                if errors is not None and required:
+                    errors.append(f"{cmd}: {error}")
+                return None
+            await asyncio.sleep(backoff)
+            slept = backoff
+            backoff *= 2
+
+    async def probe(self, repo_path: str) -> Optional[RepositoryState]:
+        output = await self.run_command(STATUS_COMMAND, cwd=self._path(repo_path))
+        return parse_status(output) if output is not None else None
+
+    async def _ls_remote(self, remote: str, host: str, cwd: Optional[str]) -> Optional[dict]:
+        output = await self.run_command(['git', 'ls-remote', '--heads', remote], cwd=cwd, host=host)
+        return parse_ls_remote(output) if output is not None else None
+
+    async def remote_heads(self, remote: str, host: str, cwd: Optional[str] = None) -> Optional[dict]:
+        """Branch heads of a remote, listed once per run however many repositories use it."""
+        key = (remote, cwd) if remote == 'origin' else remote
+        future = self.remote_heads_cache.get(key)
+        if future is None:
+            future = self.remote_heads_cache[key] = asyncio.ensure_future(self._ls_remote(remote, host, cwd))
+        # Shielded: a cancelled repository must not cancel the listing other repositories wait for
+        return await asyncio.shield(future)
+
+    def _reference_args(self, mirror: str) -> list:
+        return ['--reference', mirror] + (['--dissociate'] if self.dissociate else [])
+
+    async def clone_repository(self, repo_url: str, repo_name: str, host: str):
+        if not os.path.exists(self._path(repo_name)):
+            print(f"Cloning the repository: {repo_url}")
+            mirror = await self.mirrors.ensure(repo_url, self.run_command, host) if self.mirrors else None
+            if mirror is None:
+                await self.run_command(['git', 'clone', repo_url, repo_name], cwd=self.workdir, host=host)
+                return
+            # Shared lock: the mirror cannot be evicted while the clone copies from it
+            async with self.mirrors.lock(mirror):
+                output = await self.run_command(['git', 'clone', *self._reference_args(mirror), repo_url, repo_name],
+                                                cwd=self.workdir, host=host)
+                if output is not None and not self.dissociate:
+                    self.mirrors.add_user(mirror, git_dir_of(self._path(repo_name)))
+        else:
+            print(f"Repository {repo_name} already exists. Skipping clone.")
+
+    async def checkout_and_pull(self, repo_path: str, branch: str, host: str, remote: Optional[str] = None,
+                                label: str = "branch") -> tuple:
+        """Returns the commit the branch ended on and the remote's head of it (None when unknown)."""
+        async with self._repo_lock(repo_path):
+            state, heads = await asyncio.gather(
+                self.probe(repo_path), self.remote_heads(remote or 'origin', host, self._path(repo_path)))
+            remote_head = heads.get(branch) if heads else None
+            current_branch = state.branch if state else None
+            if current_branch != branch:
+                print(f"Checking out {label} {branch} in {repo_path} (currently on {current_branch})")
+                await self.run_command(['git', 'checkout', branch], cwd=self._path(repo_path))
+                state = await self.probe(repo_path)
+
+            if state is None or remote_head is None or state.branch != branch or state.head != remote_head:
+                print(f"Pulling latest changes for {label} {branch} in {repo_path}")
+                if state is not None and state.dirty:
+                    print(f"Warning: {repo_path} has uncommitted changes")
+                pulled, claim = await self._pull_from_peer(repo_path, branch, remote, remote_head)
+                peer_path = None
+                try:
+                    if not pulled:
+                        await self.run_command(['git', 'pull', 'origin', branch], cwd=self._path(repo_path), host=host)
+                    state = await self.probe(repo_path)
+                    if state is not None and state.head == remote_head:
+                        peer_path = repo_path
+                finally:
+                    if claim is not None and not claim.done():
+                        claim.set_result(peer_path)
+            else:
+                print(f"{label.capitalize()} {branch} in {repo_path} is up to date. Skipping pull.")
+            return (state.head if state and state.branch == branch else None), remote_head
+
+    async def _pull_from_peer(self, repo_path: str, branch: str, remote: Optional[str],
+                              remote_head: Optional[str]) -> tuple:
+        """
+        Pull remote_head from a checkout that already fetched it from the same remote this run.
+        Returns (pulled, claim): claim is set when this checkout is the first to need the
+        commit; it must then fetch it from the remote and resolve the claim with its path.
+        """
+        if remote is None or remote_head is None:
+            return False, None
+        key = (remote, remote_head)
+        peer = self.fetched.get(key)
+        if peer is None:
+            self.fetched[key] = asyncio.get_running_loop().create_future()
+            return False, self.fetched[key]
+        peer_path = await asyncio.shield(peer)
+        if peer_path is None:
+            return False, None
+        cwd = self._path(repo_path)
+        print(f"Pulling {branch} into {repo_path} from {peer_path}, which already fetched {remote_head[:12]}")
+        # By commit, since the peer may have it under another branch name; a failure just falls back to the remote
+        if await self.run_command(['git', 'fetch', os.path.abspath(self._path(peer_path)), remote_head], cwd=cwd,
+                                  required=False) is None:
+            return False, None
+        if await self.run_command(['git', 'merge', remote_head], cwd=cwd) is None:
+            return False, None
+        # Keep origin/<branch> where a pull from origin would have left it
+        await self.run_command(['git', 'update-ref', f'refs/remotes/origin/{branch}', remote_head], cwd=cwd)
+        return True, None
+
+    async def initialize_submodules(self, repo_path: str, host: str, repo_url: Optional[str] = None) -> bool:
+        if not os.path.exists(os.path.join(self._path(repo_path), '.gitmodules')):
+            print(f"No submodules found in {repo_path}.")
+            return False
+        submodules = read_gitmodules(self._path(repo_path))
+        if all(os.path.exists(os.path.join(self._path(repo_path), path, '.git')) for path in submodules):
+            # Already checked out; each one is brought to its branch by update_submodule()
+            return True
+        print(f"Initializing submodules for {repo_path}")
+        if self.mirrors is None:
+            await self.run_command(['git', 'submodule', 'update', '--init', '--recursive', '--jobs', '4'],
+                                   cwd=self._path(repo_path), host=host)
+        else:
+            await self._initialize_from_mirrors(repo_path, repo_url, host, submodules)
+        return True
+
+    async def _initialize_from_mirrors(self, repo_path: str, repo_url: Optional[str], host: str, submodules: dict):
+        # One 'submodule update' per missing submodule, each borrowing from the mirror of its own URL
+        cwd = self._path(repo_path)
+        missing = [(path, resolve_submodule_url(repo_url, url) if url and repo_url else url)
+                   for path, url in submodules.items() if not os.path.exists(os.path.join(cwd, path, '.git'))]
+        mirrors = await asyncio.gather(*(self.mirrors.ensure(url, self.run_command, remote_host(url)) if url
+                                         else asyncio.sleep(0) for _, url in missing))
+        # In turn: 'submodule update --init' writes the superproject's config
+        for (path, url), mirror in zip(missing, mirrors):
+            command = ['git', 'submodule', 'update', '--init', '--recursive']
+            if mirror is None:
+                await self.run_command(command + ['--', path], cwd=cwd, host=host)
+                continue
+            async with self.mirrors.lock(mirror):
+                output = await self.run_command(command + self._reference_args(mirror) + ['--', path], cwd=cwd,
+                                                host=remote_host(url))
+                if output is not None and not self.dissociate:
+                    self.mirrors.add_user(mirror, git_dir_of(os.path.join(cwd, path)))
+
+    async def update_submodule(self, submodule_path: str, branch: str, url: Optional[str], host: str) -> dict:
+        job = lambda: self._update_submodule(submodule_path, branch, url, host)
+        if self.submodule_queue is None:
+            return await job()
+        return await self.submodule_queue.submit(job)
+
+    async def _update_submodule(self, submodule_path: str, branch: str, url: Optional[str], host: str) -> dict:
+        _command_scope.set((_command_scope.get()[0], submodule_path))
+        print(f"Processing submodule {submodule_path} on branch {branch}")
+        start = time.monotonic()
+        synced_sha, remote_sha = await self.checkout_and_pull(submodule_path, branch, remote_host(url) if url else host,
+                                                              url, label="submodule branch")
+        return {"path": submodule_path, "url": url, "branch": branch, "synced_sha": synced_sha,
+                "remote_sha": remote_sha, "duration": time.monotonic() - start,
+                "outcome": "ok" if synced_sha and synced_sha == remote_sha else "failed"}
+
+    async def _checkout_unchanged(self, path: str, url: Optional[str], branch: str, host: str) -> bool:
+        # The recorded sync is still what is checked out, and the remote head has not moved since
+        record = self.state.get(path)
+        if not url or not is_in_sync(record, url, branch):
+            return False
+        if read_local_head(self._path(path)) != (branch, record['synced_sha']):
+            return False
+        heads = await self.remote_heads(url, host)
+        return bool(heads) and heads.get(branch) == record['remote_sha']
+
+    async def is_unchanged(self, repo_name: str, repo_url: str, branch: str, host: str, submodules: list) -> bool:
+        if not await self._checkout_unchanged(repo_name, repo_url, branch, host):
+            return False
+        for submodule in submodules:
+            path = os.path.join(repo_name, submodule['path'])
+            record = self.state.get(path)
+            url = record['url'] if record else None
+            if not await self._checkout_unchanged(path, url, submodule['branch'], remote_host(url) if url else host):
+                return False
+        return True
+
+    @staticmethod
+    def _submodule_url(repo_url: str, url: Optional[str]) -> Optional[str]:
+        return resolve_submodule_url(repo_url, url) if url else None
+
+    async def process_repository(self, repo: dict) -> dict:
+        start = time.monotonic()
+        result = await self._process_repository(repo)
+        if self.metrics is not None:
+            self.metrics.record_repository(result["repository"], time.monotonic() - start, result["status"])
+        return result
+
+    async def _process_repository(self, repo: dict) -> dict:
+        repo_url = repo['repo_url']
+        branch = repo['branch']
+        submodules = repo.get('submodules', [])
+        repo_name = repo_url.split('/')[-1].replace('.git', '')
+        host = remote_host(repo_url)
+        errors = []
+        _command_errors.set(errors)
+        _command_scope.set((repo_name, repo_name))
+        start = time.monotonic()
+        try:
+            if self.state is not None and await self.is_unchanged(repo_name, repo_url, branch, host, submodules):
+                print(f"Repository {repo_name} has not changed since its last sync. Skipping.")
+                return {"repository": repo_name, "status": "skipped", "errors": errors}
+
+            await self.clone_repository(repo_url, repo_name, host)
+            print(f"Checking out and pulling the main repository {repo_name}")
+            synced_sha, remote_sha = await self.checkout_and_pull(repo_name, branch, host, repo_url)
+
+            submodule_records = []
+            if submodules and await self.initialize_submodules(repo_name, host, repo_url):
+                print(f"Processing submodules for {repo_name}...")
+                urls = read_gitmodules(self._path(repo_name))
+                submodule_records = await asyncio.gather(*(
+                    self.update_submodule(os.path.join(repo_name, submodule['path']), submodule['branch'],
+                                          self._submodule_url(repo_url, urls.get(os.path.normpath(submodule['path']))),
+                                          host)
+                    for submodule in submodules))
+            else:
+                print(f"No submodules to process for {repo_name} or they are already initialized.")
+        except asyncio.CancelledError:
+            return {"repository": repo_name, "status": "cancelled", "errors": errors}
+        except Exception as e:  # One broken entry must not stop the other repositories
+            errors.append(str(e))
+            synced_sha = remote_sha = None
+            submodule_records = []
+
+        if self.state is not None:
+            record = {"path": repo_name, "url": repo_url, "branch": branch, "synced_sha": synced_sha,
+                      "remote_sha": remote_sha, "duration": time.monotonic() - start,
+                      "outcome": "failed" if errors else "ok", "error": "\n".join(errors) or None}
+            self.state.record_many([record] + [dict(submodule, parent=repo_name) for submodule in submodule_records])
+        return {"repository": repo_name, "status": "failed" if errors else "ok", "errors": errors}
+
+    async def process_all(self, repositories: list) -> list:
+        """Process every repository concurrently; returns one result per repository, in input order."""
+        self.command_slots = asyncio.Semaphore(self.max_concurrency)
+        self.host_slots = {}
+        self.repo_locks = {}
+        self.remote_heads_cache = {}
+        self.state = SyncStateStore(self.state_file) if self.state_file else None
+        self.mirrors = MirrorCache(self.mirror_cache, self.mirror_max_bytes) if self.mirror_cache else None
+        self.fetched = {}
+        self.metrics = SyncMetrics(self.spans_file) if self.spans_file or self.report else None
+        self.submodule_queue = JobQueue(self.submodule_jobs)
+        self.submodule_queue.start()
+        self.tasks = [asyncio.ensure_future(self.process_repository(repo)) for repo in repositories]
+        try:
+            results = await asyncio.gather(*self.tasks)
+            if self.mirrors is not None:
+                await self.mirrors.collect_garbage(self.run_command)
+        finally:
+            self.tasks = []
+            await self.submodule_queue.close()
+            self.submodule_queue = None
+            if self.metrics is not None:
+                if self.report:
+                    print(self.metrics.report())
+                self.metrics.close()
+            if self.state is not None:
+                self.state.close()
+                self.state = None
+
+        failed = [result["repository"] for result in results if result["status"] not in ("ok", "skipped")]
+        skipped = sum(1 for result in results if result["status"] == "skipped")
+        print(f"Processed {len(results)} repositories, {skipped} unchanged, {len(failed)} failed or cancelled.")
+        if failed:
+            print(f"Failed to process the following repositories: {failed}")
+        return results
+
+    def cancel(self):
+        """Cancel repositories still in progress; their running git commands are killed."""
+        for task in self.tasks:
+            task.cancel()
+
+
+def load_repositories(json_file: str) -> list:
+    with open(json_file) as f:
+        return json.load(f)['repositories']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clone and update the repositories in a JSON file with asyncio.")
+    parser.add_argument("json_file", nargs='?', default='repositories.json')
+    parser.add_argument("--max-concurrency", type=int, default=256, help="git commands running at once")
+    parser.add_argument("--per-host", type=int, default=32, help="git commands running at once per remote host")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds before a git command is killed")
+    parser.add_argument("--clone-timeout", type=float, help="Separate timeout for git clone")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--state", default='sync_state.db', help="Sync state database ('' to disable)")
+    parser.add_argument("--mirror-cache", help="Directory of bare mirrors that clones borrow objects from")
+    parser.add_argument("--mirror-max-size", help="Evict least recently used mirrors beyond this size, e.g. 50GB")
+    parser.add_argument("--dissociate", action="store_true", help="Copy borrowed objects so clones do not need the mirror")
+    parser.add_argument("--spans", help="Append a JSON line per git command attempt and per repository to this file")
+    parser.add_argument("--report", action="store_true", help="Print timings per phase, retries and slowest repositories")
+    parser.add_argument("--submodule-jobs", type=int, default=64, help="Submodule updates running at once, all repositories together")
+    args = parser.parse_args()
+
+    timeouts = {'clone': args.clone_timeout} if args.clone_timeout else None
+    sync = AsyncGitSync(args.max_concurrency, args.per_host, args.timeout, args.retries, timeouts,
+                        state_file=args.state or None, mirror_cache=args.mirror_cache,
+                        mirror_max_bytes=convert_size_to_bytes(args.mirror_max_size) if args.mirror_max_size else None,
+                        dissociate=args.dissociate, submodule_jobs=args.submodule_jobs, spans_file=args.spans,
+                        report=args.report)
+    try:
+        results = asyncio.run(sync.process_all(load_repositories(args.json_file)))
+    except KeyboardInterrupt:
+        print("Cancelled.")
+        sys.exit(130)
+    if any(result["status"] not in ("ok", "skipped") for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
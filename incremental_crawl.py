@@ -0,0 +1,267 @@
+import os
+import sys
+import json
+import argparse
+from typing import Optional
+
+from path_tree_with_os import PathTreeCrawler, _Directory, save_path_tree
+from tree_index import tree_fingerprint
+
+
+CACHE_VERSION = 1
+
+
+def cache_path_for(json_file_path: str) -> str:
+    return json_file_path + ".dircache"
+
+
+class _CachedDirectory(_Directory):
+    __slots__ = ('previous', 'signature', 'files_total')
+
+    def __init__(self, node: dict, path: str, parent=None, index: int = -1, previous: Optional[dict] = None):
+        super().__init__(node, path, parent, index)
+        self.previous = previous  # node of the same directory in the previous tree, if it existed
+        self.signature = None
+        self.files_total = 0
+
+
+class IncrementalCrawler(PathTreeCrawler):
+    """
+    Re-crawls a tree against the previous tree.json and its sidecar cache of per-directory
+    (inode, mtime_ns, link count, file bytes, total bytes). A directory whose signature is
+    unchanged is not listed again: its file listing is copied from the previous tree and
+    only its sub-directories are visited. Changed and new directories are listed and diffed
+    against the previous listing. Directory sizes are re-aggregated bottom-up as usual, so
+    ancestors of a change get their new totals.
+
+    Creating, deleting or renaming an entry changes its directory's mtime; rewriting a file
+    in place does not, so those resizes are only noticed with check_files=True, which
+    re-stats the files of unchanged directories (still without listing them).
+    """
+
+    def __init__(self, previous_tree: Optional[dict] = None, cache: Optional[dict] = None, max_workers: int = 32,
+                 exact_sizes: bool = False, check_files: bool = False):
+        super().__init__(max_workers, exact_sizes)
+        self.previous_tree = previous_tree or {}
+        self.cache = cache or {}
+        self.check_files = check_files
+        self.new_cache = {}
+        self.changes = []
+        self.relisted = 0
+        self.reused = 0
+
+    def crawl(self, folder_path: str) -> dict:
+        self.new_cache = {}
+        self.changes = []
+        return super().crawl(folder_path)
+
+    def _root(self, folder_path: str, base_name: str) -> _Directory:
+        previous = self.previous_tree.get(base_name)
+        if not isinstance(previous, dict) or previous.get('absolute_path') != folder_path:
+            previous = None
+        root_node = {'absolute_path': folder_path, 'directories': [], 'files': []}
+        return _CachedDirectory(root_node, folder_path, previous=previous)
+
+    def _new_child(self, parent: _CachedDirectory, name: str, index: int) -> _Directory:
+        child = super()._new_child(parent, name, index)
+        previous = parent.previous.get(name) if parent.previous is not None else None
+        return _CachedDirectory(child.node, child.path, parent, index, previous if isinstance(previous, dict) else None)
+
+    def record(self, change: str, kind: str, path: str, size=None, old_size=None):
+        self.changes.append({"change": change, "kind": kind, "path": path, "size": size, "old_size": old_size})
+
+    def record_removed_subtree(self, node: dict):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for name, size in node.get('files', []):
+                self.record("removed", "file", os.path.join(node['absolute_path'], name), old_size=size)
+            for name, size in node.get('directories', []):
+                path = os.path.join(node['absolute_path'], name)
+                self.record("removed", "directory", path, old_size=size)
+                if isinstance(node.get(name), dict):
+                    stack.append(node[name])
+
+    def _list(self, directory: _CachedDirectory):
+        try:
+            stat = os.stat(directory.path, follow_symlinks=False)
+            directory.signature = [stat.st_ino, stat.st_mtime_ns, stat.st_nlink]
+        except OSError:
+            directory.signature = None
+        cached = self.cache.get(directory.path)
+        previous = directory.previous
+        if previous is not None and cached is not None and directory.signature is not None \
+                and cached[:3] == directory.signature and self._reuse(directory, cached):
+            self.reused += 1
+            names = [name for name, _ in previous.get('directories', [])]
+            self._expand(directory, names, directory.files_total)
+            return
+
+        self.relisted += 1
+        names, files_total = self._scan(directory)
+        directory.files_total = files_total
+        self._diff(directory, names)
+        self._expand(directory, names, files_total)
+
+    def _reuse(self, directory: _CachedDirectory, cached: list) -> bool:
+        # Copy the previous file listing; with check_files re-stat each file. False means list it after all.
+        previous_files = directory.previous.get('files', [])
+        if not self.check_files:
+            directory.node['files'] = [list(item) for item in previous_files]
+            directory.files_total = cached[3]
+            return True
+        files = []
+        files_total = 0
+        for name, old_size in previous_files:
+            path = os.path.join(directory.path, name)
+            try:
+                size = os.stat(path, follow_symlinks=False).st_size
+            except OSError:
+                return False
+            new_size = self.format_size(size)
+            if new_size != old_size:
+                self.record("resized", "file", path, new_size, old_size)
+            files.append([name, new_size])
+            files_total += size
+        directory.node['files'] = files
+        directory.files_total = files_total
+        return True
+
+    def _diff(self, directory: _CachedDirectory, names: list):
+        previous = directory.previous or {}
+        old_files = dict((name, size) for name, size in previous.get('files', []))
+        for name, size in directory.node['files']:
+            path = os.path.join(directory.path, name)
+            old_size = old_files.pop(name, None)
+            if old_size is None:
+                self.record("added", "file", path, size)
+            elif old_size != size:
+                self.record("resized", "file", path, size, old_size)
+        for name, old_size in old_files.items():
+            self.record("removed", "file", os.path.join(directory.path, name), old_size=old_size)
+
+        old_directories = dict((name, size) for name, size in previous.get('directories', []))
+        for name in set(old_directories) - set(names):
+            self.record("removed", "directory", os.path.join(directory.path, name), old_size=old_directories[name])
+            if isinstance(previous.get(name), dict):
+                self.record_removed_subtree(previous[name])
+
+    def _completed(self, directory: _CachedDirectory):
+        size = self.format_size(directory.total)
+        parent = directory.parent
+        if directory.previous is None:
+            if parent is not None:
+                self.record("added", "directory", directory.path, size)
+        else:
+            cached = self.cache.get(directory.path)
+            if cached is not None:
+                changed = cached[4] != directory.total
+                old_size = self.format_size(cached[4])
+            else:
+                # No cached total; fall back to the size string in the parent's previous listing
+                listing = dict(parent.previous.get('directories', [])) if parent is not None and parent.previous else {}
+                old_size = listing.get(os.path.basename(directory.path))
+                changed = old_size is not None and old_size != size
+            if changed:
+                self.record("resized", "directory", directory.path, size, old_size)
+        if directory.signature is not None:
+            self.new_cache[directory.path] = directory.signature + [directory.files_total, directory.total]
+
+
+def load_cache(cache_file: str, json_file_path: str, exact_sizes: bool = False) -> dict:
+    # The cache only describes the tree file it was written with, in the size format it was written
+    # with (reused listings keep their size strings); anything else means a full listing
+    try:
+        with open(cache_file, 'r') as file:
+            data = json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    try:
+        fingerprint = tree_fingerprint(json_file_path)
+    except OSError:
+        return {}
+    if data.get("version") != CACHE_VERSION or data.get("tree") != fingerprint \
+            or data.get("exact_sizes") != exact_sizes:
+        return {}
+    return data.get("directories", {})
+
+
+def save_cache(cache_file: str, json_file_path: str, directories: dict, exact_sizes: bool = False):
+    data = {"version": CACHE_VERSION, "tree": tree_fingerprint(json_file_path), "exact_sizes": exact_sizes,
+            "directories": directories}
+    temp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, 'w') as file:
+            json.dump(data, file)
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        print(f"Error saving directory cache to {cache_file}. Details: {e}")
+
+
+def save_changes(changes: list, changes_file: str) -> bool:
+    # One JSON object per line: change (added/removed/resized), kind, path, size, old_size
+    try:
+        with open(changes_file, 'w') as file:
+            for change in changes:
+                file.write(json.dumps(change) + "\n")
+        return True
+    except IOError as e:
+        print(f"Error saving change log to {changes_file}. Details: {e}")
+        return False
+
+
+def incremental_crawl(folder_path: str, json_file_path: str, changes_file: Optional[str] = None,
+                      cache_file: Optional[str] = None, max_workers: int = 32, exact_sizes: bool = False,
+                      check_files: bool = False) -> Optional[list]:
+    """
+    Update json_file_path in place from folder_path and write the change log. Without a
+    previous tree every entry is reported as added. Returns the changes, or None on failure.
+    """
+    cache_file = cache_file or cache_path_for(json_file_path)
+    changes_file = changes_file or os.path.splitext(json_file_path)[0] + ".changes.ndjson"
+    previous_tree = {}
+    cache = {}
+    if os.path.exists(json_file_path):
+        try:
+            with open(json_file_path, 'r') as file:
+                previous_tree = json.load(file)
+        except json.JSONDecodeError as e:
+            print(f"Error: Could not decode JSON. Details: {e}")
+        cache = load_cache(cache_file, json_file_path, exact_sizes)
+
+    crawler = IncrementalCrawler(previous_tree, cache, max_workers, exact_sizes, check_files)
+    tree = crawler.crawl(os.path.abspath(folder_path))
+    del previous_tree
+    changes = sorted(crawler.changes, key=lambda change: (change["path"], change["change"]))
+
+    if not save_path_tree(tree, json_file_path):
+        return None
+    save_cache(cache_file, json_file_path, crawler.new_cache, exact_sizes)
+    if not save_changes(changes, changes_file):
+        return None
+    print(f"Listed {crawler.relisted} directories, reused {crawler.reused}; {len(changes)} changes saved to {changes_file}")
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update a path tree JSON file, listing only changed directories.")
+    parser.add_argument("directory")
+    parser.add_argument("json_file", help="Tree to update; created on the first run")
+    parser.add_argument("--changes", help="Change log to write (default: <json_file>.changes.ndjson)")
+    parser.add_argument("--cache", help="Directory cache (default: <json_file>.dircache)")
+    parser.add_argument("--bytes", action="store_true", help="Exact sizes instead of rounded ones")
+    parser.add_argument("--check-files", action="store_true",
+                        help="Also re-stat files in unchanged directories to catch in-place rewrites")
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+    if not os.path.isdir(args.directory):
+        print(f"Error: {args.directory} is not a directory.")
+        sys.exit(1)
+    changes = incremental_crawl(args.directory, args.json_file, args.changes, args.cache, args.workers,
+                                args.bytes, args.check_files)
+    if changes is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
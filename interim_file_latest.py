@@ -1,7 +1,36 @@
 import re
 import os
 import json
-from typing import Optional
+from typing import Optional, List
+
+from compact_tree import CompactTree, FLAG_DIRECTORY
+from name_index import NameIndex
+from query_cache import QueryCache
+from result_writers import open_result_writer
+from parallel_search import parallel_search, size_in_range
+from pattern_matcher import PatternMatcher
+from size_index import SizeIndex
+from size_utils import convert_size_to_bytes
+from tree_index import PathIndex, load_or_build_path_index
+from tree_snapshot import is_snapshot, open_snapshot
+from tree_stream_loader import load_subtree
+
+
+def print_results(search_for: str, matching_files: list, matching_directories: list):
+    if search_for in ['directories', 'both'] and matching_directories:
+        print("Matching Directories:")
+        for dir_path, dir_size in matching_directories:
+            print(f"Directory: {dir_path}, Size: {dir_size}")
+
+    if search_for in ['files', 'both'] and matching_files:
+        print("\nMatching Files:")
+        for file_path, file_size in matching_files:
+            print(f"File: {file_path}, Size: {file_size}")
+
+    if not matching_files and search_for in ['files', 'both']:
+        print("No matching files found.")
+    if not matching_directories and search_for in ['directories', 'both']:
+        print("No matching directories found.")
 
 
 class TreeSearcher:
@@ -9,27 +38,84 @@ class TreeSearcher:
         self,
         json_file_path: str,
         search_path: str,
-        regex_pattern: str,
+        regex_pattern,
         search_for: str = "files",
         max_depth: Optional[int] = None,
         file_size_filter: Optional[int] = None,
-        flags: int = 0
+        flags: int = 0,
+        use_path_index: bool = True,
+        load_mode: str = "full",
+        representation: str = "dict",
+        use_name_index: bool = False,
+        min_size=None,
+        max_size=None,
+        cache: Optional[QueryCache] = None,
+        glob_patterns: Optional[List[str]] = None,
+        lazy_load: bool = False
     ):
         self.json_file_path = json_file_path
         self.search_path = search_path
-        self.regex_pattern = re.compile(regex_pattern, flags)
+        # One regex, or a PatternMatcher when several regexes (a list) and/or glob_patterns are given
+        self.regex_pattern = self.compile_pattern(regex_pattern, flags, glob_patterns)
         self.search_for = search_for
         self.max_depth = max_depth
         self.file_size_filter = file_size_filter
+        self.load_mode = load_mode  # 'full' parses the whole file, 'stream' builds only the search_path subtree
+        # A streamed load only holds one subtree, so it must not build or save a whole-tree path index
+        self.use_path_index = use_path_index and load_mode != "stream"
+        self.path_index: Optional[PathIndex] = None
+        self.representation = representation  # 'dict' keeps the parsed JSON, 'compact' converts it to a CompactTree
+        self.compact_tree: Optional[CompactTree] = None
+        self.use_name_index = use_name_index
+        self.name_index: Optional[NameIndex] = None
+        self._index_tree: Optional[CompactTree] = None  # CompactTree built for the indexes in dict mode
+        # Inclusive size range for files and directories, in bytes or as size strings like '1GB'
+        self.min_size = None if min_size is None else convert_size_to_bytes(min_size)
+        self.max_size = None if max_size is None else convert_size_to_bytes(max_size)
+        self.size_index: Optional[SizeIndex] = None
+        self.cache = cache
         self.matching_files = []
         self.matching_directories = []
+        self.json_data = None
+        self.loaded = False
+        # With lazy_load, or a result cache, the tree is only loaded once a query needs it
+        if cache is None and not lazy_load:
+            self.ensure_loaded()
+
+    @staticmethod
+    def compile_pattern(regex_pattern, flags: int = 0, glob_patterns: Optional[List[str]] = None):
+        if isinstance(regex_pattern, str) and not glob_patterns:
+            return re.compile(regex_pattern, flags)
+        regex_patterns = [regex_pattern] if isinstance(regex_pattern, str) else list(regex_pattern or [])
+        return PatternMatcher(regex_patterns, glob_patterns or [], flags)
+
+    def matched_patterns(self, name: str) -> List[str]:
+        # Which of the search patterns a matching name matched
+        if isinstance(self.regex_pattern, PatternMatcher):
+            return self.regex_pattern.matched_patterns(name)
+        return [self.regex_pattern.pattern] if self.regex_pattern.match(name) else []
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if is_snapshot(self.json_file_path):
+            # Binary snapshots are mapped rather than parsed, and always searched as a CompactTree
+            self.compact_tree = self.load_snapshot()
+            self.json_data = {"devices": None} if self.compact_tree is not None else None
+            return
         self.json_data = self.load_json()
+        if self.representation == "compact" and self.json_data and "devices" in self.json_data:
+            self.compact_tree = CompactTree.from_json(self.json_data["devices"])
+            self.json_data = {"devices": None}  # Release the dict tree; searches run on the arrays
 
     def load_json(self) -> Optional[dict]:
         print(f"Attempting to load JSON from: {self.json_file_path}")
         if not os.path.exists(self.json_file_path):
             print(f"Error: The file {self.json_file_path} does not exist.")
             return None
+        if self.load_mode == "stream":
+            return self.stream_json()
         try:
             with open(self.json_file_path, 'r') as file:
                 return json.load(file)
@@ -37,6 +123,26 @@ class TreeSearcher:
             print(f"Error: Could not decode JSON. Details: {e}")
             return None
 
+    def load_snapshot(self) -> Optional[CompactTree]:
+        print(f"Attempting to load snapshot from: {self.json_file_path}")
+        try:
+            return open_snapshot(self.json_file_path)
+        except (OSError, ValueError) as e:
+            print(f"Error: Could not open snapshot. Details: {e}")
+            return None
+
+    def stream_json(self) -> Optional[dict]:
+        # Only the subtree rooted at search_path is parsed; siblings are skipped unparsed
+        try:
+            subtree = load_subtree(self.json_file_path, self.search_path)
+        except ValueError as e:
+            print(f"Error: Could not decode JSON. Details: {e}")
+            return None
+        if subtree is None:
+            print(f"No matching node found for {self.search_path}")
+            return None
+        return {"devices": subtree}
+
     def validate_json_structure(self, node: dict) -> bool:
         required_keys = ['absolute_path', 'directories', 'files']
         for key in required_keys:
@@ -59,6 +165,16 @@ class TreeSearcher:
                     return result
         return None
 
+    def lookup_node(self, devices_node: dict, search_path: str) -> Optional[dict]:
+        # Constant-time lookup through the sidecar path index, DFS only as a fallback
+        if self.use_path_index:
+            if self.path_index is None:
+                self.path_index = load_or_build_path_index(self.json_file_path, devices_node)
+            node = self.path_index.find(devices_node, search_path)
+            if node is not None or search_path not in self.path_index.entries:
+                return node
+        return self.find_node_by_absolute_path(devices_node, search_path)
+
     def search_files_recursively(self, node: dict, current_depth: int = 0):
         if not node:
             return
@@ -84,6 +200,107 @@ class TreeSearcher:
                     absolute_file_path = os.path.join(node['absolute_path'], file_name)
                     self.matching_files.append((absolute_file_path, file_size))
 
+    def get_compact_tree(self) -> Optional[CompactTree]:
+        # The indexes work on CompactTree entries; in dict mode one is built next to the JSON once
+        self.ensure_loaded()
+        if self.compact_tree is not None:
+            return self.compact_tree
+        if self._index_tree is None and self.json_data and self.json_data.get("devices"):
+            self._index_tree = CompactTree.from_json(self.json_data["devices"])
+        return self._index_tree
+
+    def has_size_range(self) -> bool:
+        return self.min_size is not None or self.max_size is not None
+
+    def size_in_range(self, size_bytes: int) -> bool:
+        return size_in_range(size_bytes, self.min_size, self.max_size)
+
+    def get_size_index(self) -> Optional[SizeIndex]:
+        tree = self.get_compact_tree()
+        if self.size_index is None and tree is not None:
+            self.size_index = SizeIndex(tree)
+        return self.size_index
+
+    def index_candidates(self, tree: CompactTree, root: int, candidates) -> List[int]:
+        # Keep the candidates that are under root, within max_depth, of the wanted kind and
+        # matching both the regex and the size range; returned in search order
+        rank, subtree_end, depth = tree.preorder()
+        low, high, base_depth = rank[root], subtree_end[root], depth[root]
+        want_directories = self.search_for in ['directories', 'both']
+        want_files = self.search_for in ['files', 'both']
+        hits = []
+        for entry in candidates:
+            if not low < rank[entry] <= high:
+                continue
+            if self.max_depth is not None and depth[entry] - base_depth - 1 > self.max_depth:
+                continue
+            if not (want_directories if tree.flags[entry] & FLAG_DIRECTORY else want_files):
+                continue
+            if self.size_in_range(tree.sizes[entry]) and self.regex_pattern.match(tree.name(entry)):
+                hits.append((rank[entry], entry))
+        hits.sort()
+        return [entry for _, entry in hits]
+
+    def entry_match(self, tree: CompactTree, entry: int, node_paths: dict) -> tuple:
+        # (absolute_path, size, kind) for an entry, caching parent node paths in node_paths
+        parent = tree.parents[entry]
+        if parent not in node_paths:
+            node_paths[parent] = tree.node_path(parent)
+        kind = 'directory' if tree.flags[entry] & FLAG_DIRECTORY else 'file'
+        return os.path.join(node_paths[parent], tree.name(entry)), tree.size_string(entry), kind
+
+    def search_with_indexes(self) -> bool:
+        # Narrow the candidates through the name and/or size indexes and run the full checks
+        # only on those. Returns False when no index can help, so the caller falls back to a scan.
+        tree = self.get_compact_tree()
+        if tree is None:
+            return False
+        candidate_sets = []
+        if self.use_name_index:
+            if self.name_index is None:
+                self.name_index = NameIndex(tree)
+            candidates = self.name_index.candidates(self.regex_pattern)
+            if candidates is not None:
+                candidate_sets.append(candidates)
+        if self.has_size_range():
+            candidate_sets.append(self.get_size_index().entries_between(self.min_size, self.max_size))
+        if not candidate_sets:
+            return False
+
+        root = tree.find(self.search_path)
+        if root is None:
+            print(f"No matching node found for {self.search_path}")
+            return True
+
+        node_paths = {}
+        for entry in self.index_candidates(tree, root, min(candidate_sets, key=len)):
+            absolute_path, size, kind = self.entry_match(tree, entry, node_paths)
+            if kind == 'directory':
+                self.matching_directories.append((absolute_path, size))
+            else:
+                self.matching_files.append((absolute_path, size))
+        return True
+
+    def largest(self, count: int) -> List[tuple]:
+        # Top-count (absolute_path, size, kind) matches under search_path by byte size, biggest first
+        tree = self.get_compact_tree()
+        if tree is None or count <= 0:
+            return []
+        root = tree.find(self.search_path)
+        if root is None:
+            print(f"No matching node found for {self.search_path}")
+            return []
+        rank, subtree_end, _ = tree.preorder()
+        low, high = rank[root], subtree_end[root]
+        results = []
+        node_paths = {}
+        for entry in self.get_size_index().largest_first(self.min_size, self.max_size):
+            if low < rank[entry] <= high and self.index_candidates(tree, root, [entry]):
+                results.append(self.entry_match(tree, entry, node_paths))
+                if len(results) >= count:
+                    break
+        return results
+
     def apply_filters(self):
         if self.file_size_filter:
             self.matching_files = [
@@ -91,39 +308,225 @@ class TreeSearcher:
                 if convert_size_to_bytes(size) > self.file_size_filter
             ]
 
-    def search_directory(self):
+    def locate_root(self):
+        # Returns the search root as a JSON node (dict representation) or entry index (compact)
+        self.ensure_loaded()
+        if self.compact_tree is not None:
+            root = self.compact_tree.find(self.search_path)
+            if root is None:
+                print(f"No matching node found for {self.search_path}")
+            return root
+
         if not self.json_data or "devices" not in self.json_data:
             print("Error: 'devices' node not found in the JSON.")
-            return
+            return None
 
         devices_node = self.json_data["devices"]
-        root = self.find_node_by_absolute_path(devices_node, self.search_path)
+        root = self.lookup_node(devices_node, self.search_path)
 
-        if root:
-            if not self.validate_json_structure(root):
-                print("Error: Invalid JSON structure.")
+        if not root:
+            print(f"No matching node found for {self.search_path}")
+            return None
+        if not self.validate_json_structure(root):
+            print("Error: Invalid JSON structure.")
+            return None
+        return root
+
+    def cache_key(self) -> Optional[str]:
+        if self.cache is None:
+            return None
+        try:
+            fingerprint = self.cache.fingerprint(self.json_file_path)
+        except OSError:
+            return None
+        return self.cache.make_key(
+            fingerprint,
+            # mtime and size alone do not tell copies made with 'cp -p' or 'rsync -t' apart
+            tree_file=os.path.abspath(self.json_file_path),
+            search_path=self.search_path,
+            regex_pattern=self.regex_pattern.pattern,
+            flags=int(self.regex_pattern.flags),
+            search_for=self.search_for,
+            max_depth=self.max_depth,
+            file_size_filter=self.file_size_filter,
+            min_size=self.min_size,
+            max_size=self.max_size,
+        )
+
+    def search_directory(self):
+        cache_key = self.cache_key()
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.matching_files.extend(tuple(match) for match in cached["matching_files"])
+                self.matching_directories.extend(tuple(match) for match in cached["matching_directories"])
                 return
-            self.search_files_recursively(root, current_depth=0)
-        else:
+
+        # Only this search's matches are cached, not ones left over from an earlier search
+        files_start, directories_start = len(self.matching_files), len(self.matching_directories)
+        self.run_search()
+
+        if cache_key is not None:
+            self.cache.put(cache_key, {
+                "matching_files": self.matching_files[files_start:],
+                "matching_directories": self.matching_directories[directories_start:],
+            })
+
+    def run_search(self):
+        if (self.use_name_index or self.has_size_range()) and self.search_with_indexes():
+            return
+        for absolute_path, size, kind in self.iter_matches():
+            if kind == 'directory':
+                self.matching_directories.append((absolute_path, size))
+            else:
+                self.matching_files.append((absolute_path, size))
+
+    def iter_matches(self, limit: Optional[int] = None, first_only: bool = False):
+        # Lazily yields (absolute_path, size, kind) in search order, kind being 'file' or 'directory'.
+        # Stops after limit matches (or the first one) without walking the rest of the tree.
+        if first_only:
+            limit = 1
+        if limit is not None and limit <= 0:
+            return
+        root = self.locate_root()
+        if root is None:
+            return
+
+        want_directories = self.search_for in ['directories', 'both']
+        want_files = self.search_for in ['files', 'both']
+        found = 0
+        for kind, node_path, name, size, _ in self.iter_entries(root, self.max_depth):
+            if not (want_directories if kind == 'directory' else want_files):
+                continue
+            if self.has_size_range():
+                try:
+                    size_bytes = convert_size_to_bytes(size)
+                except ValueError:
+                    size_bytes = -1
+                if not self.size_in_range(size_bytes):
+                    continue
+            if self.regex_pattern.match(name):
+                yield os.path.join(node_path, name), size, kind
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+
+    def has_match(self) -> bool:
+        return next(self.iter_matches(first_only=True), None) is not None
+
+    def search_parallel(self, split_depth: int = 1, max_workers: Optional[int] = None):
+        # Split the tree split_depth levels below search_path and search the subtrees in a
+        # process pool over shared memory; results are identical to search_directory()
+        tree = self.get_compact_tree()
+        if tree is None:
+            print("Error: 'devices' node not found in the JSON.")
+            return
+        root = tree.find(self.search_path)
+        if root is None:
             print(f"No matching node found for {self.search_path}")
+            return
+        matches = parallel_search(tree, root, self.search_path, self.regex_pattern, self.search_for,
+                                  self.max_depth, split_depth=split_depth, max_workers=max_workers,
+                                  min_size=self.min_size, max_size=self.max_size)
+        for kind, absolute_path, size in matches:
+            if kind == 'directory':
+                self.matching_directories.append((absolute_path, size))
+            else:
+                self.matching_files.append((absolute_path, size))
+
+    def iter_entries(self, root, max_depth: Optional[int] = None):
+        # Yields (kind, node_path, name, size, depth) for every listed entry under root, in the
+        # same order as search_files_recursively, using an explicit stack instead of recursion
+        if self.compact_tree is not None:
+            tree = self.compact_tree
+            for entry, node_path, depth in tree.iter_entries(root, self.search_path, max_depth):
+                kind = 'directory' if tree.flags[entry] & FLAG_DIRECTORY else 'file'
+                yield kind, node_path, tree.name(entry), tree.size_string(entry), depth
+            return
+
+        stack = [(root, 0, iter(root.get('directories', [])))]
+        while stack:
+            node, depth, directories = stack[-1]
+            directory = next(directories, None)
+            if directory is not None:
+                dir_name, dir_size = directory
+                yield 'directory', node['absolute_path'], dir_name, dir_size, depth
+                dir_node = node.get(dir_name, {})
+                if dir_node and (max_depth is None or depth < max_depth):
+                    stack.append((dir_node, depth + 1, iter(dir_node.get('directories', []))))
+                continue
+            stack.pop()
+            for file_name, file_size in node.get('files', []):
+                yield 'file', node['absolute_path'], file_name, file_size, depth
+
+    def search_batch(self, queries: List[dict]) -> List[dict]:
+        # Answer many queries with one traversal. Each query dict takes regex_pattern and/or glob_patterns and
+        # optionally search_for, max_depth, flags, file_size_filter (bytes, same meaning as apply_filters) and
+        # min_size / max_size (as in the constructor; the searcher's own range when left out).
+        compiled = [
+            (
+                self.compile_pattern(query.get("regex_pattern"), query.get("flags", 0), query.get("glob_patterns")),
+                query.get("search_for", "files") in ['directories', 'both'],
+                query.get("search_for", "files") in ['files', 'both'],
+                query.get("max_depth"),
+                query.get("file_size_filter"),
+                self.min_size if query.get("min_size") is None else convert_size_to_bytes(query["min_size"]),
+                self.max_size if query.get("max_size") is None else convert_size_to_bytes(query["max_size"]),
+            )
+            for query in queries
+        ]
+        results = [{"matching_files": [], "matching_directories": []} for _ in queries]
+
+        root = self.locate_root()
+        if root is None or not queries:
+            return results
+
+        depth_limits = [query[3] for query in compiled]
+        walk_depth = None if None in depth_limits else max(depth_limits)
+
+        for kind, node_path, name, size, depth in self.iter_entries(root, walk_depth):
+            is_directory = kind == 'directory'
+            absolute_path = None
+            size_bytes = None
+            for (pattern, want_directories, want_files, max_depth, size_filter, min_size, max_size), result \
+                    in zip(compiled, results):
+                if max_depth is not None and depth > max_depth:
+                    continue
+                if not (want_directories if is_directory else want_files) or not pattern.match(name):
+                    continue
+                if not is_directory and size_filter and convert_size_to_bytes(size) <= size_filter:
+                    continue
+                if min_size is not None or max_size is not None:
+                    if size_bytes is None:
+                        try:
+                            size_bytes = convert_size_to_bytes(size)
+                        except ValueError:
+                            size_bytes = -1
+                    if not size_in_range(size_bytes, min_size, max_size):
+                        continue
+                if absolute_path is None:
+                    absolute_path = os.path.join(node_path, name)
+                if is_directory:
+                    result["matching_directories"].append((absolute_path, size))
+                else:
+                    result["matching_files"].append((absolute_path, size))
+        return results
 
     def display_results(self):
-        if self.search_for in ['directories', 'both'] and self.matching_directories:
-            print("Matching Directories:")
-            for dir_path, dir_size in self.matching_directories:
-                print(f"Directory: {dir_path}, Size: {dir_size}")
-
-        if self.search_for in ['files', 'both'] and self.matching_files:
-            print("\nMatching Files:")
-            for file_path, file_size in self.matching_files:
-                print(f"File: {file_path}, Size: {file_size}")
-
-        if not self.matching_files and self.search_for in ['files', 'both']:
-            print("No matching files found.")
-        if not self.matching_directories and self.search_for in ['directories', 'both']:
-            print("No matching directories found.")
-
-    def save_results(self, output_file: str = "results.json"):
+        print_results(self.search_for, self.matching_files, self.matching_directories)
+
+    def save_results(self, output_file: str = "results.json", format: str = "json"):
+        # format 'json' keeps the original indented document; 'ndjson', 'csv' and 'binary' are written
+        # record by record through result_writers (a '.gz' output_file is compressed)
+        if format != "json":
+            try:
+                with open_result_writer(output_file, format) as writer:
+                    writer.write_all(self.matching_directories, 'directory')
+                    writer.write_all(self.matching_files, 'file')
+                print(f"Results saved to {output_file}")
+            except (IOError, ValueError) as e:
+                print(f"Error saving results to {output_file}. Details: {e}")
+            return
         results = {
             "matching_files": self.matching_files,
             "matching_directories": self.matching_directories
@@ -135,16 +538,21 @@ class TreeSearcher:
         except IOError as e:
             print(f"Error saving results to {output_file}. Details: {e}")
 
-
-def convert_size_to_bytes(size: str) -> int:
-    size = size.upper().strip()
-    if "KB" in size:
-        return int(size.replace("KB", "")) * 1024
-    elif "MB" in size:
-        return int(size.replace("MB", "")) * 1024 * 1024
-    elif "GB" in size:
-        return int(size.replace("GB", "")) * 1024 * 1024 * 1024
-    return int(size)
+    def stream_results(self, output_file: str, format: Optional[str] = None, compress: Optional[bool] = None) -> int:
+        # Run the search and write each match as it is found, without collecting matching_files /
+        # matching_directories, so memory stays flat however many results there are.
+        # Returns the number of matches written.
+        try:
+            with open_result_writer(output_file, format, compress) as writer:
+                for absolute_path, size, kind in self.iter_matches():
+                    if kind == 'file' and self.file_size_filter and convert_size_to_bytes(size) <= self.file_size_filter:
+                        continue
+                    writer.write(absolute_path, size, kind)
+        except (IOError, ValueError) as e:
+            print(f"Error saving results to {output_file}. Details: {e}")
+            return 0
+        print(f"Results saved to {output_file}")
+        return writer.count
 
 
 # Enhanced Test Cases for the Provided JSON Structure
@@ -165,20 +573,20 @@ test_cases = [
     {"description": "Directories at depth 2.", "search_for": "directories", "regex_pattern": r'.*', "max_depth": 2, "flags": 0, "file_size_filter": None},
 ]
 
-# Execute Extended Test Cases
-for i, case in enumerate(test_cases, 1):
-    print(f"\nRunning Test Case {i}: {case['description']}")
+# Execute Extended Test Cases: one load and one traversal answers every case
+if __name__ == "__main__":
     tree_searcher = TreeSearcher(
         json_file_path=r"C:\Users\T14 Windows 11\PycharmProjects\path_tree\working_models\tree.json",
         search_path="C:\\Users\\T14 Windows 11\\PycharmProjects\\path_tree\\devices",
-        regex_pattern=case["regex_pattern"],
-        search_for=case["search_for"],
-        max_depth=case["max_depth"],
-        file_size_filter=case.get("file_size_filter"),
-        flags=case.get("flags", 0),
+        regex_pattern=r'.*',
     )
-    tree_searcher.search_directory()
-    tree_searcher.apply_filters()
-    tree_searcher.display_results()
-    tree_searcher.save_results(output_file=f"results_case_{i}.json")
-    print(f"Results for Test Case {i} saved to results_case_{i}.json")
+    batch_results = tree_searcher.search_batch(test_cases)
+
+    for i, (case, result) in enumerate(zip(test_cases, batch_results), 1):
+        print(f"\nRunning Test Case {i}: {case['description']}")
+        tree_searcher.search_for = case["search_for"]
+        tree_searcher.matching_files = result["matching_files"]
+        tree_searcher.matching_directories = result["matching_directories"]
+        tree_searcher.display_results()
+        tree_searcher.save_results(output_file=f"results_case_{i}.json")
+        print(f"Results for Test Case {i} saved to results_case_{i}.json")
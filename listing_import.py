@@ -0,0 +1,270 @@
+import re
+import sys
+import argparse
+import posixpath
+from typing import Iterator, Optional
+
+from path_tree_with_os import RESERVED_NAMES, save_path_tree
+from size_utils import convert_size_to_bytes, format_size, format_size_human
+
+
+LISTING_FORMATS = ('auto', 'find', 'find0', 'ls')
+
+# find -printf '%y %s %p\n' (or \0): type letter, size in bytes, path
+_FIND_RECORD = re.compile(r'^([a-zA-Z]) (\d+) (.+)$', re.DOTALL)
+_FIND_PREFIX = re.compile(rb'^[a-zA-Z] \d+ ')
+
+# ls -l dates: default ('Jan  1 12:00', 'Jan  1  2020'), day-first locales and the --time-style iso variants
+_LS_DATE = (r'[A-Z][a-z]{2}\.?\s+\d{1,2}\s+(?:\d{1,2}:\d{2}|\d{4})'
+            r'|\d{1,2}\s+[A-Za-z]{3}\.?\s+(?:\d{1,2}:\d{2}|\d{4})'
+            r'|\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?: [+-]\d{4})?)?'
+            r'|\d{2}-\d{2} \d{2}:\d{2}')
+# mode, link count, owner and/or group (either may be missing with -g/-o), size (or 'major, minor'), date, name
+_LS_ENTRY = re.compile(r'^([-dlbcpsD])[-rwxsStT]{9}[.+@]?\s+\d+\s+(?:\S+\s+)*?'
+                       r'(\d+(?:\.\d+)?[KMGTP]?|\d+,\s*\d+)\s+(?:' + _LS_DATE + r') (.*)$')
+
+
+class ListingTreeBuilder:
+    """
+    Builds the path_tree.json structure from (type, size, path) entries, in whatever order
+    they arrive: each directory keeps its file listing and sub-directory names, missing
+    ancestors are created on first sight, and sizes are totalled bottom-up once the listing
+    has been read. Only 'd' entries are directories; links, sockets and the like are listed
+    as files with their own size, like PathTreeCrawler. The first directory seen is the root
+    unless root_path is given; entries outside the root are skipped, and so are directories
+    named like a node key (RESERVED_NAMES) with everything below them, as in PathTreeCrawler.
+    """
+
+    def __init__(self, root_path: Optional[str] = None, exact_sizes: bool = False):
+        self.root_path = self._clean(root_path) if root_path else None
+        self.format_size = format_size if exact_sizes else format_size_human
+        self.directories = {}  # path relative to the root ('' for the root) -> (files, sub-directory names)
+        self.entries = 0
+        self.skipped = 0
+        self.reserved = set()  # skipped directories whose name collides with a node key
+
+    @staticmethod
+    def _clean(path: str) -> str:
+        return path.rstrip('/') or '/'
+
+    def _relative(self, path: str) -> Optional[str]:
+        root = self.root_path
+        if path == root:
+            return ''
+        prefix = '/' if root == '/' else root + '/'
+        return path[len(prefix):] if path.startswith(prefix) else None
+
+    def _directory(self, relative: str) -> tuple:
+        missing = []
+        while relative not in self.directories:
+            missing.append(relative)
+            if not relative:
+                break
+            relative = relative.rpartition('/')[0]
+        for path in reversed(missing):
+            self.directories[path] = ([], [])
+            if path:
+                parent, _, name = path.rpartition('/')
+                self.directories[parent][1].append(name)
+        return self.directories[missing[0]] if missing else self.directories[relative]
+
+    def _collides(self, relative: str, kind: str) -> bool:
+        parts = relative.split('/') if relative else []
+        directories = parts if kind == 'd' else parts[:-1]
+        for depth, name in enumerate(directories):
+            if name in RESERVED_NAMES:
+                self.reserved.add('/'.join(parts[:depth + 1]))
+                return True
+        return False
+
+    def add(self, kind: str, size: int, path: str):
+        path = self._clean(path)
+        if self.root_path is None:
+            if kind != 'd':
+                self.skipped += 1
+                return
+            self.root_path = path
+        relative = self._relative(path)
+        if relative is None or self._collides(relative, kind):
+            self.skipped += 1
+            return
+        self.entries += 1
+        if kind == 'd':
+            self._directory(relative)
+        elif relative:
+            parent, _, name = relative.rpartition('/')
+            self._directory(parent)[0].append((name, size))
+        else:
+            self.skipped += 1  # the root itself is not a directory
+
+    def build(self) -> dict:
+        # {base name: node}, as create_path_tree() returns it
+        if self.root_path is None:
+            return {}
+        self._directory('')
+        root = self.root_path
+        base = '' if root == '/' else root
+        totals = {}
+        nodes = {}
+        # Deepest first, so every sub-directory's node and total exist before its parent's
+        for relative in sorted(self.directories, key=lambda path: path.count('/') + bool(path), reverse=True):
+            files, subdirectories = self.directories.pop(relative)
+            files.sort()
+            subdirectories.sort()
+            child_paths = [f"{relative}/{name}" if relative else name for name in subdirectories]
+            child_totals = [totals.pop(child) for child in child_paths]
+            totals[relative] = sum(size for _, size in files) + sum(child_totals)
+            node = {
+                'absolute_path': f"{base}/{relative}" if relative else root,
+                'directories': [],
+                'files': [[name, self.format_size(size)] for name, size in files],
+            }
+            for name, child, child_total in zip(subdirectories, child_paths, child_totals):
+                node['directories'].append([name, self.format_size(child_total)])
+                node[name] = nodes.pop(child)
+            nodes[relative] = node
+        base_name = posixpath.basename(root) or root
+        return {base_name: nodes['']}
+
+
+def _records(stream, separator: bytes) -> Iterator[bytes]:
+    if separator == b'\n':
+        for line in stream:
+            yield line.rstrip(b'\r\n')
+        return
+    pending = b''
+    while True:
+        chunk = stream.read(1 << 20)
+        if not chunk:
+            break
+        parts = (pending + chunk).split(separator)
+        pending = parts.pop()
+        yield from parts
+    if pending:
+        yield pending
+
+
+def _decode(record: bytes) -> str:
+    # Names that are not valid UTF-8 survive as surrogate escapes, the same as os.fsdecode()
+    return record.decode('utf-8', 'surrogateescape')
+
+
+def parse_find(stream, separator: bytes, builder: ListingTreeBuilder):
+    for record in _records(stream, separator):
+        if not record:
+            continue
+        match = _FIND_RECORD.match(_decode(record))
+        if match is None:
+            builder.skipped += 1
+            continue
+        kind, size, path = match.groups()
+        builder.add(kind, int(size), path)
+
+
+def _ls_size(size: str) -> int:
+    # Device files show 'major, minor' instead of a size; -h sizes ('4.0K') are parsed as usual
+    return 0 if ',' in size else convert_size_to_bytes(size)
+
+
+def parse_ls(stream, builder: ListingTreeBuilder):
+    # ls -lR: a 'path:' header after a blank line (or first), 'total N', then one line per entry
+    directory = builder.root_path
+    expect_header = True
+    for record in _records(stream, b'\n'):
+        line = _decode(record)
+        if not line:
+            expect_header = True
+            continue
+        if expect_header and line.endswith(':'):
+            directory = builder._clean(line[:-1])
+            builder.add('d', 0, directory)
+            expect_header = False
+            continue
+        expect_header = False
+        if line.startswith('total '):
+            continue
+        match = _LS_ENTRY.match(line)
+        if match is None or directory is None:
+            builder.skipped += 1
+            continue
+        kind, size, name = match.groups()
+        try:
+            size = _ls_size(size)
+        except ValueError:  # a size unit convert_size_to_bytes does not know
+            builder.skipped += 1
+            continue
+        if kind == 'l':
+            name = name.split(' -> ', 1)[0]
+        if name in ('.', '..'):
+            continue
+        path = f"{directory.rstrip('/')}/{name}"
+        builder.add('d' if kind == 'd' else 'f', size, path)
+
+
+def detect_listing_format(stream) -> str:
+    # Peek without consuming: any NUL means find0, a '<type> <size> ' first line means find
+    head = stream.peek(1 << 16)[:1 << 16]
+    if b'\0' in head:
+        return 'find0'
+    first_line = head.lstrip(b'\n').split(b'\n', 1)[0]
+    return 'find' if _FIND_PREFIX.match(first_line) else 'ls'
+
+
+def import_listing(stream, listing_format: str = 'auto', root_path: Optional[str] = None,
+                   exact_sizes: bool = False) -> tuple:
+    """
+    Build a path tree from a binary listing stream in one pass. Returns (tree, builder),
+    where the builder has the entry and skipped-line counts.
+    """
+    if listing_format == 'auto':
+        listing_format = detect_listing_format(stream)
+    builder = ListingTreeBuilder(root_path, exact_sizes)
+    if listing_format == 'ls':
+        parse_ls(stream, builder)
+    else:
+        parse_find(stream, b'\0' if listing_format == 'find0' else b'\n', builder)
+    return builder.build(), builder
+
+
+def import_listing_file(listing_file: str, output_file: str = "path_tree.json", listing_format: str = 'auto',
+                        root_path: Optional[str] = None, exact_sizes: bool = False) -> bool:
+    try:
+        if listing_file == '-':
+            tree, builder = import_listing(sys.stdin.buffer, listing_format, root_path, exact_sizes)
+        else:
+            with open(listing_file, 'rb') as stream:
+                tree, builder = import_listing(stream, listing_format, root_path, exact_sizes)
+    except OSError as e:
+        print(f"Error: Could not read {listing_file}. Details: {e}")
+        return False
+    if not tree:
+        print(f"Error: No directory found in {listing_file}.")
+        return False
+    for relative in sorted(builder.reserved):
+        print(f"Error: Skipping directory {builder.root_path.rstrip('/')}/{relative}; "
+              f"its name collides with a tree node key.")
+    if builder.skipped:
+        print(f"Warning: Skipped {builder.skipped} lines that were unreadable, outside {builder.root_path} "
+              f"or below a skipped directory")
+    return save_path_tree(tree, output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build a path tree JSON file from a saved listing instead of walking the directory again.",
+        epilog="Listings: find DIR -printf '%%y %%s %%p\\n' (or '\\0'-terminated), or ls -lR DIR. "
+               "For example: ssh host \"find /data -printf '%%y %%s %%p\\0'\" | %(prog)s - -o tree.json")
+    parser.add_argument("listing", help="Listing file, or - for standard input")
+    parser.add_argument("-o", "--output", default="path_tree.json")
+    parser.add_argument("--format", choices=LISTING_FORMATS, default='auto')
+    parser.add_argument("--root", help="Directory to import (default: the first directory in the listing)")
+    parser.add_argument("--bytes", action="store_true", help="Exact sizes instead of rounded ones")
+    args = parser.parse_args()
+    if import_listing_file(args.listing, args.output, args.format, args.root, args.bytes):
+        print(f"Directory tree with sizes has been saved to {args.output}")
+    else:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
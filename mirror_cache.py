@@ -0,0 +1,238 @@
+import os
+import shutil
+import asyncio
+import hashlib
+import threading
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: mirrors are only locked within this process
+    fcntl = None
+
+
+def git_dir_of(repo_path: str) -> Optional[str]:
+    # The repository's git directory; for submodules '.git' is a file pointing into the superproject
+    git_dir = os.path.join(repo_path, '.git')
+    if os.path.isfile(git_dir):
+        try:
+            with open(git_dir) as f:
+                git_dir = os.path.join(repo_path, f.read().strip()[len('gitdir: '):])
+        except OSError:
+            return None
+    return os.path.abspath(git_dir) if os.path.isdir(git_dir) else None
+
+
+class _MirrorLock:
+    """
+    flock on '<mirror>.lock': shared while a clone borrows objects, exclusive to create, update
+    or evict. 'async with' polls so the event loop is never blocked; plain 'with' (threads) blocks.
+    """
+
+    def __init__(self, lock_file: str, shared: bool, blocking: bool = True):
+        self.lock_file = lock_file
+        self.shared = shared
+        self.blocking = blocking
+        self.fd = None
+
+    async def __aenter__(self) -> bool:
+        if fcntl is None:
+            return True
+        self.fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        mode = (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB
+        while True:
+            try:
+                fcntl.flock(self.fd, mode)
+                return True
+            except BlockingIOError:
+                if not self.blocking:
+                    os.close(self.fd)
+                    self.fd = None
+                    return False
+                await asyncio.sleep(0.1)  # Poll, so waiting never blocks the event loop
+
+    async def __aexit__(self, *exc_info):
+        self.__exit__()
+
+    def __enter__(self) -> bool:
+        if fcntl is None:
+            return True
+        self.fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        mode = (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | (0 if self.blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(self.fd, mode)
+            return True
+        except BlockingIOError:
+            os.close(self.fd)
+            self.fd = None
+            return False
+
+    def __exit__(self, *exc_info):
+        if self.fd is not None:
+            os.close(self.fd)  # releases the flock
+            self.fd = None
+
+
+class MirrorCache:
+    """
+    Local bare mirrors, one per remote URL, that clones borrow objects from through
+    --reference, so a clone only downloads what the mirror does not have yet. A mirror is
+    created with 'git clone --mirror' on first use and refreshed with 'git remote update'
+    at most once per run. Clones made without --dissociate keep reading the mirror's objects;
+    their git directories are recorded in the mirror's 'users' file and are repacked to
+    stand on their own before the mirror is evicted. collect_garbage() evicts the least
+    recently used mirrors until the cache fits max_bytes, skipping mirrors in use.
+    ensure_blocking() is ensure() for GitRepositoryManager's threads.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.ready = {}  # url -> future of the mirror path (None when it could not be made), for this run
+        self.ready_blocking = {}  # url -> mirror path or None, for ensure_blocking()
+        self.url_locks = {}
+        self.url_locks_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def mirror_path(self, url: str) -> str:
+        name = url.rstrip('/').split('/')[-1].split(':')[-1]
+        if not name.endswith('.git'):
+            name += '.git'
+        return os.path.join(self.cache_dir, f"{hashlib.sha1(url.encode()).hexdigest()[:16]}-{name}")
+
+    def lock(self, mirror: str, shared: bool = True, blocking: bool = True) -> _MirrorLock:
+        return _MirrorLock(mirror + '.lock', shared, blocking)
+
+    @staticmethod
+    def touch(mirror: str):
+        # The 'last_used' mtime orders mirrors for eviction
+        with open(os.path.join(mirror, 'last_used'), 'w'):
+            pass
+
+    async def ensure(self, url: str, run_command, host: str) -> Optional[str]:
+        """Path of the up-to-date mirror for url, creating or updating it once per run; None on failure."""
+        future = self.ready.get(url)
+        if future is None:
+            future = self.ready[url] = asyncio.ensure_future(self._refresh(url, run_command, host))
+        return await asyncio.shield(future)
+
+    async def _refresh(self, url: str, run_command, host: str) -> Optional[str]:
+        mirror = self.mirror_path(url)
+        async with self.lock(mirror, shared=False):
+            if os.path.isdir(mirror):
+                print(f"Updating mirror of {url}")
+                if await run_command(['git', 'remote', 'update', '--prune'], cwd=mirror, host=host) is None:
+                    return mirror if os.path.isdir(os.path.join(mirror, 'objects')) else None
+            else:
+                print(f"Creating mirror of {url}")
+                temp_mirror = f"{mirror}.{os.getpid()}.tmp"
+                shutil.rmtree(temp_mirror, ignore_errors=True)
+                if await run_command(['git', 'clone', '--mirror', url, temp_mirror], cwd=self.cache_dir, host=host) is None:
+                    shutil.rmtree(temp_mirror, ignore_errors=True)
+                    return None
+                os.replace(temp_mirror, mirror)
+            self.touch(mirror)
+        return mirror
+
+    def ensure_blocking(self, url: str, run_command) -> Optional[str]:
+        """ensure() for threads: run_command(args, cwd) runs a git command and returns its output or None."""
+        with self.url_locks_lock:
+            url_lock = self.url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            if url not in self.ready_blocking:
+                self.ready_blocking[url] = self._refresh_blocking(url, run_command)
+            return self.ready_blocking[url]
+
+    def _refresh_blocking(self, url: str, run_command) -> Optional[str]:
+        mirror = self.mirror_path(url)
+        with self.lock(mirror, shared=False):
+            if os.path.isdir(mirror):
+                print(f"Updating mirror of {url}")
+                if run_command(['git', 'remote', 'update', '--prune'], mirror) is None:
+                    return mirror if os.path.isdir(os.path.join(mirror, 'objects')) else None
+            else:
+                print(f"Creating mirror of {url}")
+                temp_mirror = f"{mirror}.{os.getpid()}.{threading.get_ident()}.tmp"
+                shutil.rmtree(temp_mirror, ignore_errors=True)
+                if run_command(['git', 'clone', '--mirror', url, temp_mirror], self.cache_dir) is None:
+                    shutil.rmtree(temp_mirror, ignore_errors=True)
+                    return None
+                os.replace(temp_mirror, mirror)
+            self.touch(mirror)
+        return mirror
+
+    def add_user(self, mirror: str, git_dir: Optional[str]):
+        # A clone that reads the mirror's objects through objects/info/alternates
+        if git_dir is None:
+            return
+        with open(os.path.join(mirror, 'users'), 'a') as f:
+            f.write(git_dir + '\n')
+
+    @staticmethod
+    def directory_size(path: str) -> int:
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    async def _dissociate_users(self, mirror: str, run_command) -> bool:
+        # Give every clone still borrowing from the mirror its own copy of the objects
+        objects = os.path.join(mirror, 'objects')
+        try:
+            with open(os.path.join(mirror, 'users')) as f:
+                users = sorted(set(line.strip() for line in f if line.strip()))
+        except OSError:
+            return True
+        for git_dir in users:
+            alternates_file = os.path.join(git_dir, 'objects', 'info', 'alternates')
+            try:
+                with open(alternates_file) as f:
+                    alternates = [line.strip() for line in f if line.strip()]
+            except OSError:
+                continue  # clone is gone or never borrowed
+            if not any(os.path.realpath(alternate) == os.path.realpath(objects) for alternate in alternates):
+                continue
+            print(f"Repacking {git_dir} before evicting its mirror")
+            if await run_command(['git', f'--git-dir={git_dir}', 'repack', '-a', '-d']) is None:
+                return False
+            remaining = [alternate for alternate in alternates if os.path.realpath(alternate) != os.path.realpath(objects)]
+            if remaining:
+                with open(alternates_file, 'w') as f:
+                    f.write('\n'.join(remaining) + '\n')
+            else:
+                os.remove(alternates_file)
+        return True
+
+    async def collect_garbage(self, run_command) -> list:
+        """Evict least recently used mirrors until the cache fits max_bytes; returns the evicted paths."""
+        if self.max_bytes is None:
+            return []
+        mirrors = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_dir() and entry.name.endswith('.git'):
+                try:
+                    last_used = os.stat(os.path.join(entry.path, 'last_used')).st_mtime
+                except OSError:
+                    last_used = 0
+                mirrors.append((last_used, entry.path, self.directory_size(entry.path)))
+        total = sum(size for _, _, size in mirrors)
+        evicted = []
+        for _, mirror, size in sorted(mirrors):
+            if total <= self.max_bytes:
+                break
+            async with self.lock(mirror, shared=False, blocking=False) as locked:
+                if not locked:
+                    continue  # being updated or borrowed from right now
+                if not await self._dissociate_users(mirror, run_command):
+                    continue
+                trash = f"{mirror}.{os.getpid()}.evicted"
+                os.replace(mirror, trash)
+                shutil.rmtree(trash, ignore_errors=True)
+            total -= size
+            evicted.append(mirror)
+            print(f"Evicted mirror {mirror} ({size} bytes)")
+        return evicted
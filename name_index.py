@@ -0,0 +1,206 @@
+import re
+from array import array
+from typing import Optional, List
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from compact_tree import CompactTree
+
+
+MAX_LITERAL_ALTERNATIVES = 64
+TRIGRAM = 3
+
+
+def _literal_alternatives(items) -> Optional[List[str]]:
+    """Every string a run of parsed regex items can match, or None if it is not purely literal."""
+    results = ['']
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            options = [chr(av)]
+        elif op is sre_constants.IN and all(in_op is sre_constants.LITERAL for in_op, _ in av):
+            options = [chr(code) for _, code in av]
+        elif op is sre_constants.SUBPATTERN:
+            _, add_flags, _, sub_items = av
+            options = None if add_flags & re.IGNORECASE else _literal_alternatives(sub_items)
+        elif op is sre_constants.BRANCH:
+            options = []
+            for branch in av[1]:
+                branch_options = _literal_alternatives(branch)
+                if branch_options is None:
+                    return None
+                options.extend(branch_options)
+        else:
+            return None
+        if options is None:
+            return None
+        results = [result + option for result in results for option in options]
+        if len(results) > MAX_LITERAL_ALTERNATIVES:
+            return None
+    return results
+
+
+def extract_literals(pattern) -> Optional[dict]:
+    """
+    Pull the literal parts out of a compiled pattern used with pattern.match():
+    'prefixes' (the name must start with one of them), 'suffixes' (it must end with one,
+    only when the pattern ends in $ or \\Z) and 'substrings' (each must occur in the name).
+    Returns None for patterns the planner does not handle, e.g. case-insensitive ones.
+    """
+    if not isinstance(pattern, re.Pattern) or not isinstance(pattern.pattern, str) or pattern.flags & re.IGNORECASE:
+        return None
+    try:
+        items = list(sre_parse.parse(pattern.pattern, pattern.flags))
+    except re.error:
+        return None
+
+    at_begin = (sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING)
+    at_end = (sre_constants.AT_END, sre_constants.AT_END_STRING)
+    while items and items[0][0] is sre_constants.AT and items[0][1] in at_begin:
+        items = items[1:]
+    anchored_end = bool(items) and items[-1][0] is sre_constants.AT and items[-1][1] in at_end
+    if anchored_end:
+        items = items[:-1]
+
+    prefixes = ['']
+    for item in items:
+        extended = _literal_alternatives([item])
+        if extended is None or len(prefixes) * len(extended) > MAX_LITERAL_ALTERNATIVES:
+            break
+        prefixes = [prefix + option for prefix in prefixes for option in extended]
+
+    suffixes = ['']
+    if anchored_end:
+        for item in reversed(items):
+            extended = _literal_alternatives([item])
+            if extended is None or len(suffixes) * len(extended) > MAX_LITERAL_ALTERNATIVES:
+                break
+            suffixes = [option + suffix for option in extended for suffix in suffixes]
+
+    substrings = []
+    run = ''
+    for op, av in items + [(None, None)]:
+        if op is sre_constants.LITERAL:
+            run += chr(av)
+            continue
+        if run:
+            substrings.append(run)
+        run = ''
+    if len(prefixes) == 1 and prefixes[0]:
+        substrings.append(prefixes[0])
+    if len(suffixes) == 1 and suffixes[0]:
+        substrings.append(suffixes[0])
+
+    return {
+        "prefixes": [] if prefixes == [''] else prefixes,
+        "suffixes": [] if suffixes == [''] else suffixes,
+        "substrings": list(dict.fromkeys(substrings)),
+    }
+
+
+class NameIndex:
+    """
+    Secondary indexes over a CompactTree's name table: by extension, by sorted name
+    (for prefixes) and optionally by trigram (for required substrings). candidates()
+    narrows a regex down to the entries that can possibly match it.
+    """
+
+    def __init__(self, tree: CompactTree, trigrams: bool = True):
+        self.tree = tree
+        names = tree.names
+        name_count = len(names)
+
+        # Entries per name id, as one offsets column plus one entries column
+        offsets = array('i', bytes(4 * (name_count + 1)))
+        for name_id in tree.name_ids:
+            offsets[name_id + 1] += 1
+        for name_id in range(name_count):
+            offsets[name_id + 1] += offsets[name_id]
+        entries = array('i', bytes(4 * len(tree.name_ids)))
+        fill = array('i', offsets[:-1])
+        for entry, name_id in enumerate(tree.name_ids):
+            entries[fill[name_id]] = entry
+            fill[name_id] += 1
+        self.name_offsets = offsets
+        self.name_entries = entries
+
+        self.sorted_name_ids = array('i', sorted(range(name_count), key=names.__getitem__))
+        self.by_extension = {}
+        self.by_trigram = {} if trigrams else None
+        self.newline_name_ids = []
+        for name_id in range(name_count):
+            name = names[name_id]
+            if '.' in name:
+                self.by_extension.setdefault(name.rsplit('.', 1)[1], array('i')).append(name_id)
+            if '\n' in name:
+                self.newline_name_ids.append(name_id)
+            if self.by_trigram is not None:
+                for trigram in {name[i:i + TRIGRAM] for i in range(len(name) - TRIGRAM + 1)}:
+                    self.by_trigram.setdefault(trigram, array('i')).append(name_id)
+
+    def _lower_bound(self, key: str) -> int:
+        names = self.tree.names
+        sorted_ids = self.sorted_name_ids
+        low, high = 0, len(sorted_ids)
+        while low < high:
+            middle = (low + high) // 2
+            if names[sorted_ids[middle]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _prefix_range(self, prefix: str) -> range:
+        """Positions in sorted_name_ids of the names starting with prefix."""
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1) if ord(prefix[-1]) < 0x10FFFF else None
+        low = self._lower_bound(prefix)
+        high = self._lower_bound(upper) if upper is not None else len(self.sorted_name_ids)
+        return range(low, high)
+
+    def candidate_names(self, pattern) -> Optional[List[int]]:
+        """
+        Name ids that may match pattern, or None when a full scan is needed. Each literal
+        gives one candidate source; only the smallest is used, since every candidate is
+        checked against the full regex afterwards anyway.
+        """
+        literals = extract_literals(pattern)
+        if literals is None:
+            return None
+
+        sources = []  # (size, producer)
+        suffixes = literals["suffixes"]
+        if suffixes and all('.' in suffix for suffix in suffixes):
+            extension_lists = [self.by_extension.get(extension, ())
+                               for extension in {suffix.rsplit('.', 1)[1] for suffix in suffixes}]
+            sources.append((sum(map(len, extension_lists)),
+                            lambda lists=extension_lists: [name_id for ids in lists for name_id in ids]))
+        if literals["prefixes"]:
+            ranges = [self._prefix_range(prefix) for prefix in literals["prefixes"]]
+            sources.append((sum(map(len, ranges)),
+                            lambda ranges=ranges: [self.sorted_name_ids[i] for r in ranges for i in r]))
+        if self.by_trigram is not None:
+            for substring in literals["substrings"]:
+                if len(substring) >= TRIGRAM:
+                    rarest = min((self.by_trigram.get(substring[i:i + TRIGRAM], ())
+                                  for i in range(len(substring) - TRIGRAM + 1)), key=len)
+                    sources.append((len(rarest), lambda ids=rarest: list(ids)))
+
+        if not sources:
+            return None
+        name_ids = min(sources, key=lambda source: source[0])[1]()
+        if suffixes:
+            # $ also matches before a trailing newline, so such names are never ruled out
+            name_ids.extend(self.newline_name_ids)
+        return name_ids
+
+    def candidates(self, pattern) -> Optional[List[int]]:
+        """Entries that may match pattern, or None when a full scan is needed."""
+        name_ids = self.candidate_names(pattern)
+        if name_ids is None:
+            return None
+        offsets = self.name_offsets
+        entries = self.name_entries
+        return [entry for name_id in set(name_ids) for entry in entries[offsets[name_id]:offsets[name_id + 1]]]
@@ -0,0 +1,146 @@
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional, List, Tuple
+
+from compact_tree import CompactTree, FLAG_DIRECTORY, FLAG_HAS_NODE
+
+
+_ALIGNMENT = 8
+
+# Per-worker state, set once by the pool initializer
+_worker_tree: Optional[CompactTree] = None
+_worker_memory: Optional[shared_memory.SharedMemory] = None
+
+
+class SharedCompactTree:
+    """
+    Copies a CompactTree's columns into one shared memory block, so pool workers can
+    attach to the same tree instead of receiving a pickled copy with every task.
+    """
+
+    def __init__(self, tree: CompactTree):
+        layout = []
+        offset = 0
+        for key, typecode, buffer in tree.column_buffers():
+            size = len(buffer) * array(typecode).itemsize
+            layout.append((key, typecode, offset, size))
+            offset += (size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+        self.memory = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (key, typecode, start, size), (_, _, buffer) in zip(layout, tree.column_buffers()):
+            self.memory.buf[start:start + size] = memoryview(buffer).cast('B')
+        self.handle = (self.memory.name, layout, tree.root_path, tree.path_overrides, tree.raw_sizes)
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self) -> "SharedCompactTree":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_shared_tree(handle: tuple) -> Tuple[CompactTree, shared_memory.SharedMemory]:
+    """Rebuild a CompactTree over an existing shared memory block; the caller keeps the block open."""
+    memory_name, layout, root_path, path_overrides, raw_sizes = handle
+    memory = shared_memory.SharedMemory(name=memory_name)
+    buffers = {}
+    for key, typecode, start, size in layout:
+        view = memory.buf[start:start + size]
+        buffers[key] = view if typecode == 'B' else view.cast(typecode)
+    return CompactTree.from_buffers(root_path, buffers, path_overrides, raw_sizes), memory
+
+
+def _init_worker(handle: tuple):
+    global _worker_tree, _worker_memory
+    _worker_tree, _worker_memory = attach_shared_tree(handle)
+
+
+def size_in_range(size_bytes: int, min_size: Optional[int], max_size: Optional[int]) -> bool:
+    # Same rule as TreeSearcher.size_in_range: unknown sizes (-1) only pass when no range is set
+    if size_bytes < 0:
+        return min_size is None and max_size is None
+    if min_size is not None and size_bytes < min_size:
+        return False
+    return max_size is None or size_bytes <= max_size
+
+
+def search_subtree(tree: CompactTree, root: int, root_path: str, regex_pattern, search_for: str,
+                   max_depth: Optional[int], min_size: Optional[int] = None,
+                   max_size: Optional[int] = None) -> List[tuple]:
+    """Matches under one node as ('directory' | 'file', absolute_path, size) in search order."""
+    want_directories = search_for in ['directories', 'both']
+    want_files = search_for in ['files', 'both']
+    matches = []
+    for entry, node_path, _ in tree.iter_entries(root, root_path, max_depth):
+        is_directory = tree.flags[entry] & FLAG_DIRECTORY
+        if not (want_directories if is_directory else want_files):
+            continue
+        if not size_in_range(tree.sizes[entry], min_size, max_size):
+            continue
+        name = tree.name(entry)
+        if regex_pattern.match(name):
+            kind = 'directory' if is_directory else 'file'
+            matches.append((kind, os.path.join(node_path, name), tree.size_string(entry)))
+    return matches
+
+
+def _search_task(task: tuple) -> List[tuple]:
+    root, root_path, regex_pattern, search_for, max_depth, min_size, max_size = task
+    return search_subtree(_worker_tree, root, root_path, regex_pattern, search_for, max_depth, min_size, max_size)
+
+
+def parallel_search(tree: CompactTree, root: int, root_path: str, regex_pattern, search_for: str = "files",
+                    max_depth: Optional[int] = None, split_depth: int = 1,
+                    max_workers: Optional[int] = None, min_size: Optional[int] = None,
+                    max_size: Optional[int] = None) -> List[tuple]:
+    """
+    Search under root using a process pool, for matches sized within [min_size, max_size] bytes when given. The tree is cut split_depth levels below root:
+    the parent process walks the levels above the cut itself and every directory node at
+    the cut becomes one pool task. Task results are spliced back in at the position of
+    their directory, so the output is identical to a serial search.
+    """
+    if split_depth < 1:
+        raise ValueError("split_depth must be at least 1")
+    shallow_depth = split_depth - 1 if max_depth is None else min(split_depth - 1, max_depth)
+    task_depth = None if max_depth is None else max_depth - split_depth
+    want_directories = search_for in ['directories', 'both']
+    want_files = search_for in ['files', 'both']
+
+    segments = []  # each item is either a list of matches or the index of a pool task
+    tasks = []
+    current = []
+    for entry, node_path, depth in tree.iter_entries(root, root_path, shallow_depth):
+        is_directory = tree.flags[entry] & FLAG_DIRECTORY
+        name = tree.name(entry)
+        if (want_directories if is_directory else want_files) and size_in_range(tree.sizes[entry], min_size, max_size) \
+                and regex_pattern.match(name):
+            kind = 'directory' if is_directory else 'file'
+            current.append((kind, os.path.join(node_path, name), tree.size_string(entry)))
+        at_cut = depth == split_depth - 1 and (task_depth is None or task_depth >= 0)
+        if is_directory and tree.flags[entry] & FLAG_HAS_NODE and at_cut:
+            segments.append(current)
+            segments.append(len(tasks))
+            current = []
+            # Compiled patterns (and PatternMatchers) pickle, so the matcher itself goes to the workers
+            tasks.append((entry, tree.child_path(node_path, entry), regex_pattern, search_for, task_depth,
+                          min_size, max_size))
+    segments.append(current)
+
+    if not tasks:
+        return [match for segment in segments for match in segment]
+
+    with SharedCompactTree(tree) as shared:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(shared.handle,)) as executor:
+            chunksize = max(1, len(tasks) // (4 * (max_workers or os.cpu_count() or 1)))
+            task_results = list(executor.map(_search_task, tasks, chunksize=chunksize))
+
+    merged = []
+    for segment in segments:
+        merged.extend(task_results[segment] if isinstance(segment, int) else segment)
+    return merged
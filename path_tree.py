@@ -0,0 +1,37 @@
+import os
+import argparse
+
+from path_tree_with_os import create_path_tree, save_path_tree
+from tree_stream_writer import stream_path_tree
+
+
+# Python replacement for path_tree.sh: same arguments, same directory_tree.json layout.
+# path_tree.sh runs du -sh for every entry at every level, re-scanning each subtree once per
+# ancestor; here every file is stat'ed once and directory sizes are summed bottom-up in the
+# same walk. Sizes are apparent sizes (what ls shows), not du's allocated blocks.
+def main():
+    parser = argparse.ArgumentParser(description="Save a directory tree with sizes as JSON.")
+    parser.add_argument("directory", nargs='?', default=".")
+    parser.add_argument("-o", "--output", default="directory_tree.json")
+    parser.add_argument("--bytes", action="store_true",
+                        help="Exact sizes ('1536', '500KB') instead of rounded ones ('1.5KB')")
+    parser.add_argument("--workers", type=int, default=32, help="Directories listed concurrently")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write the JSON during a single-threaded walk instead of building it in memory first")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: {args.directory} is not a directory.")
+        return
+    # path_tree.sh records realpath, so symlinked roots resolve the same way
+    directory = os.path.realpath(args.directory)
+    if args.stream:
+        saved = stream_path_tree(directory, args.output, args.bytes)
+    else:
+        saved = save_path_tree(create_path_tree(directory, args.workers, args.bytes), args.output)
+    if saved:
+        print(f"Directory tree with sizes has been saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
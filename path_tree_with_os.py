@@ -1,47 +1,180 @@
 import os
-import pprint
-
-
-def create_path_tree(folder_path):
-    # Get the base name of the current path
-    base_name = os.path.basename(folder_path)
-
-    # Initialize the path tree with base name as key
-    path_tree = {
-        base_name: {
-            'absolute_path': os.path.abspath(folder_path),
-            'files': [],
-            'directories': []
-        }
-    }
-
-    # Initialize lists for files and directories
-    files_list = []
-    directories_list = []
-
-    # Iterate over the contents of the folder
-    for item in os.listdir(folder_path):
-        item_path = os.path.join(folder_path, item)
-        if os.path.isfile(item_path):
-            files_list.append(item)
-        elif os.path.isdir(item_path):
-            directories_list.append(item)
-
-    # Add files and directories to the dictionary
-    path_tree[base_name]['files'] = files_list
-    path_tree[base_name]['directories'] = directories_list
-
-    # Recursively create path trees for subdirectories
-    for directory in directories_list:
-        subdirectory_path = os.path.join(folder_path, directory)
-        # Update the path_tree dictionary with the subdirectory structure
-        path_tree[base_name][directory] = create_path_tree(subdirectory_path)[directory]
-
-    return path_tree
+import sys
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-# Example usage:
-folder_path = 'C:\\Users\\T14 Windows 11\\PycharmProjects\\path_tree\\devices'
-path_tree = create_path_tree(folder_path)
+from size_utils import format_size, format_size_human
+
+# Keys of a tree node; a sub-directory with one of these names cannot be stored as a child node
+RESERVED_NAMES = frozenset(('absolute_path', 'directories', 'files'))
+
+
+class _Directory:
+    # Crawl state of one directory node until every sub-directory below it is finished
+    __slots__ = ('node', 'path', 'parent', 'index', 'pending', 'total')
+
+    def __init__(self, node: dict, path: str, parent=None, index: int = -1):
+        self.node = node
+        self.path = path
+        self.parent = parent
+        self.index = index  # position in the parent's 'directories' listing
+        self.pending = 0
+        self.total = 0
+
+
+class PathTreeCrawler:
+    """
+    Builds a path_tree.json tree with os.scandir. File type and (on Windows) size come from
+    the cached DirEntry data, so each file costs at most one stat call. Every directory is
+    listed as its own thread pool task; a directory's size is the total of its files and
+    sub-directories and is filled into its parent's listing once its last sub-directory is
+    done, so sizes are aggregated bottom-up without a second walk. Symbolic links are not
+    followed and are listed as files. Sub-directories named like a node key (RESERVED_NAMES)
+    cannot be represented, so they are skipped and reported in errors. An unexpected
+    failure in a task stops the crawl and is raised again by crawl().
+    """
+
+    def __init__(self, max_workers: int = 32, exact_sizes: bool = False):
+        self.max_workers = max_workers
+        self.format_size = format_size if exact_sizes else format_size_human
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.errors = []
+        self.failure = None  # first exception raised by a task
+        self.executor = None
+
+    def crawl(self, folder_path: str) -> dict:
+        folder_path = os.path.abspath(folder_path)
+        base_name = os.path.basename(folder_path.rstrip(os.sep)) or folder_path
+        root = self._root(folder_path, base_name)
+        self.done.clear()
+        self.errors = []
+        self.failure = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self.executor = executor
+            executor.submit(self._run, root)
+            self.done.wait()
+        self.executor = None
+        if self.failure is not None:
+            raise self.failure
+        return {base_name: root.node}
+
+    def _root(self, folder_path: str, base_name: str) -> _Directory:
+        return _Directory({'absolute_path': folder_path, 'directories': [], 'files': []}, folder_path)
+
+    def _run(self, directory: _Directory):
+        # Thread pool task: an exception would otherwise be kept in the unused future and crawl() would wait forever
+        if self.failure is not None:
+            return
+        try:
+            self._list(directory)
+        except BaseException as e:
+            with self.lock:
+                if self.failure is None:
+                    self.failure = e
+            self.done.set()
+
+    def _list(self, directory: _Directory):
+        names, files_total = self._scan(directory)
+        self._expand(directory, names, files_total)
 
-# Pretty print the path tree
-pprint.pprint(path_tree)
+    def _scan(self, directory: _Directory) -> tuple:
+        # List one directory: fills node['files'] and returns (sub-directory names, total file bytes)
+        node = directory.node
+        subdirectories = []
+        files_total = 0
+        try:
+            with os.scandir(directory.path) as entries:
+                items = sorted(entries, key=lambda entry: entry.name)
+            for entry in items:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.name)
+                        continue
+                    size = entry.stat(follow_symlinks=False).st_size
+                except OSError as e:
+                    self.errors.append((entry.path, str(e)))
+                    print(f"Error: Could not stat {entry.path}. Details: {e}")
+                    continue
+                node['files'].append([entry.name, self.format_size(size)])
+                files_total += size
+        except OSError as e:
+            self.errors.append((directory.path, str(e)))
+            print(f"Error: Could not list {directory.path}. Details: {e}")
+        except Exception as e:  # Never leave the parent waiting on this directory
+            self.errors.append((directory.path, str(e)))
+            print(f"Error: Unexpected failure in {directory.path}. Details: {e}")
+            subdirectories = []
+        return subdirectories, files_total
+
+    def _new_child(self, parent: _Directory, name: str, index: int) -> _Directory:
+        parent.node['directories'].append([name, None])  # size filled in by _finish()
+        path = os.path.join(parent.path, name)
+        child_node = {'absolute_path': path, 'directories': [], 'files': []}
+        parent.node[name] = child_node
+        return _Directory(child_node, path, parent, index)
+
+    def _expand(self, directory: _Directory, names: list, files_total: int):
+        # Queue the sub-directories, or finish the directory right away when it has none
+        names = [name for name in names if self._representable(directory, name)]
+        children = [self._new_child(directory, name, index) for index, name in enumerate(names)]
+        with self.lock:
+            directory.total += files_total
+            directory.pending = len(children)
+        if not children:
+            self._finish(directory)
+            return
+        for child in children:
+            self.executor.submit(self._run, child)
+
+    def _representable(self, directory: _Directory, name: str) -> bool:
+        if name not in RESERVED_NAMES:
+            return True
+        path = os.path.join(directory.path, name)
+        self.errors.append((path, "directory name collides with a tree node key"))
+        print(f"Error: Skipping directory {path}; its name collides with a tree node key.")
+        return False
+
+    def _completed(self, directory: _Directory):
+        # Called once per directory when its total size is final
+        pass
+
+    def _finish(self, directory: _Directory):
+        # Report a completed directory to its parent, and keep going up while parents complete too
+        while True:
+            self._completed(directory)
+            parent = directory.parent
+            if parent is None:
+                self.done.set()
+                return
+            parent.node['directories'][directory.index][1] = self.format_size(directory.total)
+            with self.lock:
+                parent.total += directory.total
+                parent.pending -= 1
+                if parent.pending:
+                    return
+            directory = parent
+
+
+def create_path_tree(folder_path, max_workers: int = 32, exact_sizes: bool = False):
+    # {base name: node} in the path_tree.json schema: absolute_path, [name, size] listings and child nodes
+    return PathTreeCrawler(max_workers, exact_sizes).crawl(folder_path)
+
+
+def save_path_tree(path_tree: dict, output_file: str = "path_tree.json") -> bool:
+    try:
+        with open(output_file, 'w') as file:
+            json.dump(path_tree, file, indent=2)
+        return True
+    except IOError as e:
+        print(f"Error saving path tree to {output_file}. Details: {e}")
+        return False
+
+
+# Example usage:
+if __name__ == "__main__":
+    folder_path = sys.argv[1] if len(sys.argv) > 1 else 'C:\\Users\\T14 Windows 11\\PycharmProjects\\path_tree\\devices'
+    path_tree = create_path_tree(folder_path)
+    if save_path_tree(path_tree):
+        print("Path tree saved to path_tree.json")
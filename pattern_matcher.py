@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import fnmatch
+from typing import Optional, List, Iterable
+
+from name_index import extract_literals
+
+
+PREFIX_KEY = 3  # longest name prefix used as a bucket key
+TRIGRAM = 3
+# fnmatch.fnmatch() compares os.path.normcase()d names, which folds case on Windows
+GLOBS_IGNORE_CASE = os.path.normcase('A') != 'A'
+SCOPED_FLAGS = ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'), (re.VERBOSE, 'x'), (re.ASCII, 'a'))
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+
+def compile_glob(glob: str):
+    """
+    fnmatch.translate() wraps the whole expression in (?s:...), which hides its literal
+    prefix and suffix from extract_literals(); compile the unwrapped body with DOTALL instead.
+    """
+    translated = fnmatch.translate(glob)
+    if translated.startswith('(?s:') and translated.endswith(')\\Z'):
+        body = translated[4:-3] + '\\Z'
+        try:
+            return re.compile(body, re.DOTALL)
+        except re.error:
+            pass
+    return re.compile(translated)
+
+
+class PatternMatcher:
+    """
+    Many glob and regex patterns checked against a name at once. Regexes are applied with
+    match() like TreeSearcher does, globs follow fnmatch.fnmatch(). Patterns are bucketed
+    under the literals a match requires (extension and/or first characters, otherwise one
+    trigram of a required substring), so a name only runs the few patterns its own
+    extension, prefix and trigrams select. The remaining patterns are joined into one
+    alternation of named groups that rejects most names in a single regex call.
+    Pattern ids are positions in `labels`: globs first, then regexes.
+    """
+
+    def __init__(self, regex_patterns: Iterable[str] = (), glob_patterns: Iterable[str] = (), flags: int = 0,
+                 globs_ignore_case: Optional[bool] = None):
+        if globs_ignore_case is None:
+            globs_ignore_case = GLOBS_IGNORE_CASE
+        self.glob_patterns = list(glob_patterns)
+        self.regex_patterns = list(regex_patterns)
+        self.labels: List[str] = []
+        self.compiled = []
+        self.folds = []  # per pattern: matched against the lowercased name
+        self.flags = flags
+        self.globs_ignore_case = globs_ignore_case
+
+        for glob in self.glob_patterns:
+            self.labels.append(glob)
+            self.folds.append(globs_ignore_case)
+            self.compiled.append(compile_glob(glob.lower() if globs_ignore_case else glob))
+        for pattern in self.regex_patterns:
+            self.labels.append(pattern)
+            self.folds.append(False)
+            self.compiled.append(re.compile(pattern, flags))
+
+        # Per fold (exact / lowercased name): key length -> (extension, prefix) -> ids, extension -> ids,
+        # key length -> prefix -> ids, trigram -> ids, and the patterns without any usable literal
+        self.by_extension_prefix = ({}, {})
+        self.by_extension = ({}, {})
+        self.by_prefix = ({}, {})
+        self.by_trigram = ({}, {})
+        self.unbucketed = ([], [])
+        self.newline_safe = True
+        self.folded = [fold for fold in (0, 1) if fold in self.folds]
+        for pattern_id, (compiled, fold) in enumerate(zip(self.compiled, self.folds)):
+            literals = extract_literals(compiled)
+            suffixes = literals["suffixes"] if literals else []
+            prefixes = literals["prefixes"] if literals else []
+            if suffixes:
+                # $ also matches before a trailing newline, which the extension buckets do not see
+                self.newline_safe = False
+            extensions = {suffix.rsplit('.', 1)[1] for suffix in suffixes} \
+                if suffixes and all('.' in suffix for suffix in suffixes) else None
+            key_length = min(PREFIX_KEY, min(len(prefix) for prefix in prefixes)) if prefixes else 0
+            trigrams = [substring[i:i + TRIGRAM] for substring in (literals["substrings"] if literals else [])
+                        for i in range(len(substring) - TRIGRAM + 1)]
+            if extensions and key_length:
+                table = self.by_extension_prefix[fold].setdefault(key_length, {})
+                for key in {(extension, prefix[:key_length]) for extension in extensions for prefix in prefixes}:
+                    table.setdefault(key, []).append(pattern_id)
+            elif extensions:
+                for extension in extensions:
+                    self.by_extension[fold].setdefault(extension, []).append(pattern_id)
+            elif key_length:
+                table = self.by_prefix[fold].setdefault(key_length, {})
+                for prefix in {prefix[:key_length] for prefix in prefixes}:
+                    table.setdefault(prefix, []).append(pattern_id)
+            elif trigrams:
+                # Any one required trigram will do; take the least shared one to keep buckets small
+                table = self.by_trigram[fold]
+                trigram = min(trigrams, key=lambda trigram: len(table.get(trigram, ())))
+                table.setdefault(trigram, []).append(pattern_id)
+            else:
+                self.unbucketed[fold].append(pattern_id)
+
+        self.combined = (self._combine(self.unbucketed[0]), self._combine(self.unbucketed[1]))
+
+    def _combine(self, pattern_ids: List[int]) -> tuple:
+        # (alternation of the combinable patterns, ids that must still be checked one by one)
+        branches = []
+        separate = []
+        for pattern_id in pattern_ids:
+            compiled = self.compiled[pattern_id]
+            scoped = ''.join(letter for flag, letter in SCOPED_FLAGS if compiled.flags & flag)
+            # Group references would point at the wrong group once patterns are joined
+            if compiled.groupindex or _BACKREFERENCE.search(compiled.pattern):
+                separate.append(pattern_id)
+                continue
+            branch = f"(?P<p{pattern_id}>(?{scoped}:{compiled.pattern}))" if scoped else \
+                f"(?P<p{pattern_id}>(?:{compiled.pattern}))"
+            try:
+                re.compile(branch)
+            except re.error:  # e.g. global inline flags such as (?i) at the start of the pattern
+                separate.append(pattern_id)
+                continue
+            branches.append(branch)
+        return (re.compile('|'.join(branches)) if branches else None), separate
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @property
+    def pattern(self) -> str:
+        # Stable text for cache keys and messages
+        return json.dumps({"globs": self.glob_patterns, "regexes": self.regex_patterns,
+                           "globs_ignore_case": self.globs_ignore_case})
+
+    def _candidates(self, name: str, fold: int) -> List[int]:
+        subject = name.lower() if fold else name
+        candidates = []
+        if '.' in subject:
+            extension = subject.rsplit('.', 1)[1]
+            candidates.extend(self.by_extension[fold].get(extension, ()))
+            for key_length, table in self.by_extension_prefix[fold].items():
+                candidates.extend(table.get((extension, subject[:key_length]), ()))
+        for key_length, table in self.by_prefix[fold].items():
+            candidates.extend(table.get(subject[:key_length], ()))
+        by_trigram = self.by_trigram[fold]
+        if by_trigram:
+            for trigram in {subject[i:i + TRIGRAM] for i in range(len(subject) - TRIGRAM + 1)}:
+                candidates.extend(by_trigram.get(trigram, ()))
+        combined, separate = self.combined[fold]
+        if combined is not None:
+            hit = combined.match(subject)
+            if hit is not None:
+                # The alternation stops at its first matching branch; the others are checked below
+                first = int(hit.lastgroup[1:])
+                candidates.extend(pattern_id for pattern_id in self.unbucketed[fold]
+                                  if pattern_id >= first and pattern_id not in separate)
+        candidates.extend(separate)
+        return candidates
+
+    def matches(self, name: str, first_only: bool = False) -> List[int]:
+        """Ids of every pattern matching name in pattern order, or just the first one."""
+        if '\n' in name and not self.newline_safe:
+            candidates = range(len(self.compiled))
+        else:
+            candidates = sorted(set(pattern_id for fold in self.folded for pattern_id in self._candidates(name, fold)))
+        lowered = name.lower() if self.folded[-1:] == [1] else None
+        hits = []
+        for pattern_id in candidates:
+            if self.compiled[pattern_id].match(lowered if self.folds[pattern_id] else name):
+                hits.append(pattern_id)
+                if first_only:
+                    break
+        return hits
+
+    def matched_patterns(self, name: str) -> List[str]:
+        return [self.labels[pattern_id] for pattern_id in self.matches(name)]
+
+    def match(self, name: str) -> bool:
+        # Truthy like re.Pattern.match(), so a PatternMatcher can stand in for one
+        return bool(self.matches(name, first_only=True))
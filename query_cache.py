@@ -0,0 +1,135 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from tree_index import tree_fingerprint
+
+
+class QueryCache:
+    """
+    Result cache for TreeSearcher queries. The key contains the tree file's fingerprint,
+    so results for an older version of the file are never returned. There is an in-memory
+    LRU tier bounded by the approximate size of the cached results and an optional
+    on-disk tier, one JSON file per query, bounded the same way. Results are stored as
+    immutable copies and every get() returns fresh lists, so callers may extend or modify
+    what they get back (or what they put) without touching the cached entry.
+    """
+
+    def __init__(self, max_memory_bytes: int = 64 * 1024 * 1024, cache_dir: Optional[str] = None,
+                 max_disk_bytes: Optional[int] = None, use_hash: bool = False):
+        self.max_memory_bytes = max_memory_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.use_hash = use_hash
+        self.memory = OrderedDict()  # key -> (results, size in bytes)
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self._hashes = {}  # (path, mtime_ns, size) -> sha256, so a file is only hashed once per version
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def fingerprint(self, json_file_path: str) -> dict:
+        fingerprint = tree_fingerprint(json_file_path)
+        if self.use_hash:
+            version = (json_file_path, fingerprint["mtime_ns"], fingerprint["size"])
+            if version not in self._hashes:
+                self._hashes[version] = tree_fingerprint(json_file_path, use_hash=True)["sha256"]
+            fingerprint = {"sha256": self._hashes[version]}
+        return fingerprint
+
+    @staticmethod
+    def make_key(fingerprint: dict, **query) -> str:
+        payload = json.dumps({"tree": fingerprint, "query": query}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _freeze(results: dict) -> dict:
+        return {name: tuple(tuple(match) for match in matches) for name, matches in results.items()}
+
+    @staticmethod
+    def _thaw(results: dict) -> dict:
+        return {name: list(matches) for name, matches in results.items()}
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self._thaw(self.memory[key][0])
+        if not self.cache_dir:
+            return None
+        disk_path = self._disk_path(key)
+        try:
+            with open(disk_path, 'r') as file:
+                text = file.read()
+            os.utime(disk_path)  # Recently used entries survive disk eviction longest
+        except OSError:
+            return None
+        try:
+            results = self._freeze(json.loads(text))
+        except (json.JSONDecodeError, AttributeError, TypeError):
+            return None
+        self._remember(key, results, len(text))
+        return self._thaw(results)
+
+    def put(self, key: str, results: dict):
+        text = json.dumps(results)
+        self._remember(key, self._freeze(results), len(text))
+        if not self.cache_dir:
+            return
+        disk_path = self._disk_path(key)
+        temp_path = f"{disk_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w') as file:
+                file.write(text)
+            os.replace(temp_path, disk_path)
+        except OSError as e:
+            print(f"Error writing cache entry {disk_path}. Details: {e}")
+            return
+        if self.max_disk_bytes is not None:
+            self._evict_disk()
+
+    def _remember(self, key: str, results: dict, size: int):
+        if size > self.max_memory_bytes:
+            return
+        with self.lock:
+            if key in self.memory:
+                self.memory_bytes -= self.memory.pop(key)[1]
+            self.memory[key] = (results, size)
+            self.memory_bytes += size
+            while self.memory_bytes > self.max_memory_bytes:
+                _, (_, evicted_size) = self.memory.popitem(last=False)
+                self.memory_bytes -= evicted_size
+
+    def _evict_disk(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.memory_bytes = 0
+        if self.cache_dir:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.json'):
+                    os.remove(entry.path)
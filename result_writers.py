@@ -0,0 +1,150 @@
+import io
+import csv
+import gzip
+import json
+import struct
+from abc import ABC, abstractmethod
+from typing import Optional, Iterator
+
+
+BINARY_MAGIC = b"TSRES1\n"
+# kind (0 file, 1 directory), path length, size string length
+BINARY_RECORD = struct.Struct('<BIH')
+KINDS = ('file', 'directory')
+
+FORMATS = ['ndjson', 'csv', 'binary']
+EXTENSIONS = {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv', '.bin': 'binary', '.tsres': 'binary'}
+
+
+def detect_format(output_file: str) -> tuple:
+    """(format, compressed) guessed from a file name like 'results.ndjson.gz'."""
+    name = output_file.lower()
+    compressed = name.endswith('.gz')
+    if compressed:
+        name = name[:-3]
+    for extension, format in EXTENSIONS.items():
+        if name.endswith(extension):
+            return format, compressed
+    return 'ndjson', compressed
+
+
+class ResultWriter(ABC):
+    """
+    Writes matches one at a time to a buffered (optionally gzipped) file, so memory use
+    does not grow with the number of results. Use as a context manager, or call close().
+    """
+
+    binary = False
+
+    def __init__(self, output_file: str, compress: bool = False, buffer_size: int = 1 << 20):
+        self.output_file = output_file
+        self.count = 0
+        self.handle = open(output_file, 'wb', buffering=buffer_size)
+        self.raw = self.handle
+        if compress:
+            # GzipFile compresses on every write call, so small records go through a buffer first
+            self.raw = io.BufferedWriter(gzip.GzipFile(fileobj=self.handle, mode='wb', compresslevel=6), buffer_size)
+        self.file = self.raw if self.binary else io.TextIOWrapper(self.raw, encoding='utf-8',
+                                                                 errors='surrogateescape', newline='')
+        self.write_header()
+
+    def write_header(self):
+        pass
+
+    def write(self, path: str, size: str, kind: str = 'file'):
+        self.write_record(path, size, kind)
+        self.count += 1
+
+    @abstractmethod
+    def write_record(self, path: str, size: str, kind: str):
+        """Write one match in the writer's format."""
+
+    def write_all(self, matches, kind: str = 'file') -> int:
+        # (path, size) pairs as stored in matching_files / matching_directories
+        for path, size in matches:
+            self.write(path, size, kind)
+        return self.count
+
+    def close(self):
+        self.file.close()
+        self.handle.close()  # GzipFile leaves the file object it wraps open
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NdjsonResultWriter(ResultWriter):
+    # One {"kind", "path", "size"} object per line
+    def write_record(self, path: str, size: str, kind: str):
+        self.file.write(json.dumps({"kind": kind, "path": path, "size": size}) + "\n")
+
+
+class CsvResultWriter(ResultWriter):
+    def write_header(self):
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['kind', 'path', 'size'])
+
+    def write_record(self, path: str, size: str, kind: str):
+        self.writer.writerow([kind, path, size])
+
+
+class BinaryResultWriter(ResultWriter):
+    # Magic line, then per match a fixed header followed by the UTF-8 path and size string
+    binary = True
+
+    def write_header(self):
+        self.file.write(BINARY_MAGIC)
+
+    def write_record(self, path: str, size: str, kind: str):
+        path_bytes = path.encode('utf-8', 'surrogateescape')
+        size_bytes = str(size).encode('utf-8')
+        self.file.write(BINARY_RECORD.pack(KINDS.index(kind), len(path_bytes), len(size_bytes)))
+        self.file.write(path_bytes)
+        self.file.write(size_bytes)
+
+
+WRITERS = {'ndjson': NdjsonResultWriter, 'csv': CsvResultWriter, 'binary': BinaryResultWriter}
+
+
+def open_result_writer(output_file: str, format: Optional[str] = None, compress: Optional[bool] = None,
+                       buffer_size: int = 1 << 20) -> ResultWriter:
+    """A writer for output_file; format and compression default to what the file name suggests."""
+    detected_format, detected_compress = detect_format(output_file)
+    format = format or detected_format
+    if format not in WRITERS:
+        raise ValueError(f"Unknown result format '{format}', expected one of {FORMATS}")
+    return WRITERS[format](output_file, detected_compress if compress is None else compress, buffer_size)
+
+
+def read_results(input_file: str, format: Optional[str] = None) -> Iterator[tuple]:
+    """Yield (path, size, kind) back from a file written by any of the writers."""
+    format = format or detect_format(input_file)[0]
+    with open(input_file, 'rb') as raw:
+        compressed = raw.read(2) == b'\x1f\x8b'
+    opener = gzip.open if compressed else open
+    if format == 'binary':
+        with opener(input_file, 'rb') as file:
+            if file.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+                raise ValueError(f"{input_file} is not a binary result file")
+            while True:
+                header = file.read(BINARY_RECORD.size)
+                if not header:
+                    return
+                kind, path_length, size_length = BINARY_RECORD.unpack(header)
+                path = file.read(path_length).decode('utf-8', 'surrogateescape')
+                size = file.read(size_length).decode('utf-8')
+                yield path, size, KINDS[kind]
+    with opener(input_file, 'rt', encoding='utf-8', errors='surrogateescape', newline='') as file:
+        if format == 'csv':
+            reader = csv.reader(file)
+            next(reader, None)
+            for kind, path, size in reader:
+                yield path, size, kind
+        else:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["path"], record["size"], record["kind"]
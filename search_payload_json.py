@@ -1,10 +1,11 @@
 import json
 import os
-import fnmatch
+
+from pattern_matcher import PatternMatcher
 
 # Define the search parameters
 search_path = "C:\\Users\\T14 Windows 11\\PycharmProjects\\path_tree\\devices"  # Full absolute path from the tree.json
-wildcard_pattern = "test_?"  # Wildcard pattern to search for in filenames or directories
+wildcard_patterns = ["test_?"]  # Wildcard patterns to search for in filenames or directories; a name may match any of them
 search_for = "files"  # Can be 'files', 'directories', or 'both'
 
 # Load the JSON data from a file with error handling
@@ -20,33 +21,35 @@ except json.JSONDecodeError:
     json_data = {}
 
 
-def search_files_recursively(node, wildcard_pattern, matching_files, matching_directories, search_for):
+def search_files_recursively(node, matcher, matching_files, matching_directories, search_for):
     """
     Recursively search for files and/or directories in the current node and all subdirectories
-    that match the wildcard pattern.
+    that match any of the wildcard patterns. Each match records the patterns it matched.
     """
     # Check files in the current node
     if search_for in ['files', 'both'] and 'files' in node:
         for file in node['files']:
             file_name, file_size = file
-            if fnmatch.fnmatch(file_name, wildcard_pattern):
+            matched = matcher.matched_patterns(file_name)
+            if matched:
                 absolute_file_path = os.path.join(node['absolute_path'], file_name)
-                matching_files.append((absolute_file_path, file_size))
+                matching_files.append((absolute_file_path, file_size, matched))
 
     # Check directories in the current node
     if search_for in ['directories', 'both'] and 'directories' in node:
         for directory in node['directories']:
             dir_name = directory[0]
             dir_size = directory[1]
-            # Check if directory matches the wildcard pattern
-            if fnmatch.fnmatch(dir_name, wildcard_pattern):
+            # Check if directory matches any of the wildcard patterns
+            matched = matcher.matched_patterns(dir_name)
+            if matched:
                 absolute_directory_path = os.path.join(node['absolute_path'], dir_name)
-                matching_directories.append((absolute_directory_path, dir_size))
+                matching_directories.append((absolute_directory_path, dir_size, matched))
 
             # Recursively search in subdirectories
             if dir_name in node:  # Ensure the directory node exists
                 dir_node = node[dir_name]
-                search_files_recursively(dir_node, wildcard_pattern, matching_files, matching_directories, search_for)
+                search_files_recursively(dir_node, matcher, matching_files, matching_directories, search_for)
 
 
 def find_node_by_absolute_path(node, search_path):
@@ -69,7 +72,7 @@ def find_node_by_absolute_path(node, search_path):
     return None
 
 
-def search_directory(data, search_path, wildcard_pattern, search_for):
+def search_directory(data, search_path, wildcard_patterns, search_for):
     # Begin the search within the "devices" node in the JSON
     if "devices" not in data:
         print("Error: 'devices' node not found in the JSON.")
@@ -84,7 +87,9 @@ def search_directory(data, search_path, wildcard_pattern, search_for):
     matching_directories = []
 
     if root:
-        search_files_recursively(root, wildcard_pattern, matching_files, matching_directories, search_for)
+        # All patterns are compiled once into one matcher instead of calling fnmatch per name and pattern
+        matcher = PatternMatcher(glob_patterns=wildcard_patterns)
+        search_files_recursively(root, matcher, matching_files, matching_directories, search_for)
     else:
         print(f"No matching node found for {search_path}")
 
@@ -93,21 +98,21 @@ def search_directory(data, search_path, wildcard_pattern, search_for):
 
 # Perform the search if json_data was successfully loaded
 if json_data:
-    matching_files, matching_directories = search_directory(json_data, search_path, wildcard_pattern, search_for)
+    matching_files, matching_directories = search_directory(json_data, search_path, wildcard_patterns, search_for)
 
     # Print matching directories and sizes
     if search_for in ['directories', 'both'] and matching_directories:
         print("Matching Directories:")
-        for dir_path, dir_size in matching_directories:
-            print(f"Directory: {dir_path}, Size: {dir_size}")
+        for dir_path, dir_size, matched in matching_directories:
+            print(f"Directory: {dir_path}, Size: {dir_size}, Patterns: {', '.join(matched)}")
     elif search_for == 'directories':
         print("No matching directories found.")
 
     # Print matching files and sizes
     if search_for in ['files', 'both'] and matching_files:
         print("\nMatching Files:")
-        for file_path, file_size in matching_files:
-            print(f"File: {file_path}, Size: {file_size}")
+        for file_path, file_size, matched in matching_files:
+            print(f"File: {file_path}, Size: {file_size}, Patterns: {', '.join(matched)}")
     elif search_for == 'files':
         print("No matching files found.")
 else:
@@ -0,0 +1,37 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional, Iterator
+
+from compact_tree import CompactTree
+
+
+class SizeIndex:
+    """
+    Entries of a CompactTree (files and directories) ordered by byte size, so size ranges
+    and largest-first queries are answered with bisect instead of a scan. Entries whose
+    size could not be parsed are kept out of the index.
+    """
+
+    def __init__(self, tree: CompactTree):
+        sizes = tree.sizes
+        order = sorted((entry for entry in range(1, len(tree)) if sizes[entry] >= 0), key=sizes.__getitem__)
+        self.entries = array('i', order)
+        self.sorted_sizes = array('q', (sizes[entry] for entry in order))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def positions(self, min_size: Optional[int] = None, max_size: Optional[int] = None) -> range:
+        """Positions in self.entries of the entries with min_size <= size <= max_size."""
+        low = 0 if min_size is None else bisect_left(self.sorted_sizes, min_size)
+        high = len(self.sorted_sizes) if max_size is None else bisect_right(self.sorted_sizes, max_size)
+        return range(low, max(low, high))
+
+    def entries_between(self, min_size: Optional[int] = None, max_size: Optional[int] = None) -> list:
+        positions = self.positions(min_size, max_size)
+        return list(self.entries[positions.start:positions.stop])
+
+    def largest_first(self, min_size: Optional[int] = None, max_size: Optional[int] = None) -> Iterator[int]:
+        """Entries in the size range, biggest first."""
+        for position in reversed(self.positions(min_size, max_size)):
+            yield self.entries[position]
@@ -0,0 +1,35 @@
+import re
+
+
+_SIZE_PATTERN = re.compile(r'^([0-9]*\.?[0-9]+)\s*([KMGTP]?)I?B?$')
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4, 'P': 1024 ** 5}
+
+
+def convert_size_to_bytes(size) -> int:
+    """Convert a size such as '500KB', '4.0K', '1GB' or '123' to a number of bytes."""
+    if isinstance(size, int):
+        return size
+    size = size.upper().strip()
+    match = _SIZE_PATTERN.match(size)
+    if not match:
+        raise ValueError(f"Unrecognised size: {size!r}")
+    number, unit = match.groups()
+    if '.' in number:
+        return int(float(number) * _UNITS[unit])
+    return int(number) * _UNITS[unit]
+
+
+def format_size(num_bytes: int) -> str:
+    """Inverse of convert_size_to_bytes for whole units: 512000 -> '500KB', 1000 -> '1000'."""
+    for unit, factor in (("TB", 1024 ** 4), ("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024)):
+        if num_bytes >= factor and num_bytes % factor == 0:
+            return f"{num_bytes // factor}{unit}"
+    return str(num_bytes)
+
+
+def format_size_human(num_bytes: int) -> str:
+    """Rounded size in the largest fitting unit, one decimal at most: 1572864 -> '1.5MB', 512 -> '512B'."""
+    for unit, factor in (("TB", 1024 ** 4), ("GB", 1024 ** 3), ("MB", 1024 ** 2), ("KB", 1024)):
+        if num_bytes >= factor:
+            return f"{num_bytes / factor:.1f}".rstrip('0').rstrip('.') + unit
+    return f"{num_bytes}B"
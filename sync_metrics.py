@@ -0,0 +1,108 @@
+import json
+import time
+import threading
+from collections import defaultdict
+from typing import Optional
+
+
+# git subcommand -> report phase
+PHASES = {
+    'clone': 'clone',
+    'fetch': 'fetch',
+    'ls-remote': 'fetch',
+    'remote': 'fetch',
+    'checkout': 'checkout',
+    'update-ref': 'checkout',
+    'pull': 'pull',
+    'submodule': 'submodule',
+    'status': 'status',
+}
+PHASE_ORDER = ('clone', 'fetch', 'checkout', 'pull', 'submodule', 'status', 'other')
+
+
+def command_phase(args: list, in_submodule: bool = False) -> str:
+    # Everything run inside a submodule checkout counts as submodule work
+    if in_submodule:
+        return 'submodule'
+    subcommand = next((arg for arg in args[1:] if not arg.startswith('-')), '')
+    return PHASES.get(subcommand, 'other')
+
+
+class SyncMetrics:
+    """
+    Spans for every git command attempt (repository, submodule path, phase, wall time, time
+    spent waiting for a concurrency slot, exit code, attempt number, backoff slept before it,
+    bytes of output) and for every repository, kept for report() and, with spans_file,
+    appended to it as JSON lines as they happen. Thread-safe, so the threaded manager can
+    share it too.
+    """
+
+    def __init__(self, spans_file: Optional[str] = None):
+        self.spans_file = spans_file
+        self.commands = []
+        self.repositories = []
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.file = open(spans_file, 'a', buffering=1) if spans_file else None
+
+    def _emit(self, span: dict):
+        if self.file is not None:
+            self.file.write(json.dumps(span) + '\n')
+
+    def record_command(self, **span):
+        span = dict(span, type='command', time=time.time())
+        with self.lock:
+            self.commands.append(span)
+            self._emit(span)
+
+    def record_repository(self, repository: str, duration: float, status: str):
+        span = {'type': 'repository', 'time': time.time(), 'repository': repository, 'duration': duration,
+                'status': status}
+        with self.lock:
+            self.repositories.append(span)
+            self._emit(span)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def report(self, top: int = 10) -> str:
+        """End-of-run summary: per-phase totals, retries and backoff, slowest repositories and commands."""
+        with self.lock:
+            commands = list(self.commands)
+            repositories = list(self.repositories)
+        wall = time.monotonic() - self.started
+        lines = [f"Sync report: {len(repositories)} repositories in {wall:.1f}s, {len(commands)} git commands "
+                 f"({sum(span['duration'] for span in commands):.1f}s of command time)"]
+
+        phases = defaultdict(lambda: [0, 0.0, 0.0, 0])  # count, total, max, output bytes
+        for span in commands:
+            phase = phases[span['phase']]
+            phase[0] += 1
+            phase[1] += span['duration']
+            phase[2] = max(phase[2], span['duration'])
+            phase[3] += span['output_bytes']
+        lines.append(f"  {'phase':<10} {'commands':>8} {'total s':>9} {'max s':>8} {'output':>10}")
+        for name in PHASE_ORDER:
+            if name in phases:
+                count, total, longest, output = phases[name]
+                lines.append(f"  {name:<10} {count:>8} {total:>9.1f} {longest:>8.1f} {output:>10}")
+
+        retried = [span for span in commands if span['attempt'] > 1]
+        failed_attempts = [span for span in commands if span['status'] != 'ok' and span['status'] != 'cancelled']
+        lines.append(f"Retries: {len(retried)} retried attempts, {sum(span['duration'] for span in failed_attempts):.1f}s "
+                     f"in failed attempts, {sum(span['backoff'] for span in commands):.1f}s in backoff")
+        lines.append(f"Waiting for a concurrency slot: {sum(span['wait'] for span in commands):.1f}s in total")
+
+        if repositories:
+            lines.append("Slowest repositories:")
+            for span in sorted(repositories, key=lambda span: span['duration'], reverse=True)[:top]:
+                lines.append(f"  {span['duration']:>8.1f}s  {span['repository']} ({span['status']})")
+        if commands:
+            lines.append("Slowest commands:")
+            for span in sorted(commands, key=lambda span: span['duration'], reverse=True)[:top]:
+                lines.append(f"  {span['duration']:>8.1f}s  {span['command']} [{span['path'] or span['repository']}] "
+                             f"({span['status']}, attempt {span['attempt']})")
+        return '\n'.join(lines)
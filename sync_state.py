@@ -0,0 +1,74 @@
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+
+class SyncStateStore:
+    """
+    Durable sync state per repository and submodule: URL, branch, the commit it was synced
+    to, the remote head seen at the time, how long it took and the outcome. Replaces the
+    processed_repos.json list of names, which could only skip a repository forever or not at
+    all. Stored in SQLite in WAL mode; every repository is committed as soon as it finishes,
+    so a crash loses at most the repositories still in flight, and several processes can
+    share one state file.
+    """
+
+    COLUMNS = ('path', 'parent', 'url', 'branch', 'synced_sha', 'remote_sha', 'duration', 'outcome', 'error',
+               'updated_at')
+
+    def __init__(self, state_file: str = 'sync_state.db'):
+        self.state_file = state_file
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(state_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                url TEXT,
+                branch TEXT,
+                synced_sha TEXT,
+                remote_sha TEXT,
+                duration REAL,
+                outcome TEXT,
+                error TEXT,
+                updated_at REAL
+            )""")
+
+    def get(self, path: str) -> Optional[dict]:
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM sync_state WHERE path = ?", (path,)).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def record_many(self, records: list):
+        """Write a repository and its submodules in one transaction."""
+        now = time.time()
+        rows = [tuple(record.get(column) for column in self.COLUMNS[:-1]) + (now,) for record in records]
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so concurrent writers queue instead of failing mid-way
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany(
+                    f"INSERT OR REPLACE INTO sync_state ({', '.join(self.COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * len(self.COLUMNS))})", rows)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def record(self, path: str, **fields):
+        self.record_many([dict(fields, path=path)])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def is_in_sync(record: Optional[dict], url: Optional[str], branch: str) -> bool:
+    # Last sync succeeded, for the same URL and branch, and left the branch at the remote head
+    return (record is not None and record['outcome'] == 'ok' and record['url'] == url
+            and record['branch'] == branch and record['synced_sha'] is not None
+            and record['synced_sha'] == record['remote_sha'])
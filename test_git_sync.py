@@ -0,0 +1,88 @@
+import time
+import asyncio
+import unittest
+from unittest import mock
+
+from git_sync import AsyncGitSync, JobQueue, is_transient_error
+
+
+class ScriptedGitSync(AsyncGitSync):
+    # Answers commands from a list of (returncode, stdout, stderr) instead of running git
+    def __init__(self, outcomes: list, **options):
+        super().__init__(**options)
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def _execute(self, args, cwd, timeout, span=None):
+        self.calls += 1
+        return self.outcomes.pop(0)
+
+
+def run(sync: AsyncGitSync, args: list):
+    async def main():
+        sync.command_slots = asyncio.Semaphore(sync.max_concurrency)
+        return await sync.run_command(args, host='example.com')
+    with mock.patch('git_sync.asyncio.sleep', mock.AsyncMock()):
+        return asyncio.run(main())
+
+
+class RetryTest(unittest.TestCase):
+    def test_network_fatal_error_is_retried(self):
+        sync = ScriptedGitSync([(128, '', 'fatal: the remote end hung up unexpectedly'),
+                                (128, '', "fatal: unable to access 'https://example.com/r.git/': "
+                                          "Could not resolve host: example.com"),
+                                (0, 'done', '')], retries=3)
+        self.assertEqual(run(sync, ['git', 'fetch', 'origin']), 'done')
+        self.assertEqual(sync.calls, 3)
+
+    def test_permanent_error_is_not_retried(self):
+        sync = ScriptedGitSync([(128, '', "fatal: repository 'https://example.com/r.git/' not found"),
+                                (0, 'done', '')], retries=3)
+        self.assertIsNone(run(sync, ['git', 'fetch', 'origin']))
+        self.assertEqual(sync.calls, 1)
+
+    def test_classification(self):
+        self.assertTrue(is_transient_error('fatal: early EOF'))
+        self.assertTrue(is_transient_error('error: RPC failed; curl 56 Recv failure: Connection reset by peer'))
+        self.assertFalse(is_transient_error("fatal: unable to access 'https://example.com/r.git/': "
+                                            "The requested URL returned error: 403"))
+        self.assertFalse(is_transient_error("fatal: couldn't find remote ref release"))
+
+
+class JobQueueTest(unittest.TestCase):
+    def test_cancelling_the_submitter_kills_a_running_job(self):
+        async def main():
+            sync = AsyncGitSync(retries=1)
+            sync.command_slots = asyncio.Semaphore(1)
+            queue = JobQueue(1)
+            queue.start()
+            submitter = asyncio.ensure_future(queue.submit(lambda: sync.run_command(['sleep', '30'])))
+            await asyncio.sleep(0.2)
+            started = time.monotonic()
+            submitter.cancel()
+            await asyncio.gather(submitter, return_exceptions=True)
+            # The worker is free again once the killed job has finished
+            self.assertEqual(await queue.submit(lambda: asyncio.sleep(0, 'next')), 'next')
+            await queue.close()
+            return time.monotonic() - started
+        self.assertLess(asyncio.run(main()), 5)
+
+    def test_job_cancelled_from_inside_resolves_its_future(self):
+        async def cancelled_job():
+            raise asyncio.CancelledError()
+
+        async def main():
+            queue = JobQueue(1)
+            queue.start()
+            first = queue.submit(cancelled_job)
+            second = queue.submit(lambda: asyncio.sleep(0, 'second'))
+            results = await asyncio.wait_for(asyncio.gather(first, second, return_exceptions=True), 5)
+            await queue.close()
+            return results
+        first, second = asyncio.run(main())
+        self.assertIsInstance(first, asyncio.CancelledError)
+        self.assertEqual(second, 'second')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import json
+import tempfile
+import unittest
+
+from interim_file_latest import TreeSearcher
+from query_cache import QueryCache
+
+
+TREE = {
+    "devices": {
+        "absolute_path": "/devices",
+        "directories": [["logs", "30KB"]],
+        "files": [["test_a", "10KB"]],
+        "logs": {
+            "absolute_path": "/devices/logs",
+            "directories": [],
+            "files": [["test_b", "20KB"], ["other", "10KB"]],
+        },
+    }
+}
+
+
+class QueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tree_file = os.path.join(self.directory.name, "path_tree.json")
+        with open(self.tree_file, 'w') as file:
+            json.dump(TREE, file)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def searcher(self, cache: QueryCache) -> TreeSearcher:
+        return TreeSearcher(self.tree_file, "/devices", "test_", use_path_index=False, cache=cache)
+
+    def test_two_searches_on_one_searcher(self):
+        # The second search hits the entry the first one stored; it must not alias the searcher's own lists
+        searcher = self.searcher(QueryCache())
+        searcher.search_directory()
+        searcher.search_directory()
+        expected = [("/devices/test_a", "10KB"), ("/devices/logs/test_b", "20KB")]
+        self.assertEqual(sorted(searcher.matching_files), sorted(expected * 2))
+
+    def test_caller_changes_do_not_reach_the_cache(self):
+        cache = QueryCache()
+        first = self.searcher(cache)
+        first.search_directory()
+        first.matching_files.append(("/devices/extra", "1KB"))
+        second = self.searcher(cache)
+        second.search_directory()
+        self.assertEqual(len(second.matching_files), 2)
+        self.assertNotIn(("/devices/extra", "1KB"), second.matching_files)
+
+    def test_disk_tier_returns_tuples(self):
+        cache_dir = os.path.join(self.directory.name, "cache")
+        self.searcher(QueryCache(cache_dir=cache_dir)).search_directory()
+        searcher = self.searcher(QueryCache(cache_dir=cache_dir))
+        searcher.search_directory()
+        self.assertFalse(searcher.loaded)  # answered from disk without loading the tree
+        self.assertIn(("/devices/test_a", "10KB"), searcher.matching_files)
+
+    def test_trees_with_the_same_mtime_and_size(self):
+        # A same-size tree with other names and the same mtime, as 'cp -p' or a coarse-mtime filesystem leaves it
+        other_file = os.path.join(self.directory.name, "other_tree.json")
+        with open(other_file, 'w') as file:
+            file.write(json.dumps(TREE).replace("test_a", "test_z"))
+        stat = os.stat(self.tree_file)
+        os.utime(other_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(os.path.getsize(other_file), stat.st_size)
+
+        cache = QueryCache()
+        self.searcher(cache).search_directory()
+        other = TreeSearcher(other_file, "/devices", "test_", use_path_index=False, cache=cache)
+        other.search_directory()
+        self.assertIn(("/devices/test_z", "10KB"), other.matching_files)
+        self.assertNotIn(("/devices/test_a", "10KB"), other.matching_files)
+
+
+if __name__ == "__main__":
+    unittest.main()
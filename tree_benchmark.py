@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+import io
+import tempfile
+import tracemalloc
+from typing import Optional, Callable, List
+
+from interim_file_latest import TreeSearcher
+from path_tree_with_os import PathTreeCrawler
+from size_utils import format_size
+from tree_stream_writer import StreamingTreeWriter
+
+
+FILE_PREFIXES = ['log', 'document', 'data', 'readme', 'test', 'report', 'image', 'backup', 'notes', 'outline']
+FILE_EXTENSIONS = ['.txt', '.log', '.pdf', '.doc', '.docx', '.csv', '.json', '.jpg', '.py', '']
+EXTENSION_WEIGHTS = [20, 15, 10, 8, 4, 10, 8, 10, 10, 5]
+DIRECTORY_PREFIXES = ['devices', 'subtest', 'level', 'data', 'test', 'archive']
+SIZE_UNITS = [('TB', 1024 ** 4), ('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024)]
+
+NAME_DISTRIBUTIONS = ['mixed', 'random', 'sequential']
+SIZE_DISTRIBUTIONS = ['lognormal', 'uniform', 'fixed']
+
+
+def size_string(num_bytes: int) -> str:
+    # Round to the largest whole unit, the way path_tree.json sizes look ('500KB', '100MB')
+    for _, factor in SIZE_UNITS:
+        if num_bytes >= factor:
+            return format_size(round(num_bytes / factor) * factor)
+    return format_size(num_bytes)
+
+
+class TreeGenerator:
+    """
+    Deterministic generator for path_tree.json-shaped trees. Every directory node has
+    `fanout` sub-directories down to `depth` levels, and `files` files are spread evenly
+    over all nodes. The JSON is written node by node with an explicit stack, so neither
+    the number of entries nor the depth is limited by memory or the recursion limit.
+    Directory sizes are drawn like file sizes and scaled, not summed from their contents.
+    """
+
+    def __init__(self, depth: int = 4, fanout: int = 4, files: int = 10000, seed: int = 0,
+                 name_distribution: str = "mixed", size_distribution: str = "lognormal",
+                 root_path: str = "/bench/devices"):
+        if name_distribution not in NAME_DISTRIBUTIONS:
+            raise ValueError(f"name_distribution must be one of {NAME_DISTRIBUTIONS}")
+        if size_distribution not in SIZE_DISTRIBUTIONS:
+            raise ValueError(f"size_distribution must be one of {SIZE_DISTRIBUTIONS}")
+        self.depth = depth
+        self.fanout = fanout
+        self.files = files
+        self.seed = seed
+        self.name_distribution = name_distribution
+        self.size_distribution = size_distribution
+        self.root_path = root_path
+        self.node_count = sum(fanout ** level for level in range(depth + 1))
+
+    def config(self) -> dict:
+        return {
+            "depth": self.depth,
+            "fanout": self.fanout,
+            "files": self.files,
+            "seed": self.seed,
+            "name_distribution": self.name_distribution,
+            "size_distribution": self.size_distribution,
+            "root_path": self.root_path,
+        }
+
+    def file_name(self, rng: random.Random, index: int) -> str:
+        if self.name_distribution == "sequential":
+            return f"file_{index}.dat"
+        extension = rng.choices(FILE_EXTENSIONS, EXTENSION_WEIGHTS)[0]
+        if self.name_distribution == "random":
+            length = rng.randint(6, 16)
+            return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789_') for _ in range(length)) + extension
+        return f"{rng.choice(FILE_PREFIXES)}_{rng.randint(0, 999999)}{extension}"
+
+    def file_size(self, rng: random.Random) -> int:
+        if self.size_distribution == "fixed":
+            return 500 * 1024
+        if self.size_distribution == "uniform":
+            return rng.randint(0, 100 * 1024 ** 2)
+        return min(int(rng.lognormvariate(10, 2.5)), 1024 ** 4)
+
+    def write(self, output_file: str) -> dict:
+        """Write the tree to output_file and return counts plus the path of the deepest node."""
+        rng = random.Random(self.seed)
+        files_per_node, extra_files = divmod(self.files, self.node_count)
+        stats = {"nodes": 0, "files": 0, "directories": 0, "deepest_path": self.root_path}
+        dumps = json.dumps
+
+        with open(output_file, 'w', buffering=1 << 20) as out:
+
+            def open_node(path: str, level: int):
+                node_index = stats["nodes"]
+                stats["nodes"] += 1
+                if level > stats.get("deepest_level", -1):
+                    stats["deepest_level"] = level
+                    stats["deepest_path"] = path
+                directories = []
+                if level < self.depth:
+                    for i in range(self.fanout):
+                        name = f"{DIRECTORY_PREFIXES[(level + i) % len(DIRECTORY_PREFIXES)]}_{i + 1}"
+                        directories.append([name, size_string(self.file_size(rng) * 10)])
+                file_count = files_per_node + (1 if node_index < extra_files else 0)
+                files = [[self.file_name(rng, stats["files"] + i), size_string(self.file_size(rng))]
+                         for i in range(file_count)]
+                stats["files"] += file_count
+                stats["directories"] += len(directories)
+                out.write('{"absolute_path": ' + dumps(path) + ', "directories": ' + dumps(directories)
+                          + ', "files": ' + dumps(files))
+                return iter([name for name, _ in directories])
+
+            out.write('{"devices": ')
+            stack = [(self.root_path, 0, open_node(self.root_path, 0))]
+            while stack:
+                path, level, children = stack[-1]
+                for name in children:
+                    out.write(', ' + dumps(name) + ': ')
+                    child_path = path + '/' + name
+                    stack.append((child_path, level + 1, open_node(child_path, level + 1)))
+                    break
+                else:
+                    out.write('}')
+                    stack.pop()
+            out.write('}\n')
+
+        stats["bytes"] = os.path.getsize(output_file)
+        return stats
+
+    def write_directory(self, root: str) -> dict:
+        """
+        Create the same shape of tree on disk under root, for the tree builder benchmarks.
+        Files are created empty: listing and stat cost does not depend on a file's size.
+        """
+        rng = random.Random(self.seed)
+        files_per_node, extra_files = divmod(self.files, self.node_count)
+        stats = {"nodes": 0, "files": 0}
+        stack = [(root, 0)]
+        while stack:
+            path, level = stack.pop()
+            os.makedirs(path, exist_ok=True)
+            file_count = files_per_node + (1 if stats["nodes"] < extra_files else 0)
+            stats["nodes"] += 1
+            for i in range(file_count):
+                with open(os.path.join(path, self.file_name(rng, stats["files"] + i)), 'w'):
+                    pass
+            stats["files"] += file_count
+            if level < self.depth:
+                for i in range(self.fanout):
+                    name = f"{DIRECTORY_PREFIXES[(level + i) % len(DIRECTORY_PREFIXES)]}_{i + 1}"
+                    stack.append((os.path.join(path, name), level + 1))
+        return stats
+
+
+def measure(name: str, operation: Callable, setup: Optional[Callable] = None, repeat: int = 3,
+            memory: bool = True) -> dict:
+    """
+    Time operation() `repeat` times, calling setup() untimed before each run. With memory,
+    one extra run happens under tracemalloc to record the peak allocation, since tracing
+    slows the timed runs down too much to do both at once.
+    """
+    runs = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = operation()
+        runs.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            operation()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "name": name,
+        "runs": runs,
+        "min_seconds": min(runs),
+        "median_seconds": statistics.median(runs),
+        "peak_memory_bytes": peak,
+        "result_count": len(result) if isinstance(result, (list, tuple)) else None,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(json_file_path: str, tree_stats: dict, regex_pattern: str = r'.*\.pdf$', repeat: int = 3,
+                   memory: bool = True, file_size_filter: int = 1024 * 1024) -> List[dict]:
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Not loaded by the constructor, so load_json() can be timed on its own
+        searcher = TreeSearcher(json_file_path, tree_stats["root_path"], regex_pattern, use_path_index=False,
+                                lazy_load=True)
+    results = []
+
+    def load():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return searcher.load_json()
+
+    results.append(measure("load_json", load, repeat=repeat, memory=memory))
+    searcher.json_data = load()
+    searcher.loaded = True
+    devices_node = searcher.json_data["devices"]
+
+    deepest = tree_stats["deepest_path"]
+    results.append(measure("find_node_by_absolute_path",
+                           lambda: searcher.find_node_by_absolute_path(devices_node, deepest),
+                           repeat=repeat, memory=memory))
+
+    def reset():
+        searcher.matching_files = []
+        searcher.matching_directories = []
+
+    for search_for in ['files', 'directories', 'both']:
+        def search(search_for=search_for):
+            searcher.search_for = search_for
+            searcher.search_files_recursively(devices_node)
+            return searcher.matching_files + searcher.matching_directories
+        results.append(measure(f"search_files_recursively[{search_for}]", search, reset,
+                               repeat=repeat, memory=memory))
+
+    searcher.search_for = 'files'
+    reset()
+    searcher.search_files_recursively(devices_node)
+    matches = list(searcher.matching_files)
+    searcher.file_size_filter = file_size_filter
+
+    def restore_matches():
+        searcher.matching_files = list(matches)
+
+    def apply_filters():
+        searcher.apply_filters()
+        return searcher.matching_files
+
+    results.append(measure("apply_filters", apply_filters, restore_matches, repeat=repeat, memory=memory))
+
+    restore_matches()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_file = os.path.join(temp_dir, "results.json")
+
+        def save():
+            with contextlib.redirect_stdout(io.StringIO()):
+                searcher.save_results(output_file)
+            return searcher.matching_files
+
+        results.append(measure("save_results", save, repeat=repeat, memory=memory))
+    return results
+
+
+def run_builder_benchmarks(directory: str, workers: List[int], repeat: int = 3, memory: bool = True) -> List[dict]:
+    # Building the tree from disk: the threaded crawler at each worker count, and the streaming writer
+    results = []
+    for max_workers in workers:
+        def crawl(max_workers=max_workers):
+            with contextlib.redirect_stdout(io.StringIO()):
+                PathTreeCrawler(max_workers).crawl(directory)
+        results.append(measure(f"create_path_tree[workers={max_workers}]", crawl, repeat=repeat, memory=memory))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_file = os.path.join(temp_dir, "path_tree.json")
+
+        def stream():
+            with contextlib.redirect_stdout(io.StringIO()):
+                StreamingTreeWriter(output_file).write(directory)
+        results.append(measure("stream_path_tree", stream, repeat=repeat, memory=memory))
+    return results
+
+
+def compare(current: dict, baseline: dict):
+    baseline_results = {result["name"]: result for result in baseline.get("results", [])}
+    print(f"{'benchmark':40} {'baseline s':>12} {'current s':>12} {'ratio':>8}")
+    for result in current["results"]:
+        old = baseline_results.get(result["name"])
+        if old is None:
+            print(f"{result['name']:40} {'-':>12} {result['median_seconds']:12.4f} {'-':>8}")
+            continue
+        ratio = result["median_seconds"] / old["median_seconds"] if old["median_seconds"] else float('inf')
+        print(f"{result['name']:40} {old['median_seconds']:12.4f} {result['median_seconds']:12.4f} {ratio:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TreeSearcher on a generated path_tree.json, and the "
+                                                 "tree builders on a generated directory.")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--names", choices=NAME_DISTRIBUTIONS, default="mixed")
+    parser.add_argument("--sizes", choices=SIZE_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--pattern", default=r'.*\.pdf$')
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak-memory runs")
+    parser.add_argument("--tree", help="Write the generated tree here and keep it (default: a temp file)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--builder-files", type=int, default=10000,
+                        help="Files in the on-disk tree for the tree builder benchmarks (0 to skip them)")
+    parser.add_argument("--workers", default="1,4,16,32", help="Crawler worker counts to benchmark, comma-separated")
+    args = parser.parse_args()
+
+    generator = TreeGenerator(args.depth, args.fanout, args.files, args.seed, args.names, args.sizes)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        tree_file = args.tree or os.path.join(temp_dir, "tree.json")
+        start = time.perf_counter()
+        tree_stats = generator.write(tree_file)
+        tree_stats["generate_seconds"] = time.perf_counter() - start
+        tree_stats["root_path"] = generator.root_path
+        print(f"Generated {tree_stats['files']} files in {tree_stats['nodes']} directories "
+              f"({tree_stats['bytes']} bytes) in {tree_stats['generate_seconds']:.2f}s")
+
+        results = run_benchmarks(tree_file, tree_stats, args.pattern, args.repeat, not args.no_memory)
+
+        if args.builder_files > 0:
+            builder = TreeGenerator(args.depth, args.fanout, args.builder_files, args.seed, args.names, args.sizes)
+            directory = os.path.join(temp_dir, "devices")
+            directory_stats = builder.write_directory(directory)
+            print(f"Created {directory_stats['files']} files in {directory_stats['nodes']} directories on disk")
+            workers = [int(count) for count in args.workers.split(',') if count.strip()]
+            results.extend(run_builder_benchmarks(directory, workers, args.repeat, not args.no_memory))
+            tree_stats["builder"] = dict(directory_stats, config=builder.config())
+
+    report = {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "generator": generator.config(),
+        "tree": tree_stats,
+        "pattern": args.pattern,
+        "results": results,
+    }
+    for result in results:
+        peak = result["peak_memory_bytes"]
+        print(f"{result['name']:40} median {result['median_seconds']:.4f}s"
+              + (f", peak {peak / 1024 ** 2:.1f} MiB" if peak is not None else ""))
+    try:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=4)
+        print(f"Results saved to {args.output}")
+    except IOError as e:
+        print(f"Error saving results to {args.output}. Details: {e}")
+
+    if args.compare:
+        try:
+            with open(args.compare, 'r') as file:
+                compare(report, json.load(file))
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"Error reading {args.compare}. Details: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+from typing import Optional, List
+
+
+INDEX_VERSION = 1
+
+
+def tree_fingerprint(json_file_path: str, use_hash: bool = False) -> dict:
+    """Return a cheap identity for a tree file (mtime and size, plus sha256 when requested)."""
+    stat = os.stat(json_file_path)
+    fingerprint = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if use_hash:
+        digest = hashlib.sha256()
+        with open(json_file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        fingerprint["sha256"] = digest.hexdigest()
+    return fingerprint
+
+
+def index_path_for(json_file_path: str) -> str:
+    """Location of the path index sidecar that belongs to a tree file."""
+    return json_file_path + ".pathidx"
+
+
+class PathIndex:
+    """
+    Maps every node's absolute_path to its parent's absolute_path and to the key the
+    node is stored under in the parent, so a node can be resolved without walking the tree.
+    """
+
+    def __init__(self, entries: dict):
+        self.entries = entries  # absolute_path -> [parent_absolute_path, key_in_parent]
+
+    @classmethod
+    def build(cls, devices_node: dict) -> "PathIndex":
+        """Walk the tree once (pre-order, same order as find_node_by_absolute_path)."""
+        entries = {}
+        stack = [(devices_node, None, None)]
+        while stack:
+            node, parent_path, key = stack.pop()
+            if not isinstance(node, dict):
+                continue
+            absolute_path = node.get('absolute_path')
+            if absolute_path is not None and absolute_path not in entries:
+                entries[absolute_path] = [parent_path, key]
+            children = []
+            for directory in node.get('directories', []):
+                dir_name = directory[0]
+                if isinstance(node.get(dir_name), dict):
+                    children.append((node[dir_name], absolute_path, dir_name))
+            stack.extend(reversed(children))
+        return cls(entries)
+
+    def parent(self, absolute_path: str) -> Optional[str]:
+        entry = self.entries.get(absolute_path)
+        return entry[0] if entry else None
+
+    def route(self, absolute_path: str) -> Optional[List[str]]:
+        """Keys to follow from the devices node down to the node with this absolute path."""
+        if absolute_path not in self.entries:
+            return None
+        route = []
+        parent_path, key = self.entries[absolute_path]
+        while parent_path is not None:
+            route.append(key)
+            parent_path, key = self.entries[parent_path]
+        route.reverse()
+        return route
+
+    def find(self, devices_node: dict, absolute_path: str) -> Optional[dict]:
+        """Resolve a node in the loaded tree; returns None if the path is unknown or stale."""
+        route = self.route(absolute_path)
+        if route is None:
+            return None
+        node = devices_node
+        for key in route:
+            node = node.get(key) if isinstance(node, dict) else None
+        if isinstance(node, dict) and node.get('absolute_path') == absolute_path:
+            return node
+        return None
+
+    def save(self, index_file: str, fingerprint: dict):
+        temp_file = index_file + ".tmp"
+        try:
+            with open(temp_file, 'w') as file:
+                json.dump({"version": INDEX_VERSION, "fingerprint": fingerprint, "entries": self.entries}, file)
+            os.replace(temp_file, index_file)
+        except OSError as e:
+            print(f"Error saving path index to {index_file}. Details: {e}")
+
+    @classmethod
+    def load(cls, index_file: str, fingerprint: dict) -> Optional["PathIndex"]:
+        """Load a saved index, or return None if it is missing or was built for a different tree."""
+        try:
+            with open(index_file, 'r') as file:
+                data = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if data.get("version") != INDEX_VERSION or data.get("fingerprint") != fingerprint:
+            return None
+        return cls(data.get("entries", {}))
+
+
+def load_or_build_path_index(json_file_path: str, devices_node: dict, use_hash: bool = False) -> PathIndex:
+    """Reuse the sidecar index while the tree file is unchanged, otherwise rebuild and save it."""
+    index_file = index_path_for(json_file_path)
+    try:
+        fingerprint = tree_fingerprint(json_file_path, use_hash=use_hash)
+    except OSError:
+        return PathIndex.build(devices_node)
+    if use_hash:
+        # Content hash is authoritative; a touched but identical file keeps its index.
+        fingerprint = {"sha256": fingerprint["sha256"]}
+
+    path_index = PathIndex.load(index_file, fingerprint)
+    if path_index is None:
+        path_index = PathIndex.build(devices_node)
+        path_index.save(index_file, fingerprint)
+    return path_index
@@ -0,0 +1,325 @@
+import os
+import re
+import copy
+import json
+import socket
+import argparse
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List
+
+from interim_file_latest import TreeSearcher, print_results
+from name_index import NameIndex
+from size_utils import convert_size_to_bytes
+from tree_index import tree_fingerprint
+
+
+class ResidentTree:
+    """
+    One tree.json kept loaded as a compact TreeSearcher with its indexes built up front.
+    Every request works on a shallow copy of that searcher, so concurrent requests share
+    the read-only tree and indexes but never each other's results. A reload builds a new
+    searcher next to the old one and swaps it in; requests already running finish on the
+    old one.
+    """
+
+    def __init__(self, json_file_path: str, use_name_index: bool = True):
+        self.json_file_path = os.path.abspath(json_file_path)
+        self.use_name_index = use_name_index
+        self.searcher: Optional[TreeSearcher] = None
+        self.fingerprint: Optional[dict] = None
+        self.reload_lock = threading.Lock()
+        self.reload()
+
+    def reload(self) -> bool:
+        with self.reload_lock:
+            try:
+                fingerprint = tree_fingerprint(self.json_file_path)
+            except OSError as e:
+                print(f"Error: Cannot read {self.json_file_path}. Details: {e}")
+                return False
+            if fingerprint == self.fingerprint:
+                return False
+            searcher = TreeSearcher(
+                json_file_path=self.json_file_path,
+                search_path="",
+                regex_pattern=r'.*',
+                use_path_index=False,
+                representation="compact",
+                use_name_index=self.use_name_index,
+            )
+            # Remember the version even when it fails to load, so a broken file is not retried on every poll
+            self.fingerprint = fingerprint
+            tree = searcher.compact_tree
+            if tree is None:
+                print(f"Error: Keeping the previous version of {self.json_file_path}.")
+                return False
+            searcher.search_path = tree.root_path
+            # Build everything lazily-built up front, so request threads only ever read shared state
+            tree.preorder()
+            searcher.get_size_index()
+            if self.use_name_index:
+                searcher.name_index = NameIndex(tree)
+            self.searcher = searcher
+            print(f"Loaded {self.json_file_path} ({len(tree)} entries)")
+            return True
+
+    @property
+    def root_path(self) -> Optional[str]:
+        searcher = self.searcher
+        return searcher.compact_tree.root_path if searcher is not None else None
+
+    def covers(self, search_path: str) -> bool:
+        root_path = self.root_path
+        if root_path is None:
+            return False
+        separator = self.searcher.compact_tree.separator
+        return search_path == root_path or search_path.startswith(root_path.rstrip(separator) + separator)
+
+    def query(self, request: dict) -> dict:
+        base = self.searcher
+        if base is None:
+            raise ValueError(f"{self.json_file_path} is not loaded")
+        searcher = copy.copy(base)
+        searcher.search_path = request.get("search_path") or base.search_path
+        glob_patterns = request.get("glob_patterns")
+        regex_pattern = request.get("regex_pattern") or (None if glob_patterns else r'.*')
+        searcher.regex_pattern = TreeSearcher.compile_pattern(regex_pattern, request.get("flags") or 0, glob_patterns)
+        searcher.search_for = request.get("search_for") or "files"
+        searcher.max_depth = request.get("max_depth")
+        searcher.file_size_filter = request.get("file_size_filter")
+        min_size, max_size = request.get("min_size"), request.get("max_size")
+        searcher.min_size = None if min_size is None else convert_size_to_bytes(min_size)
+        searcher.max_size = None if max_size is None else convert_size_to_bytes(max_size)
+        searcher.matching_files = []
+        searcher.matching_directories = []
+        searcher.search_directory()
+        searcher.apply_filters()
+        return {
+            "tree": self.json_file_path,
+            "search_path": searcher.search_path,
+            "search_for": searcher.search_for,
+            "matching_files": searcher.matching_files,
+            "matching_directories": searcher.matching_directories,
+        }
+
+
+class TreeQueryService:
+    """The resident trees plus a watcher thread that reloads any of them whose file changed."""
+
+    def __init__(self, json_file_paths: List[str], reload_interval: float = 2.0, use_name_index: bool = True):
+        self.trees = [ResidentTree(path, use_name_index) for path in json_file_paths]
+        self.reload_interval = reload_interval
+        self.stopped = threading.Event()
+        self.watcher = threading.Thread(target=self.watch, name="tree-reload", daemon=True)
+
+    def start(self):
+        if self.reload_interval:
+            self.watcher.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def watch(self):
+        while not self.stopped.wait(self.reload_interval):
+            for tree in self.trees:
+                tree.reload()
+
+    def select_tree(self, request: dict) -> ResidentTree:
+        name = request.get("tree")
+        if name:
+            for tree in self.trees:
+                if name in (tree.json_file_path, os.path.basename(tree.json_file_path)) \
+                        or os.path.abspath(name) == tree.json_file_path:
+                    return tree
+            raise ValueError(f"Unknown tree: {name}")
+        search_path = request.get("search_path")
+        if len(self.trees) == 1 or not search_path:
+            return self.trees[0]
+        for tree in self.trees:
+            if tree.covers(search_path):
+                return tree
+        raise ValueError(f"No loaded tree contains {search_path}")
+
+    def handle(self, request: dict) -> dict:
+        if request.get("command") == "trees":
+            return {"ok": True, "trees": [
+                {"tree": tree.json_file_path, "root_path": tree.root_path, "fingerprint": tree.fingerprint}
+                for tree in self.trees
+            ]}
+        try:
+            response = self.select_tree(request).query(request)
+        except (ValueError, TypeError, re.error) as e:
+            return {"ok": False, "error": str(e)}
+        response["ok"] = True
+        return response
+
+
+class UnixSocketHandler(socketserver.StreamRequestHandler):
+    # One JSON request per line, answered with one JSON line; a connection may send several
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                response = {"ok": False, "error": f"Could not decode request. Details: {e}"}
+            else:
+                response = self.server.service.handle(request)
+            self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128  # The default of 5 refuses bursts of concurrent clients
+
+
+class QueryHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+
+class HttpHandler(BaseHTTPRequestHandler):
+    # POST /search with a JSON request body, GET /trees for the loaded trees
+    def do_GET(self):
+        if self.path.rstrip('/') != "/trees":
+            self.send_json(404, {"ok": False, "error": f"Unknown path {self.path}"})
+            return
+        self.send_json(200, self.server.service.handle({"command": "trees"}))
+
+    def do_POST(self):
+        if self.path.rstrip('/') != "/search":
+            self.send_json(404, {"ok": False, "error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError) as e:
+            self.send_json(400, {"ok": False, "error": f"Could not decode request. Details: {e}"})
+            return
+        response = self.server.service.handle(request)
+        self.send_json(200 if response["ok"] else 400, response)
+
+    def send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(service: TreeQueryService, socket_path: Optional[str] = None, host: str = "127.0.0.1",
+                  port: Optional[int] = None):
+    """A Unix socket server when socket_path is given, otherwise an HTTP server on host:port."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # Left behind by a previous run
+        server = ThreadingUnixServer(socket_path, UnixSocketHandler)
+    else:
+        server = QueryHTTPServer((host, port or 8765), HttpHandler)
+    server.service = service
+    return server
+
+
+def send_query(request: dict, socket_path: Optional[str] = None, host: str = "127.0.0.1",
+               port: Optional[int] = None, timeout: float = 60.0) -> dict:
+    if socket_path:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall(json.dumps(request).encode('utf-8') + b"\n")
+            with client.makefile('rb') as reader:
+                line = reader.readline()
+        if not line:
+            return {"ok": False, "error": "Server closed the connection"}
+        return json.loads(line)
+
+    import http.client
+    connection = http.client.HTTPConnection(host, port or 8765, timeout=timeout)
+    try:
+        if request.get("command") == "trees":
+            connection.request('GET', '/trees')
+        else:
+            connection.request('POST', '/search', body=json.dumps(request),
+                               headers={'Content-Type': 'application/json'})
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep tree.json files loaded and answer searches over a local socket.")
+    subcommands = parser.add_subparsers(dest="mode", required=True)
+
+    serve_parser = subcommands.add_parser("serve", help="Load the trees and answer requests until interrupted")
+    serve_parser.add_argument("json_files", nargs='+')
+    serve_parser.add_argument("--reload-interval", type=float, default=2.0,
+                              help="Seconds between checks for changed tree files, 0 disables reloading")
+    serve_parser.add_argument("--no-name-index", action="store_true")
+
+    query_parser = subcommands.add_parser("query", help="Send one search and print the results")
+    query_parser.add_argument("regex_pattern", nargs='?')
+    query_parser.add_argument("--glob", dest="glob_patterns", action="append",
+                              help="Wildcard pattern, may be repeated and combined with regex_pattern")
+    query_parser.add_argument("--search-path")
+    query_parser.add_argument("--tree")
+    query_parser.add_argument("--search-for", choices=['files', 'directories', 'both'], default="files")
+    query_parser.add_argument("--max-depth", type=int)
+    query_parser.add_argument("--ignore-case", action="store_true")
+    query_parser.add_argument("--file-size-filter", type=int)
+    query_parser.add_argument("--min-size")
+    query_parser.add_argument("--max-size")
+
+    for subparser in (serve_parser, query_parser):
+        subparser.add_argument("--socket", dest="socket_path", help="Unix socket path; HTTP is used without it")
+        subparser.add_argument("--host", default="127.0.0.1")
+        subparser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        service = TreeQueryService(args.json_files, args.reload_interval, not args.no_name_index)
+        service.start()
+        server = create_server(service, args.socket_path, args.host, args.port)
+        print(f"Serving {len(service.trees)} tree(s) on {args.socket_path or f'http://{args.host}:{args.port}'}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.stop()
+            server.server_close()
+            if args.socket_path and os.path.exists(args.socket_path):
+                os.remove(args.socket_path)
+        return
+
+    request = {
+        "regex_pattern": args.regex_pattern,
+        "glob_patterns": args.glob_patterns,
+        "search_path": args.search_path,
+        "tree": args.tree,
+        "search_for": args.search_for,
+        "max_depth": args.max_depth,
+        "flags": re.IGNORECASE if args.ignore_case else 0,
+        "file_size_filter": args.file_size_filter,
+        "min_size": args.min_size,
+        "max_size": args.max_size,
+    }
+    try:
+        response = send_query(request, args.socket_path, args.host, args.port)
+    except OSError as e:
+        print(f"Error: Could not reach the tree query server. Details: {e}")
+        return
+    if not response.get("ok"):
+        print(f"Error: {response.get('error')}")
+        return
+    print_results(response["search_for"], response["matching_files"], response["matching_directories"])
+
+
+if __name__ == "__main__":
+    main()
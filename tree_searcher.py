@@ -2,9 +2,11 @@ import re
 import os
 import json
 
+from tree_index import load_or_build_path_index
+
 class TreeSearcher:
 
-    def __init__(self, json_file_path, search_path, regex_pattern, search_for="files", file_size_filter=None):
+    def __init__(self, json_file_path, search_path, regex_pattern, search_for="files", file_size_filter=None, use_path_index=True):
         """
         Initialize the TreeSearcher class with necessary parameters.
 
@@ -13,12 +15,15 @@ class TreeSearcher:
         :param regex_pattern: Regular expression pattern for searching files or directories
         :param search_for: Can be 'files', 'directories', or 'both'
         :param file_size_filter: Optional size filter (e.g., '500KB') for filtering files by size
+        :param use_path_index: Resolve search_path through the sidecar path index instead of a full DFS
         """
         self.json_file_path = json_file_path
         self.search_path = search_path
         self.regex_pattern = re.compile(regex_pattern)
         self.search_for = search_for
         self.file_size_filter = file_size_filter  # Optional size filter
+        self.use_path_index = use_path_index
+        self.path_index = None
         self.matching_files = []
         self.matching_directories = []
         self.json_data = self.load_json()
@@ -50,6 +55,16 @@ class TreeSearcher:
                         return result
         return None
 
+    def lookup_node(self, devices_node, search_path):
+        """Find the node for search_path via the path index, falling back to a recursive search."""
+        if self.use_path_index:
+            if self.path_index is None:
+                self.path_index = load_or_build_path_index(self.json_file_path, devices_node)
+            node = self.path_index.find(devices_node, search_path)
+            if node is not None or search_path not in self.path_index.entries:
+                return node
+        return self.find_node_by_absolute_path(devices_node, search_path)
+
     def search_files_recursively(self, node):
         """Recursively search for files and/or directories matching the regex pattern."""
         if 'files' in node:
@@ -78,7 +93,7 @@ class TreeSearcher:
             return
 
         devices_node = self.json_data["devices"]
-        root = self.find_node_by_absolute_path(devices_node, self.search_path)
+        root = self.lookup_node(devices_node, self.search_path)
 
         if root:
             self.search_files_recursively(root)
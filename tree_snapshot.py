@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import mmap
+import struct
+import argparse
+from array import array
+from typing import Optional
+
+from compact_tree import CompactTree, NameTable, SizeStringColumn
+
+
+SNAPSHOT_MAGIC = b"TREESNP1"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct('<8sQ')  # magic, metadata length
+_ALIGNMENT = 8
+
+
+def is_snapshot(file_path: str) -> bool:
+    try:
+        with open(file_path, 'rb') as file:
+            return file.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+    except OSError:
+        return False
+
+
+def _raw_size_columns(tree: CompactTree) -> tuple:
+    # Interned size strings that format_size() cannot reproduce, plus an id column (-1 for none)
+    if isinstance(tree.raw_sizes, SizeStringColumn):
+        return tree.raw_sizes.strings, tree.raw_sizes.ids
+    strings = NameTable()
+    string_ids = {}
+    ids = array('i', [-1]) * len(tree)
+    for entry, raw in tree.raw_sizes.items():
+        string_id = string_ids.get(raw)
+        if string_id is None:
+            string_id = string_ids[raw] = len(strings)
+            strings.append(raw)
+        ids[entry] = string_id
+    return strings, ids
+
+
+def save_snapshot(tree: CompactTree, snapshot_file: str):
+    """
+    Layout: magic and metadata length, the metadata as JSON (root path, byte order, path
+    overrides and where each column starts), then every column 8-byte aligned so it can be
+    cast straight out of an mmap.
+    """
+    raw_strings, raw_ids = _raw_size_columns(tree)
+    buffers = tree.column_buffers() + [('raw_size_blob', 'B', raw_strings.blob),
+                                       ('raw_size_offsets', 'q', raw_strings.offsets),
+                                       ('raw_size_ids', 'i', raw_ids)]
+    columns = []
+    offset = 0
+    for key, typecode, buffer in buffers:
+        size = len(buffer) * array(typecode).itemsize
+        columns.append([key, typecode, offset, size])
+        offset += (size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+    def metadata_bytes(data_start: int) -> bytes:
+        metadata = {
+            "version": SNAPSHOT_VERSION,
+            "byteorder": sys.byteorder,
+            "itemsizes": {typecode: array(typecode).itemsize for typecode in 'biq'},
+            "root_path": tree.root_path,
+            "entries": len(tree),
+            "path_overrides": {str(entry): path for entry, path in tree.path_overrides.items()},
+            "columns": [[key, typecode, data_start + start, size] for key, typecode, start, size in columns],
+        }
+        return json.dumps(metadata).encode('utf-8')
+
+    # The metadata holds absolute offsets, which depend on its own length: size it with
+    # oversized offsets first, then pad the real metadata to that length
+    longest = len(metadata_bytes(10 ** 15))
+    data_start = (_HEADER.size + longest + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+    metadata = metadata_bytes(data_start).ljust(data_start - _HEADER.size)
+
+    temp_file = f"{snapshot_file}.{os.getpid()}.tmp"
+    with open(temp_file, 'wb') as file:
+        file.write(_HEADER.pack(SNAPSHOT_MAGIC, len(metadata)))
+        file.write(metadata)
+        for (key, typecode, start, size), (_, _, buffer) in zip(columns, buffers):
+            file.seek(data_start + start)
+            file.write(memoryview(buffer).cast('B'))
+        file.truncate(data_start + offset)
+    os.replace(temp_file, snapshot_file)
+
+
+def open_snapshot(snapshot_file: str) -> CompactTree:
+    """
+    Map a snapshot and wrap its columns in a CompactTree without copying or parsing them.
+    The mapping stays open for as long as the tree (its memoryviews) is referenced.
+    """
+    with open(snapshot_file, 'rb') as file:
+        header = file.read(_HEADER.size)
+        magic, metadata_length = _HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{snapshot_file} is not a tree snapshot")
+        metadata = json.loads(file.read(metadata_length))
+        if metadata.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {metadata.get('version')}")
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    for typecode, itemsize in metadata["itemsizes"].items():
+        if array(typecode).itemsize != itemsize:
+            raise ValueError(f"Snapshot was written with {itemsize}-byte '{typecode}' columns")
+    swap = metadata["byteorder"] != sys.byteorder
+    view = memoryview(mapped)
+    buffers = {}
+    for key, typecode, start, size in metadata["columns"]:
+        column = view[start:start + size]
+        if typecode == 'B':
+            buffers[key] = column
+        elif not swap:
+            buffers[key] = column.cast(typecode)
+        else:
+            # Written on a machine with the other byte order: fall back to a converted copy
+            converted = array(typecode)
+            converted.frombytes(column)
+            converted.byteswap()
+            buffers[key] = converted
+
+    raw_sizes = SizeStringColumn(buffers.pop('raw_size_ids'),
+                                 NameTable(buffers.pop('raw_size_blob'), buffers.pop('raw_size_offsets')))
+    path_overrides = {int(entry): path for entry, path in metadata["path_overrides"].items()}
+    return CompactTree.from_buffers(metadata["root_path"], buffers, path_overrides, raw_sizes)
+
+
+def json_to_snapshot(json_file_path: str, snapshot_file: str) -> Optional[CompactTree]:
+    try:
+        with open(json_file_path, 'r') as file:
+            data = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error: Could not load {json_file_path}. Details: {e}")
+        return None
+    if "devices" not in data:
+        print("Error: 'devices' node not found in the JSON.")
+        return None
+    tree = CompactTree.from_json(data["devices"])
+    del data
+    save_snapshot(tree, snapshot_file)
+    return tree
+
+
+def snapshot_to_json(snapshot_file: str, json_file_path: str, indent: Optional[int] = 2) -> bool:
+    try:
+        tree = open_snapshot(snapshot_file)
+        with open(json_file_path, 'w') as file:
+            json.dump({"devices": tree.to_json()}, file, indent=indent)
+        return True
+    except (OSError, ValueError) as e:
+        print(f"Error: Could not convert {snapshot_file}. Details: {e}")
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert path_tree.json files to and from binary snapshots.")
+    parser.add_argument("mode", choices=['import', 'export'], help="import: JSON to snapshot, export: snapshot to JSON")
+    parser.add_argument("source")
+    parser.add_argument("target")
+    args = parser.parse_args()
+    if args.mode == 'import':
+        if json_to_snapshot(args.source, args.target) is not None:
+            print(f"Snapshot saved to {args.target}")
+    elif snapshot_to_json(args.source, args.target):
+        print(f"JSON saved to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import re
+import json
+from typing import Optional, Iterator
+
+
+_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_STRUCTURAL = re.compile(r'[{}\[\]"]')
+_SCALAR = re.compile(r'[^,:{}\[\]\s]*')
+_WHITESPACE = re.compile(r'[ \t\r\n]*')
+
+
+class _JsonStreamReader:
+    """
+    Minimal pull reader over a JSON text file. Values can be skipped without building
+    Python objects; only values passed through read_value() are materialized.
+    """
+
+    def __init__(self, file, chunk_size: int = 1 << 20):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.capture_from = None
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop consumed text so memory stays bounded, unless a value is being captured
+        keep = self.pos if self.capture_from is None else self.capture_from
+        self.buffer = self.buffer[keep:] + chunk
+        self.pos -= keep
+        if self.capture_from is not None:
+            self.capture_from -= keep
+        return True
+
+    def peek(self) -> Optional[str]:
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found {found!r}")
+        self.pos += 1
+
+    def _skip_string(self):
+        # self.pos is on the opening quote
+        while True:
+            match = _STRING_TAIL.match(self.buffer, self.pos + 1)
+            if match:
+                self.pos = match.end()
+                return
+            if not self._fill():
+                raise ValueError("Unterminated string")
+
+    def read_string(self) -> str:
+        if self.peek() != '"':
+            raise ValueError("Expected a string")
+        return self.read_value()
+
+    def skip_value(self):
+        char = self.peek()
+        if char is None:
+            raise ValueError("Unexpected end of data")
+        if char == '"':
+            self._skip_string()
+            return
+        if char not in '{[':
+            while True:
+                match = _SCALAR.match(self.buffer, self.pos)
+                if match.end() < len(self.buffer) or not self._fill():
+                    self.pos = match.end()
+                    return
+
+        depth = 0
+        while True:
+            match = _STRUCTURAL.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                if not self._fill():
+                    raise ValueError("Unexpected end of data")
+                continue
+            self.pos = match.start()
+            token = match.group()
+            if token == '"':
+                self._skip_string()
+                continue
+            self.pos += 1
+            depth += 1 if token in '{[' else -1
+            if depth == 0:
+                return
+
+    def read_value(self):
+        self.peek()
+        self.capture_from = self.pos
+        self.skip_value()
+        text = self.buffer[self.capture_from:self.pos]
+        self.capture_from = None
+        return json.loads(text)
+
+    def iter_object_keys(self) -> Iterator[str]:
+        """Yield the keys of the object whose '{' was just consumed; the caller consumes each value."""
+        first = True
+        while True:
+            char = self.peek()
+            if char == '}':
+                self.pos += 1
+                return
+            if not first:
+                self.expect(',')
+            first = False
+            key = self.read_string()
+            self.expect(':')
+            yield key
+
+
+def _is_ancestor(absolute_path: str, search_path: str) -> bool:
+    if not search_path.startswith(absolute_path):
+        return False
+    if absolute_path.endswith(('\\', '/')):
+        return True
+    return search_path[len(absolute_path):len(absolute_path) + 1] in ('\\', '/')
+
+
+def _find_in_node(node, search_path: str) -> Optional[dict]:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if node.get('absolute_path') == search_path:
+            return node
+        children = [node.get(directory[0]) for directory in node.get('directories', [])]
+        stack.extend(reversed(children))
+    return None
+
+
+def _descend(reader: _JsonStreamReader, search_path: str, prune: bool) -> Optional[dict]:
+    if reader.peek() != '{':
+        reader.skip_value()
+        return None
+    reader.expect('{')
+    keys = reader.iter_object_keys()
+    first_key = next(keys, None)
+    if first_key is None:
+        return None
+
+    if first_key != 'absolute_path':
+        # Unusual key order: the path is not known up front, so materialize this node
+        node = {first_key: reader.read_value()}
+        for key in keys:
+            node[key] = reader.read_value()
+        return _find_in_node(node, search_path)
+
+    absolute_path = reader.read_value()
+    if absolute_path == search_path:
+        node = {'absolute_path': absolute_path}
+        for key in keys:
+            node[key] = reader.read_value()
+        return node
+
+    if prune and not _is_ancestor(absolute_path, search_path):
+        for _ in keys:
+            reader.skip_value()
+        return None
+
+    for key in keys:
+        if key in ('directories', 'files'):
+            reader.skip_value()
+            continue
+        result = _descend(reader, search_path, prune)
+        if result is not None:
+            # Stop reading: nothing after the target subtree is needed
+            return result
+    return None
+
+
+def _stream_pass(json_file_path: str, search_path: str, root_key: str, chunk_size: int,
+                 prune: bool) -> Optional[dict]:
+    with open(json_file_path, 'r') as file:
+        reader = _JsonStreamReader(file, chunk_size=chunk_size)
+        reader.expect('{')
+        for key in reader.iter_object_keys():
+            if key == root_key:
+                return _descend(reader, search_path, prune)
+            reader.skip_value()
+    return None
+
+
+def load_subtree(json_file_path: str, search_path: str, root_key: str = "devices",
+                 chunk_size: int = 1 << 20) -> Optional[dict]:
+    """
+    Stream through a tree.json file and build only the node whose absolute_path equals
+    search_path. Sibling subtrees are scanned and skipped without being parsed, and
+    reading stops as soon as the target subtree is complete.
+
+    Subtrees are skipped when their absolute_path is not a prefix of search_path. Trees
+    whose paths do not nest that way are still handled by a second, unpruned pass.
+
+    Raises ValueError on malformed JSON; returns None if the path is not in the tree.
+    """
+    subtree = _stream_pass(json_file_path, search_path, root_key, chunk_size, prune=True)
+    if subtree is None:
+        subtree = _stream_pass(json_file_path, search_path, root_key, chunk_size, prune=False)
+    return subtree
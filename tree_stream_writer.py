@@ -0,0 +1,161 @@
+import os
+import json
+from typing import Optional
+
+from path_tree_with_os import RESERVED_NAMES
+from size_utils import format_size, format_size_human
+
+
+# Bytes reserved for each directory size; patched sizes are padded with spaces after the closing quote
+SIZE_FIELD_WIDTH = 24
+PLACEHOLDER = b'""' + b' ' * (SIZE_FIELD_WIDTH - 2)
+
+
+class _Frame:
+    # One open directory node: its sub-directories still to write and where their sizes go
+    __slots__ = ('path', 'depth', 'subdirectories', 'next', 'placeholders', 'total', 'index')
+
+    def __init__(self, path: str, depth: int, subdirectories: list, placeholders: list, total: int, index: int):
+        self.path = path
+        self.depth = depth
+        self.subdirectories = subdirectories
+        self.next = 0
+        self.placeholders = placeholders  # file offsets of the sub-directories' size fields
+        self.total = total
+        self.index = index  # position in the parent's 'directories' listing
+
+
+class StreamingTreeWriter:
+    """
+    Writes the path_tree.json structure for a directory while walking it depth-first, so
+    nothing but the chain of open directories is kept in memory. A directory's size is only
+    known after its subtree has been written, so its listing entry gets a fixed-width blank
+    size field that is patched in place afterwards (the padding becomes whitespace outside
+    the string, which keeps the JSON valid). Patches are applied in batches to limit seeks.
+    Listings are sorted by name and symbolic links are listed as files, as in PathTreeCrawler;
+    sub-directories named like a node key are skipped and reported in errors, as there too.
+    """
+
+    def __init__(self, output_file: str, exact_sizes: bool = False, indent: Optional[int] = 2,
+                 patch_batch: int = 4096):
+        self.output_file = output_file
+        self.format_size = format_size if exact_sizes else format_size_human
+        self.indent = indent
+        self.patch_batch = patch_batch
+        self.errors = []
+        self.out = None
+        self.patches = []
+
+    def _newline(self, depth: int) -> bytes:
+        return b'\n' + b' ' * (self.indent * depth) if self.indent is not None else b''
+
+    def _separator(self) -> bytes:
+        return b' ' if self.indent is not None else b''
+
+    def _scan(self, path: str) -> tuple:
+        subdirectories = []
+        files = []
+        try:
+            with os.scandir(path) as entries:
+                items = sorted(entries, key=lambda entry: entry.name)
+            for entry in items:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name in RESERVED_NAMES:
+                            self.errors.append((entry.path, "directory name collides with a tree node key"))
+                            print(f"Error: Skipping directory {entry.path}; its name collides with a tree node key.")
+                        else:
+                            subdirectories.append(entry.name)
+                    else:
+                        files.append((entry.name, entry.stat(follow_symlinks=False).st_size))
+                except OSError as e:
+                    self.errors.append((entry.path, str(e)))
+                    print(f"Error: Could not stat {entry.path}. Details: {e}")
+        except OSError as e:
+            self.errors.append((path, str(e)))
+            print(f"Error: Could not list {path}. Details: {e}")
+        return subdirectories, files
+
+    def _open_node(self, key: str, path: str, depth: int, index: int) -> _Frame:
+        # Writes '"key": {' and the node's listings; the closing brace comes after its children
+        out = self.out
+        dumps = json.dumps
+        sep = self._separator()
+        subdirectories, files = self._scan(path)
+
+        out.write(dumps(key).encode('ascii') + b':' + sep + b'{')
+        out.write(self._newline(depth + 1) + b'"absolute_path":' + sep + dumps(path).encode('ascii') + b',')
+        out.write(self._newline(depth + 1) + b'"directories":' + sep + b'[')
+        placeholders = []
+        for i, name in enumerate(subdirectories):
+            out.write((b',' if i else b'') + self._newline(depth + 2) + b'[' + dumps(name).encode('ascii') + b',' + sep)
+            placeholders.append(out.tell())
+            out.write(PLACEHOLDER + b']')
+        out.write((self._newline(depth + 1) if subdirectories else b'') + b'],')
+        out.write(self._newline(depth + 1) + b'"files":' + sep + b'[')
+        total = 0
+        for i, (name, size) in enumerate(files):
+            out.write((b',' if i else b'') + self._newline(depth + 2) + b'['
+                      + dumps(name).encode('ascii') + b',' + sep + dumps(self.format_size(size)).encode('ascii') + b']')
+            total += size
+        out.write((self._newline(depth + 1) if files else b'') + b']')
+        return _Frame(path, depth, subdirectories, placeholders, total, index)
+
+    def _patch(self, offset: int, size: int):
+        value = json.dumps(self.format_size(size)).encode('ascii')
+        if len(value) > SIZE_FIELD_WIDTH:
+            raise ValueError(f"Size {value!r} does not fit the reserved field")
+        self.patches.append((offset, value.ljust(SIZE_FIELD_WIDTH)))
+        if len(self.patches) >= self.patch_batch:
+            self._apply_patches()
+
+    def _apply_patches(self):
+        out = self.out
+        end = out.tell()
+        for offset, value in sorted(self.patches):
+            out.seek(offset)
+            out.write(value)
+        out.seek(end)
+        self.patches = []
+
+    def write(self, folder_path: str) -> int:
+        """Write the tree for folder_path and return its total size in bytes."""
+        folder_path = os.path.abspath(folder_path)
+        base_name = os.path.basename(folder_path.rstrip(os.sep)) or folder_path
+        self.errors = []
+        self.patches = []
+        with open(self.output_file, 'w+b', buffering=1 << 20) as out:
+            self.out = out
+            out.write(b'{' + self._newline(1))
+            stack = [self._open_node(base_name, folder_path, 1, -1)]
+            total = 0
+            while stack:
+                frame = stack[-1]
+                if frame.next < len(frame.subdirectories):
+                    name = frame.subdirectories[frame.next]
+                    frame.next += 1
+                    out.write(b',' + self._newline(frame.depth + 1))
+                    stack.append(self._open_node(name, os.path.join(frame.path, name), frame.depth + 1, frame.next - 1))
+                    continue
+                out.write(self._newline(frame.depth) + b'}')
+                stack.pop()
+                if stack:
+                    parent = stack[-1]
+                    parent.total += frame.total
+                    self._patch(parent.placeholders[frame.index], frame.total)
+                else:
+                    total = frame.total
+            out.write(self._newline(0) + b'}\n')
+            self._apply_patches()
+            self.out = None
+        return total
+
+
+def stream_path_tree(folder_path: str, output_file: str = "path_tree.json", exact_sizes: bool = False,
+                     indent: Optional[int] = 2) -> bool:
+    try:
+        StreamingTreeWriter(output_file, exact_sizes, indent).write(folder_path)
+        return True
+    except (IOError, ValueError) as e:
+        print(f"Error saving path tree to {output_file}. Details: {e}")
+        return False